@@ -2,4 +2,5 @@
 CANDIDATE_MODEL =  "deepseek-r1-distill-llama-70b" #"meta-llama/llama-4-maverick-17b-128e-instruct"#
 VALIDATION_MODEL = "meta-llama/llama-4-maverick-17b-128e-instruct"#"meta-llama/llama-4-scout-17b-16e-instruct"
 MAX_REVISIONS = 1
+MAX_QUERY_COST = 1e9 # estimated row visits above which a candidate query is rejected before running
 DB_PATH = "datasets/train/train_databases/movie_platform/movie_platform.sqlite"
\ No newline at end of file
@@ -38,6 +38,7 @@ class MainAppWindow(QMainWindow):
 
         # Connect signals
         self.main_content.text_input.query_executed.connect(self.sidebar.add_query_result)
+        self.main_content.text_input.query_replaced.connect(self.sidebar.replace_query_result)
         self.sidebar.result_clicked.connect(self.main_content.load_result_from_file)
         self.main_content.new_question.connect(self.sidebar.clear_checked)
 
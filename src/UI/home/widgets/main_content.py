@@ -1,18 +1,52 @@
-import json
 import os
-import csv
+import threading
 
 from UI.home.widgets.textbox import TextBox
 from UI.home.widgets.plot_widget import PlotWidget
+from plotter.Plotter import read_manifest
+from history_store import ResultStore
+from UI.home.widgets.result_table_model import ResultTableModel
+from export_service import export_query, export_format, ExportCancelled
 
 from PyQt6.QtWidgets import (
     QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QFrame, QFileDialog, QWidget, QScrollArea,
-    QDialog, QTableWidget, QTableWidgetItem, QAbstractItemView, QApplication, QLineEdit, QMessageBox
+    QDialog, QTableView, QAbstractItemView, QApplication, QLineEdit, QMessageBox, QProgressDialog
 )                         
-from PyQt6.QtCore import Qt, pyqtSignal, QSize
+from PyQt6.QtCore import Qt, pyqtSignal, QSize, QObject, QThread
 from PyQt6.QtGui import QIcon
 
 
+class ExportWorker(QObject):
+    """
+    Worker class to export a result on different thread than UI, re-running its SQL on a read-only connection
+    Args:
+        db_manager (DBManager): Manager for current database
+        sql (str): query of the result
+        path (str): file to write, its extension picks the format
+    """
+    finished = pyqtSignal()             # To signal that the export ended, done or not
+    error = pyqtSignal(str)             # To signal that the export failed, emits(message)
+    progress = pyqtSignal(int)          # To signal progress, emits(rows written)
+
+    def __init__(self, db_manager, sql, path):
+        super().__init__()
+        self.db_manager = db_manager
+        self.sql = sql
+        self.path = path
+        self.cancel = threading.Event()
+        self.rows = 0
+
+    def run(self):
+        try:
+            self.rows = export_query(self.db_manager.read_pool, self.sql, self.path,
+                                     progress=self.progress.emit, cancel=self.cancel)
+        except ExportCancelled:
+            pass
+        except Exception as e:
+            self.error.emit(str(e))
+        self.finished.emit()
+
+
 class MainContent(QFrame):
     """Main content area of the main window"""
     new_question = pyqtSignal()
@@ -21,6 +55,7 @@ class MainContent(QFrame):
         super().__init__(parent)
         self.db_manager = db_manager
         self.initial = initial
+        self.result_store = None
         self.init_ui()
         self.update_ui(initial)
         
@@ -188,6 +223,23 @@ class MainContent(QFrame):
         self.results_layout.addWidget(self.results_label)
         self.results_layout.addStretch()
 
+        # Filter over the values of the result
+        self.results_filter = QLineEdit()
+        self.results_filter.setPlaceholderText("تصفية النتائج")
+        self.results_filter.setClearButtonEnabled(True)
+        self.results_filter.setFixedWidth(220)
+        self.results_filter.setStyleSheet("""
+            QLineEdit {
+                border: 1px solid #CBD5E1;
+                border-radius: 6px;
+                padding: 8px;
+                font-size: 12px;
+            }
+        """)
+        self.results_filter.returnPressed.connect(self.on_filter_results)
+        self.results_filter.textChanged.connect(lambda text: text or self.on_filter_results())
+        self.results_layout.addWidget(self.results_filter)
+
         # Export to CSV button
         self.export_button = QPushButton(icon=QIcon('src/UI/assets/download.png'))
         self.export_button.setStyleSheet("""
@@ -205,13 +257,15 @@ class MainContent(QFrame):
                 background-color: #374151;
             }
         """)
-        self.export_button.clicked.connect(self.export_to_csv)
+        self.export_button.clicked.connect(self.export_results)
         self.results_layout.addWidget(self.export_button)
         self.main_layout.addLayout(self.results_layout)
 
-        # Data table
-        self.results_area = QTableWidget()
+        # Data table, rows are read from the stored result as they are scrolled to
+        self.results_area = QTableView()
         self.results_area.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.results_area.setSortingEnabled(True)
+        self.results_area.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
         self.main_layout.addWidget(self.results_area)
         self.main_layout.addStretch()
         
@@ -230,6 +284,7 @@ class MainContent(QFrame):
             self.plots_empty.hide()
 
             self.results_area.hide()
+            self.results_filter.hide()
             self.results_label.hide()
             self.export_button.hide()
 
@@ -244,7 +299,8 @@ class MainContent(QFrame):
             self.text_input.execute_button.show()
             self.text_input.text_edit.setReadOnly(False)
 
-            self.results_area.clear()
+            self.results_area.setModel(None)
+            self.results_filter.clear()
             self.text_input.text_edit.clear()
         else:
             self.main_layout.removeItem(self.main_layout.itemAt(0))
@@ -253,6 +309,7 @@ class MainContent(QFrame):
             self.plots_label.show()
 
             self.results_area.show()
+            self.results_filter.show()
             self.results_label.show()
             self.export_button.show()
 
@@ -362,14 +419,17 @@ class MainContent(QFrame):
             self.update_ui(self.initial)
             return
 
+        # Open the result, only the visible rows are read
+        if self.result_store is not None:
+            self.result_store.close()
+        self.result_store = ResultStore(folder_path)
+        result = self.result_store.meta
+
         has_plots = False
         for f in os.listdir(folder_path):
             path = os.path.join(folder_path, f)
 
-            if os.path.isfile(path): # Load results
-                with open(path, 'r', encoding='utf-8') as f:
-                    result = json.load(f)
-            else: # Load plots
+            if os.path.isdir(path): # Load plots
                 while self.plots_layout.count():
                     item = self.plots_layout.takeAt(0)
                     widget = item.widget()
@@ -377,7 +437,13 @@ class MainContent(QFrame):
                         widget.deleteLater()
                 self.plots_layout.addStretch()
 
-                for plot in os.listdir(path):
+                # the manifest lists the plots in priority order, older results only have images
+                manifest = read_manifest(path)
+                if manifest is not None:
+                    plots = [entry["file"] for entry in manifest["plots"]]
+                else:
+                    plots = sorted(p for p in os.listdir(path) if p.endswith(".png"))
+                for plot in plots:
                     plot_path = os.path.join(path, plot)
                     plot_widget = PlotWidget(plot_path, QSize(150, 150))
                     plot_widget.setStyleSheet("""
@@ -401,15 +467,12 @@ class MainContent(QFrame):
             self.update_ui(self.initial)
         
         # Display the loaded result
-        self.columns = result['columns']
-        self.rows = result['rows']
-        self.results_area.setColumnCount(len(self.columns))
-        self.results_area.setHorizontalHeaderLabels(self.columns)
-        row_count = min(len(self.rows), 100)
-        self.results_area.setRowCount(row_count)
-        for i, row in enumerate(self.rows[:row_count]):
-            for j, value in enumerate(row):
-                self.results_area.setItem(i, j, QTableWidgetItem("NULL" if value is None else str(value)))
+        self.columns = self.result_store.columns
+        self.results_filter.blockSignals(True)
+        self.results_filter.clear()
+        self.results_filter.blockSignals(False)
+        self.results_area.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.results_area.setModel(ResultTableModel(self.result_store, self.results_area))
 
         # load the question back into the editor
         self.text_input.text_edit.setText(result['query_text'])
@@ -417,27 +480,68 @@ class MainContent(QFrame):
         # load SQL Code
         self.sql_code = result['query_sql']
         
+    def on_filter_results(self):
+        """Filters the shown result on the text of the filter box"""
+        model = self.results_area.model()
+        if model is not None:
+            model.set_filter(self.results_filter.text().strip())
+
     def on_new_question_pressed(self):
         """Updates UI to the home page when pressed"""
         self.update_ui(initial=True)
         self.new_question.emit()
 
-    def export_to_csv(self):
-        """Exports current data loaded to a csv file"""
-        path, _ = QFileDialog.getSaveFileName(
+    def export_results(self):
+        """Exports the current result to a CSV, gzipped CSV or Parquet file on another thread"""
+        path, selected_filter = QFileDialog.getSaveFileName(
             self,
-            "Save CSV",
+            "Save Results",
             "results.csv",
-            "CSV files (*.csv);;All files (*)"
+            "CSV files (*.csv);;Gzipped CSV files (*.csv.gz);;Parquet files (*.parquet);;All files (*)"
         )
-
-        if path:
-            try:
-                with open(path, 'w', newline='', encoding='utf-8') as csv_file:
-                    writer = csv.writer(csv_file)
-                    writer.writerow(self.columns)  # Write header
-                    writer.writerows(self.rows)    # Write all data rows
-
-                QMessageBox.information(self, "Export Successful", f"Results saved to:\n{path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Export Failed", f"An error occurred:\n{e}")
+        if not path:
+            return
+        # the selected filter gives the format when the name has no known extension
+        if export_format(path) == "csv" and not path.lower().endswith(".csv"):
+            path += {"Gzipped": ".csv.gz", "Parquet": ".parquet"}.get(selected_filter.split(" ")[0], ".csv")
+
+        self.export_button.setEnabled(False)
+        total = self.result_store.row_count if self.result_store is not None else 0
+        self.export_dialog = QProgressDialog("جاري تصدير النتائج...", "إلغاء", 0, total, self)
+        self.export_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.export_dialog.setMinimumDuration(300)
+
+        # Run in another thread
+        self.export_thread = QThread()
+        self.export_worker = ExportWorker(self.db_manager, self.sql_code, path)
+        self.export_worker.moveToThread(self.export_thread)
+
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.error.connect(self.on_export_error)
+        self.export_dialog.canceled.connect(self.export_worker.cancel.set)
+        self.export_worker.finished.connect(self.export_thread.quit)
+        self.export_thread.finished.connect(self.on_export_finished)
+
+        self.export_failed = False
+        self.export_thread.start()
+
+    def on_export_progress(self, rows):
+        # the database may have changed since the result was saved, the stored row count is only an estimate
+        if rows > self.export_dialog.maximum():
+            self.export_dialog.setMaximum(rows)
+        self.export_dialog.setValue(rows)
+
+    def on_export_error(self, message):
+        self.export_failed = True
+        QMessageBox.critical(self, "Export Failed", f"An error occurred:\n{message}")
+
+    def on_export_finished(self):
+        worker = self.export_worker
+        cancelled = worker.cancel.is_set()   # closing the dialog emits canceled
+        self.export_dialog.close()
+        self.export_button.setEnabled(True)
+        if not self.export_failed and not cancelled:
+            QMessageBox.information(self, "Export Successful", f"{worker.rows} rows saved to:\n{worker.path}")
+        worker.deleteLater()
+        self.export_thread.deleteLater()
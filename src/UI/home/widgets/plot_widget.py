@@ -1,13 +1,15 @@
-from PyQt6.QtWidgets import QLabel, QDialog, QVBoxLayout
+from PyQt6.QtWidgets import QLabel, QDialog, QVBoxLayout, QApplication, QMessageBox
 from PyQt6.QtGui import QPixmap, QMouseEvent
 from PyQt6.QtCore import Qt, QSize
 import os
 
+from plotter.Plotter import render_full_size
+
 class PlotWidget(QLabel):
     """
-    Widget for displaying a given plot
+    Widget for displaying a given plot, the full-size image is rendered when the plot is opened
     Args:
-        image_path (str): path to plot image
+        image_path (str): path to plot image (thumbnail)
         max_size (QSize): Maximum size of plot image
     """
     def __init__(self, image_path: str, max_size: QSize = QSize(200, 150), parent=None):
@@ -34,6 +36,24 @@ class PlotWidget(QLabel):
 
     def open_image_dialog(self):
         """Open full-size image in a popup window"""
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            image_path = render_full_size(self.image_path)
+        except Exception:
+            image_path = None
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        if image_path is None:
+            # Fall back to the thumbnail
+            QMessageBox.warning(
+                self,
+                "تنبيه",
+                "تعذر رسم الصورة بالحجم الكامل، سيتم عرض الصورة المصغرة",
+                QMessageBox.StandardButton.Ok
+            )
+            image_path = self.image_path
+
         dialog = QDialog()
         dialog.setWindowTitle("Image Viewer")
         dialog.setMinimumSize(800, 600)
@@ -43,7 +63,7 @@ class PlotWidget(QLabel):
 
         label = QLabel()
         label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        pixmap = QPixmap(self.image_path)
+        pixmap = QPixmap(image_path)
 
         # Scale to fit
         label.setPixmap(pixmap.scaled(dialog.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+from history_store import ResultStore
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+PAGE_ROWS = 200     # rows read from the result file at a time
+CACHED_PAGES = 20   # pages kept in memory, the least recently used are dropped
+
+
+class ResultTableModel(QAbstractTableModel):
+    """
+    Table model over a stored result, for a QTableView.
+    Rows are read from the result file a page at a time and only a few pages are kept in memory,
+    so any result size can be browsed with constant memory. The view grows with fetchMore as it is scrolled.
+    Sorting and filtering run in SQLite (ResultStore.set_view).
+
+    Args:
+        store (ResultStore): the stored result to show
+    """
+    def __init__(self, store: ResultStore, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.filter_text = ""
+        self.sort_column = None
+        self.descending = False
+        self.total = store.set_view()
+        self.loaded = min(PAGE_ROWS, self.total)
+        self.pages = OrderedDict()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store.columns)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(PAGE_ROWS, self.total - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def _row(self, row: int):
+        page = row // PAGE_ROWS
+        if page in self.pages:
+            self.pages.move_to_end(page)
+        else:
+            self.pages[page] = self.store.read_rows(page * PAGE_ROWS, PAGE_ROWS)
+            if len(self.pages) > CACHED_PAGES:
+                self.pages.popitem(last=False)
+        rows = self.pages[page]
+        offset = row - page * PAGE_ROWS
+        return rows[offset] if offset < len(rows) else None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+        row = self._row(index.row())
+        if row is None:
+            return None
+        value = row[index.column()]
+        return "NULL" if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.store.columns[section] if section < len(self.store.columns) else None
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column = column if column >= 0 else None
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self._reload()
+
+    def set_filter(self, text: str):
+        """Shows only the rows where a value contains `text`"""
+        self.filter_text = text
+        self._reload()
+
+    def _reload(self):
+        self.beginResetModel()
+        self.total = self.store.set_view(self.sort_column, self.descending, self.filter_text)
+        self.loaded = min(PAGE_ROWS, self.total)
+        self.pages.clear()
+        self.endResetModel()
@@ -1,10 +1,35 @@
 from PyQt6.QtWidgets import (
     QWidget, QPushButton, QVBoxLayout, QLabel, QLineEdit, 
-    QScrollArea, QGroupBox, QHBoxLayout, QDialog
+    QScrollArea, QGroupBox, QHBoxLayout, QDialog, QProgressDialog, QMessageBox
 )
+from PyQt6.QtCore import Qt, QThread, QObject, pyqtSignal
 
 from pipeline.translator.Translator import translate
 
+class DescriptionWorker(QObject):
+    """
+    Worker class to translate and embed descriptions on different thread than UI
+    Args:
+        db_manager (DBManager): Manager for current database
+        descriptions (dict): {(table, column): description}
+    """
+    finished = pyqtSignal()             # To signal that the descriptions are embedded
+    error = pyqtSignal(str)             # To signal that translating or embedding failed, emits(message)
+    progress = pyqtSignal(int, int)     # To signal progress, emits(done, total)
+
+    def __init__(self, db_manager, descriptions):
+        super().__init__()
+        self.db_manager = db_manager
+        self.descriptions = descriptions
+
+    def run(self):
+        try:
+            self.db_manager.embedDescriptions(self.descriptions, translate=translate, progress=self.progress.emit)
+            self.db_manager.save()
+        except Exception as e:
+            self.error.emit(str(e))
+        self.finished.emit()
+
 class SchemaViewer(QDialog):
     """
     Window for editing database schema descriptions
@@ -70,6 +95,7 @@ class SchemaViewer(QDialog):
 
         # Save button
         save_btn = QPushButton("احفظ")
+        self.save_btn = save_btn
         save_btn.setStyleSheet("""
             QPushButton {
                 background-color: #6B7280;
@@ -92,13 +118,43 @@ class SchemaViewer(QDialog):
         layout.addWidget(save_btn)
 
     def save_descriptions(self):
-        """Saves all descriptions when save button is pressed"""
-        for (table, column), input_field in self.description_inputs.items():
-            desc = input_field.text()
-            self.schema_data[table][column] = desc
-            if desc == "":
-                continue
-            translated_desc = translate(desc)
-            self.db_manager.embedDescription(table, column, translated_desc)
-        self.db_manager.save()
-        self.accept()
+        """Saves all descriptions when save button is pressed, translating and embedding them on another thread"""
+        descriptions = {key: input_field.text() for key, input_field in self.description_inputs.items()}
+        self.save_btn.setEnabled(False)
+
+        self.progress_dialog = QProgressDialog("جاري حفظ الأوصاف...", None, 0, 1, self)
+        self.progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress_dialog.setMinimumDuration(300)
+
+        # Run in another thread
+        self.thread = QThread()
+        self.worker = DescriptionWorker(self.db_manager, descriptions)
+        self.worker.moveToThread(self.thread)
+
+        self.thread.started.connect(self.worker.run)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.error.connect(self.handleError)
+        self.worker.finished.connect(self.thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.finished.connect(self.on_saved)
+
+        self.failed = False
+        self.thread.start()
+
+    def on_progress(self, done, total):
+        self.progress_dialog.setMaximum(total)
+        self.progress_dialog.setValue(done)
+
+    def handleError(self, message):
+        """
+        Shows a pop up error indicating that the descriptions could not be saved
+        """
+        self.failed = True
+        QMessageBox.critical(self, "خطأ", f"تعذر حفظ الأوصاف: {message}", QMessageBox.StandardButton.Ok)
+
+    def on_saved(self):
+        self.progress_dialog.close()
+        self.save_btn.setEnabled(True)
+        if not self.failed:
+            self.accept()
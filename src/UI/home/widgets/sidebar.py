@@ -1,18 +1,74 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
 import pandas as pd
 import shutil
 
-from plotter.Plotter import DataVizTool
+from plotter.Plotter import DataVizTool, SQL_AGGREGATE_ROWS
+from history_store import ResultStore, HistoryCatalog
 from UI.home.widgets.result_button import ResultButton
 from UI.home.widgets.schema_viewer import SchemaViewer
 
-from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QFrame, QScrollArea, QMessageBox, QFileDialog                          
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QFrame, QScrollArea, QMessageBox, QFileDialog, QLineEdit
+from PyQt6.QtCore import Qt, pyqtSignal, QTimer, QObject
 from PyQt6.QtGui import QIcon
 
 
+HISTORY_PAGE = 50   # history buttons loaded at a time, more are loaded when scrolling down
+
+# results are saved one at a time, so a replacing result is always written after the one it replaces
+_save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save-result")
+
+
+def save_result(db_path, directory, query_id, query_text, query_sql, rows, columns, replace=False):
+    """
+    Makes the plots of a question result and saves it to its history folder.
+    Returns (result_info, plots_failed), raises if the result itself could not be saved.
+    """
+    if replace:
+        shutil.rmtree(f"{directory}/plots", ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    # large results are aggregated by SQLite around the query instead of being loaded into pandas
+    df = pd.DataFrame(rows, columns=columns) if len(rows) <= SQL_AGGREGATE_ROWS else None
+    plots_failed = False
+    try:
+        DataVizTool(df, f"{directory}/plots", db_path=db_path, query=query_sql)._run("Plot automatically")
+    except Exception:
+        plots_failed = True
+
+    # Save result data, metadata apart from the rows so listing the history never reads them
+    result_info = {
+        "query_id": query_id,
+        "query_text": query_text,
+        "timestamp": datetime.now().strftime("%H:%M:%S"),
+        "query_sql": query_sql,
+    }
+    ResultStore.write(directory, result_info, columns, rows).close()
+    result_info["row_count"] = len(rows)
+    return result_info, plots_failed
+
+
+class ResultSaver(QObject):
+    """
+    Saves question results on a background thread and signals the sidebar when each one is written
+    """
+    saved = pyqtSignal(int, object, bool, bool)   # emits(query_id, result_info or None if saving failed, plots_failed, replace)
+
+    def save(self, db_path, directory, query_id, query_text, query_sql, rows, columns, replace=False):
+        future = _save_executor.submit(save_result, db_path, directory, query_id, query_text, query_sql, rows, columns, replace)
+        future.add_done_callback(lambda f: self.on_done(f, query_id, replace))
+
+    def on_done(self, future, query_id, replace):
+        try:
+            result_info, plots_failed = future.result()
+        except Exception:
+            result_info, plots_failed = None, False
+        try:
+            self.saved.emit(query_id, result_info, plots_failed, replace)
+        except RuntimeError:
+            pass    # the sidebar was closed while saving
+
+
 class Sidebar(QFrame):
     """
     Dynamic sidebar to store history for current database
@@ -31,9 +87,14 @@ class Sidebar(QFrame):
         self.query_counter = query_counter
         self.db_manager = db_manager
         self.db_name = db_manager.db_name
-        self.results_directory = f"history/databases/{self.db_name}/query_results"  # Directory to store results
-        self.init_ui()
+        self.results_directory = f"{db_manager.history_dir}/query_results"  # Directory to store results
         self.create_results_directory()
+        self.catalog = HistoryCatalog(self.results_directory)
+        self.search_text = ""
+        self.loaded_count = 0   # history entries with a button, in the current search
+        self.saver = ResultSaver(self)
+        self.saver.saved.connect(self.on_result_saved)
+        self.init_ui()
         
     def create_results_directory(self):
         if not os.path.exists(self.results_directory):
@@ -67,6 +128,26 @@ class Sidebar(QFrame):
             }
         """)
         main_layout.addWidget(self.title_label)
+
+        # Search over the questions of the history
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("ابحث في الاسئلة")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setStyleSheet("""
+            QLineEdit {
+                background-color: white;
+                border: 1px solid #CBD5E1;
+                border-radius: 6px;
+                padding: 6px 8px;
+                font-size: 12px;
+            }
+        """)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.on_search)
+        self.search_input.textChanged.connect(lambda _: self.search_timer.start())
+        main_layout.addWidget(self.search_input)
         
         # Scrollable area for history buttons
         scroll_area = QScrollArea()
@@ -128,6 +209,9 @@ class Sidebar(QFrame):
         
         self.buttons_container.setLayout(self.buttons_layout)
         scroll_area.setWidget(self.buttons_container)
+        # load the next page of history when scrolled to the bottom
+        scroll_area.verticalScrollBar().valueChanged.connect(self.on_history_scrolled)
+        self.scroll_area = scroll_area
         
         main_layout.addWidget(scroll_area)
 
@@ -222,47 +306,43 @@ class Sidebar(QFrame):
         self.setLayout(main_layout)
     
     def add_query_result(self, query_text, query_sql, rows, columns):
-        """Add a new question result to the sidebar"""
+        """Add a new question result to the sidebar, once its plots and rows are saved"""
         self.query_counter += 1
+        self.save_query_result(self.query_counter, query_text, query_sql, rows, columns)
 
-        # Make plots
-        dir = self.results_directory + f"/{self.query_counter}"
-        if not os.path.exists(dir):
-            os.makedirs(dir)
-        df = pd.DataFrame(rows, columns=columns)
-        plotter = DataVizTool(df, f"{dir}/plots")
-        try:
-            plotter._run("Plot automatically")
-        except:
+    def replace_query_result(self, query_text, query_sql, rows, columns):
+        """Replace the latest question result when a better query wins after a provisional result"""
+        if self.query_counter == 0:
+            return self.add_query_result(query_text, query_sql, rows, columns)
+        self.save_query_result(self.query_counter, query_text, query_sql, rows, columns, replace=True)
+
+    def save_query_result(self, query_id, query_text, query_sql, rows, columns, replace=False):
+        """Make plots and save the result of a question to its history folder on a background thread"""
+        self.saver.save(self.db_manager.db_path, f"{self.results_directory}/{query_id}",
+                        query_id, query_text, query_sql, rows, columns, replace)
+
+    def on_result_saved(self, query_id, result_info, plots_failed, replace):
+        """Records a saved result in the history and shows it"""
+        if plots_failed:
             QMessageBox.critical(
                 self, 
                 "خطأ", 
                 "تعذر انتاج الرسومات البيانية لهذا السؤال. الرجاء حاول مرة اخري", 
                 QMessageBox.StandardButton.Ok
             )
-
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # Create file path for storing result
-        filename = f"{self.query_counter}.json"
-        file_path = os.path.join(dir, filename)
-        
-        # Save result data to file
-        result_info = {
-            "query_id": self.query_counter,
-            "query_text": query_text,
-            "timestamp": timestamp,
-            "query_sql": query_sql,
-            "rows": rows,
-            "columns": columns,
-        }
-        
+        if result_info is None:
+            return
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(result_info, f, indent=2, ensure_ascii=False)
-        except Exception as e:
+            self.catalog.add(query_id, result_info["query_text"], result_info["timestamp"], result_info["query_sql"], result_info["row_count"])
+        except Exception:
             return
-        
+
+        if replace:
+            # Refresh main content if it shows the replaced result
+            if self.curr_button and self.curr_button.query_id == query_id:
+                self.on_result_clicked(self.curr_button)
+            return
+
         # Remove empty label if this is the first query
         if len(self.query_buttons) == 0:
             self.empty_label.hide()
@@ -270,8 +350,8 @@ class Sidebar(QFrame):
         
         # Create new button
         button = ResultButton(
-            query_text,
-            self.query_counter
+            result_info["query_text"],
+            query_id
         )
         button.clicked(lambda: self.on_result_clicked(button))
         button.on_icon_clicked(lambda: self.clear_result(button.query_id))
@@ -283,16 +363,17 @@ class Sidebar(QFrame):
         
         # Add to tracking list
         self.query_buttons.append(button)
+        self.loaded_count += 1
         
         # Auto-select the new button
         self.on_result_clicked(button)
     
     def load_query_results(self):
         """
-        Loads all history for the current database
+        Loads the first page of history for the current database, the rest is loaded when scrolling
         """
         # Remove old buttons from layout
-        for i in range(self.buttons_layout.count()):
+        for i in reversed(range(self.buttons_layout.count())):
             if i == 0 or i == self.buttons_layout.count() - 1: # skip empty label and stretch
                 continue 
             item = self.buttons_layout.itemAt(i)
@@ -304,40 +385,43 @@ class Sidebar(QFrame):
 
         # Clear internal tracking list
         self.query_buttons.clear()
-        
-        if not os.path.isdir(self.results_directory):
-            os.makedirs(self.results_directory)
-            self.query_counter = 0
-        
-        results = os.listdir(self.results_directory)
-        if len(results) == 0:
-            self.query_counter = 0
-        else:
-            dirs = sorted(results, key=lambda x: int(x))
-            self.query_counter = int(dirs[len(dirs) - 1])
-
-            for dir in reversed(dirs):
-                file_path = os.path.join(self.results_directory, dir + f"/{int(dir)}.json")
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    result = json.load(f)
-                button = ResultButton(
-                    result['query_text'],
-                    int(dir)
-                )
-                button.clicked(lambda _, b=button: self.on_result_clicked(b))
-                button.on_icon_clicked(lambda _, b=button: self.clear_result(b.query_id))
-                
-                # Add button to layout 
-                self.buttons_layout.removeItem(self.buttons_layout.itemAt(self.buttons_layout.count() - 1))  # Remove stretch
-                self.buttons_layout.addWidget(button)  # Add button
-                self.buttons_layout.addStretch()  # Add stretch back
-                
-                # Add to tracking list
-                self.query_buttons.append(button)
+        self.loaded_count = 0
+        self.query_counter = self.catalog.max_id()
+        self.load_more_results()
 
         if self.query_counter != 0:
             self.clear_button.setEnabled(True)
-            self.empty_label.hide()
+        self.empty_label.setVisible(len(self.query_buttons) == 0)
+
+    def load_more_results(self):
+        """Adds the buttons of the next page of history, older questions at the bottom"""
+        for entry in self.catalog.page(self.loaded_count, HISTORY_PAGE, self.search_text):
+            button = ResultButton(
+                entry['question'],
+                entry['id']
+            )
+            button.clicked(lambda _, b=button: self.on_result_clicked(b))
+            button.on_icon_clicked(lambda _, b=button: self.clear_result(b.query_id))
+            button.setChecked(self.curr_button is not None and self.curr_button.query_id == entry['id'])
+
+            # Add button to layout 
+            self.buttons_layout.removeItem(self.buttons_layout.itemAt(self.buttons_layout.count() - 1))  # Remove stretch
+            self.buttons_layout.addWidget(button)  # Add button
+            self.buttons_layout.addStretch()  # Add stretch back
+
+            # Add to tracking list
+            self.query_buttons.append(button)
+            self.loaded_count += 1
+
+    def on_history_scrolled(self, value):
+        scroll_bar = self.scroll_area.verticalScrollBar()
+        if value >= scroll_bar.maximum() - 20 and self.loaded_count < self.catalog.count(self.search_text):
+            self.load_more_results()
+
+    def on_search(self):
+        """Shows only the questions matching the search text"""
+        self.search_text = self.search_input.text().strip()
+        self.load_query_results()
                 
     def on_result_clicked(self, clicked_button):
         """Handle result button click"""
@@ -365,13 +449,16 @@ class Sidebar(QFrame):
             for button in self.query_buttons:
                 button.deleteLater()
                 button.setParent(None)
-                
-                dir = f"history/databases/{self.db_name}/query_results"
-                for filename in os.listdir(dir):
-                    file_path = os.path.join(dir, filename)
+
+            self.catalog.clear()
+            dir = self.results_directory
+            for filename in os.listdir(dir):
+                file_path = os.path.join(dir, filename)
+                if os.path.isdir(file_path):
                     shutil.rmtree(file_path)
             
             self.query_buttons.clear()
+            self.loaded_count = 0
             self.query_counter = 0
             
             # Show empty label again
@@ -399,13 +486,15 @@ class Sidebar(QFrame):
                     button.deleteLater()
                     button.setParent(None)
                     self.buttons_layout.removeWidget(button)
+                    self.loaded_count -= 1
                     break
             # Delete the associated file
-            dir = f"history/databases/{self.db_name}/query_results/{query_id}"
-            shutil.rmtree(dir)
+            self.catalog.remove(query_id)
+            dir = f"{self.results_directory}/{query_id}"
+            shutil.rmtree(dir, ignore_errors=True)
             
             # Show empty label if all deleted
-            if len(self.query_buttons) == 0:
+            if self.catalog.count() == 0:
                 self.query_counter = 0
                 self.empty_label.show()
                 self.clear_button.setEnabled(False)
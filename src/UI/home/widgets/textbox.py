@@ -1,41 +1,63 @@
 from PyQt6.QtWidgets import QVBoxLayout, QHBoxLayout, QPushButton, QFrame, QTextEdit, QMessageBox
-from PyQt6.QtCore import Qt, pyqtSignal, pyqtSlot, QThread, pyqtSignal, QObject
+from PyQt6.QtCore import Qt, pyqtSignal, pyqtSlot, QObject, QTimer
 from PyQt6.QtGui import QIcon, QMovie
 
-from run_pipeline import run_pipeline
+from pipeline.cancellation import PipelineCancelled
+from pipeline.executor import PipelineBusy, get_pipeline_executor
+from models import models_ready, warmup_running
 
 class Worker(QObject):
     """
-    Worker class to run on different thread than UI
+    Submits a question to the shared pipeline executor and relays its results as signals.
+    The signals are emitted from the executor thread and delivered on the UI thread.
     Args:
         db_manager (DBManager): Manager for current database
         query_text (str): User input to be passed to pipeline
     """
-    finished = pyqtSignal()                     # To signal that the thread finished
-    error = pyqtSignal()                        # To signal that an error occured while running
-    result = pyqtSignal(str, str, list, list)   # To signal that the results are ready and pass them (query_text, query_sql, rows, columns)
+    finished = pyqtSignal()                         # To signal that the run finished
+    error = pyqtSignal()                            # To signal that an error occured while running
+    result = pyqtSignal(str, str, list, list)       # To signal that the results are ready and pass them (query_text, query_sql, rows, columns)
+    provisional = pyqtSignal(str, str, list, list)  # To signal that a first working result is ready while the pipeline keeps running
+    replaced = pyqtSignal(str, str, list, list)     # To signal that a better query replaced the provisional result
 
     def __init__(self, db_manager, query_text):
         super().__init__()
         self.db_manager = db_manager
         self.query_text = query_text
-        self.running = False
+        self.request = None
+        self.provisional_sql = None
 
-    def run(self):
-        if self.running:
-            return
-        self.running = True
+    @property
+    def running(self):
+        return self.request is not None and not self.request.future.done()
+
+    def on_provisional(self, query_sql, rows, columns):
+        self.provisional_sql = query_sql
+        self.provisional.emit(self.query_text, query_sql, rows, columns)
+
+    def start(self):
+        """Queues the question, raises PipelineBusy if too many questions are waiting"""
+        self.request = get_pipeline_executor().submit(self.query_text, self.db_manager, on_provisional=self.on_provisional)
+        self.request.future.add_done_callback(self.on_done)
+
+    def cancel(self):
+        if self.request is not None:
+            self.request.cancel()
+
+    def on_done(self, future):
         try:
-            query_sql, rows, columns = run_pipeline(self.query_text, self.db_manager)
+            query_sql, rows, columns = future.result()
             if query_sql and rows and columns:
-                self.result.emit(self.query_text, query_sql, rows, columns)
+                if self.provisional_sql is None:
+                    self.result.emit(self.query_text, query_sql, rows, columns)
+                elif query_sql != self.provisional_sql:
+                    self.replaced.emit(self.query_text, query_sql, rows, columns)
+        except PipelineCancelled:
+            pass
         except:
-            self.error.emit()
-            self.running = False
-            self.finished.emit()
-            return
-        
-        self.running = False
+            # The provisional result stays if the rest of the pipeline fails
+            if self.provisional_sql is None:
+                self.error.emit()
         self.finished.emit()
 
 class TextBox(QFrame):
@@ -45,6 +67,7 @@ class TextBox(QFrame):
         db_manager (DBManager): Manager for current database
     """
     query_executed = pyqtSignal(str, str, list, list)  # To signal that the results are ready and pass them (query_text, query_sql, rows, columns)
+    query_replaced = pyqtSignal(str, str, list, list)  # To signal that the last shown results were replaced by a better query (query_text, query_sql, rows, columns)
 
     def __init__(self, db_manager, parent=None):
         super().__init__(parent)
@@ -53,6 +76,7 @@ class TextBox(QFrame):
         self.min_lines = 1
         self.line_height = 17
         self.base_height = 36
+        self.workers = []   # questions of this text box, running or queued, in submission order
         self.init_ui()
 
     def init_ui(self):
@@ -125,6 +149,29 @@ class TextBox(QFrame):
         self.execute_button.clicked.connect(self.execute_query)
         self.execute_button.setEnabled(False)
 
+        # Cancels the running and queued questions, shown while there are any
+        self.cancel_button = QPushButton("■")
+        self.cancel_button.setFixedSize(36, 36)
+        self.cancel_button.setToolTip("إيقاف الأسئلة")
+        self.cancel_button.setStyleSheet("""
+            QPushButton {
+                background-color: #EF4444;
+                color: white;
+                border: none;
+                border-radius: 18px;
+                font-size: 14px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #DC2626;
+            }
+            QPushButton:pressed {
+                background-color: #B91C1C;
+            }
+        """)
+        self.cancel_button.clicked.connect(self.cancel_queries)
+        self.cancel_button.hide()
+
         button_container = QFrame()
         button_container.setStyleSheet("""
             border: none;
@@ -134,17 +181,48 @@ class TextBox(QFrame):
         button_layout.addStretch()
         button_layout.addWidget(self.execute_button)
         button_layout.addStretch()
+        cancel_layout = QVBoxLayout()
+        cancel_layout.setContentsMargins(0, 0, 0, 0)
+        cancel_layout.addStretch()
+        cancel_layout.addWidget(self.cancel_button)
+        cancel_layout.addStretch()
         button_container.setLayout(button_layout)
 
         main_layout.addWidget(self.text_edit, 1)
+        main_layout.addLayout(cancel_layout)
         main_layout.addWidget(button_container)
 
         self.spinner = QMovie("src/UI/assets/spinner.gif")
         self.spinner.setScaledSize(self.execute_button.size()* 0.8)
+        self.spinner.frameChanged.connect(lambda: self.execute_button.setIcon(QIcon(self.spinner.currentPixmap())))
 
         self.setLayout(main_layout)
         self.text_edit.setFocus()
 
+        # Tell the user the first question waits for the models while they are still loading
+        self.models_timer = QTimer(self)
+        self.models_timer.setInterval(500)
+        self.models_timer.timeout.connect(self.update_models_state)
+        if not models_ready():
+            self.models_timer.start()
+            self.update_models_state()
+
+    def update_models_state(self):
+        """
+        Shows that the language models are loading in the idle tooltip of the execute button
+        """
+        loading = not models_ready() and warmup_running()
+        if not loading:
+            self.models_timer.stop()
+        self.execute_button.setToolTip(self.execute_tooltip())
+
+    def execute_tooltip(self):
+        if self.workers:
+            return f"إضافة السؤال إلى قائمة الانتظار ({len(self.workers)} قيد التنفيذ)"
+        if not models_ready() and warmup_running():
+            return "تنفيذ السؤال (جاري تحميل النماذج، قد يستغرق السؤال الأول وقتا أطول)"
+        return "تنفيذ السؤال"
+
     def set_height_for_lines(self, lines):
         """
         Sets height of text box according to number of lines
@@ -157,9 +235,8 @@ class TextBox(QFrame):
         Handles the event of text changing
         """
         text = self.text_edit.toPlainText().strip()
-        # Enable button if no thread is running
-        if not hasattr(self, "worker") or not self.worker or not self.worker.running:
-            self.execute_button.setEnabled(bool(text))
+        # Questions can be queued while others run
+        self.execute_button.setEnabled(bool(text))
 
         # update height of text box
         doc = self.text_edit.document()
@@ -175,33 +252,43 @@ class TextBox(QFrame):
 
     def execute_query(self):
         """
-        Runs the pipeline on another thread
+        Queues the question on the pipeline executor, questions run one after the other
         """
         query = self.text_edit.toPlainText().strip()
         if not query:
             return
 
-        # Disable button and show spinner
-        self.execute_button.setEnabled(False)
-        self.execute_button.setText("")
-        self.execute_button.setIconSize(self.spinner.scaledSize())
-        self.spinner.frameChanged.connect(lambda: self.execute_button.setIcon(QIcon(self.spinner.currentPixmap())))
-        self.spinner.start()
-
-        # Run in another thread
-        self.thread = QThread()
-        self.worker = Worker(self.db_manager, query)
-        self.worker.error.connect(self.handleError)
-        self.worker.moveToThread(self.thread)
+        worker = Worker(self.db_manager, query)
+        worker.error.connect(self.handleError)
+        worker.result.connect(self.on_query_executed)
+        worker.provisional.connect(self.on_provisional_result)
+        worker.replaced.connect(self.on_query_replaced)
+        worker.finished.connect(lambda: self.on_worker_finished(worker))
+        try:
+            worker.start()
+        except PipelineBusy:
+            QMessageBox.warning(
+                self,
+                "تنبيه",
+                "يوجد عدد كبير من الاسئلة قيد التنفيذ. الرجاء الانتظار ثم حاول مرة اخري",
+                QMessageBox.StandardButton.Ok
+            )
+            return
+        self.workers.append(worker)
+        self.update_busy_state()
 
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
+    def cancel_queries(self):
+        """
+        Cancels the running question and the queued ones
+        """
+        for worker in self.workers:
+            worker.cancel()
+        self.cancel_button.setEnabled(False)
 
-        self.worker.result.connect(self.on_query_executed)
-        
-        self.thread.start()
+    def on_worker_finished(self, worker):
+        if worker in self.workers:
+            self.workers.remove(worker)
+        self.update_busy_state()
 
     def handleError(self):
         """
@@ -213,23 +300,40 @@ class TextBox(QFrame):
             "تعذر انتاج الكود المناسب لهذا السؤال. الرجاء تحسين السؤال او حاول مرة اخري", 
             QMessageBox.StandardButton.Ok
         )
-        self.spinner.stop()
-        self.execute_button.setIcon(QIcon())
-        self.execute_button.setText("▶")
-        self.execute_button.setEnabled(True)
-        self.worker.running = False
+
+    def update_busy_state(self):
+        """
+        Shows the spinner and the cancel button while questions run, restores the execute button after
+        """
+        if self.workers:
+            if self.spinner.state() != QMovie.MovieState.Running:
+                self.execute_button.setText("")
+                self.execute_button.setIconSize(self.spinner.scaledSize())
+                self.spinner.start()
+            self.cancel_button.setEnabled(True)
+            self.cancel_button.show()
+        else:
+            self.spinner.stop()
+            self.execute_button.setIcon(QIcon())
+            self.execute_button.setText("▶")
+            self.cancel_button.hide()
+        self.execute_button.setToolTip(self.execute_tooltip())
+        self.execute_button.setEnabled(bool(self.text_edit.toPlainText().strip()))
 
     @pyqtSlot(str, str, list, list)
     def on_query_executed(self, query_text, query_sql, rows, columns):
-        # Restore button
-        self.spinner.stop()
-        self.execute_button.setIcon(QIcon())
-        self.execute_button.setText("▶")
-        self.execute_button.setEnabled(True)
-
         # Emit signal
         self.query_executed.emit(query_text, query_sql, rows, columns)
 
+    @pyqtSlot(str, str, list, list)
+    def on_provisional_result(self, query_text, query_sql, rows, columns):
+        # Show the result, the spinner keeps running until the pipeline finishes
+        self.query_executed.emit(query_text, query_sql, rows, columns)
+
+    @pyqtSlot(str, str, list, list)
+    def on_query_replaced(self, query_text, query_sql, rows, columns):
+        self.query_replaced.emit(query_text, query_sql, rows, columns)
+
     def get_text(self):
         return self.text_edit.toPlainText()
 
@@ -4,6 +4,7 @@ from PyQt6.QtWidgets import QApplication
 from PyQt6.QtGui import QIcon
 from UI.home.page import MainAppWindow
 from UI.initial_page.page import InitialPage
+from models import start_warmup
 
 class App(QApplication):
     """
@@ -18,6 +19,8 @@ class App(QApplication):
         self.init_ui()
         
     def init_ui(self):
+        # Load the language models in the background while the user looks at the first page
+        start_warmup()
         if os.path.exists('history/curr_database.txt'):
             # There is an already connected database, Load it and show home page
             with open('history/curr_database.txt', 'r') as f:
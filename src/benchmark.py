@@ -0,0 +1,273 @@
+# Benchmarks of the non-LLM pipeline stages on synthetic SQLite databases.
+# Run from the repository root: python src/benchmark.py [--quick]
+import argparse, json, os, random, shutil, sqlite3, statistics, subprocess, sys, tempfile, time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from database_manager import DBManager
+from models import get_spacy_model, get_embedding_model
+from pipeline.question_processing.schema_selector import select_schema, fuzzy_match_phrases, semantic_similarity
+from pipeline.query_generator.CandidateGenerator import is_safe_select, clean_sql, execute_query
+from pipeline.query_generator.SQLParser import parse_sql
+from pipeline.query_generator.ValidateQueries import UnitTester
+from plotter.Plotter import DataVizTool
+
+BENCH_ROOT = Path("reports/benchmarks")
+
+SCHEMA_SIZES = [10, 100, 1000, 5000]        # total number of columns
+ROW_COUNTS = [1_000, 100_000, 1_000_000]
+PLOT_ROW_COUNTS = [1_000, 10_000, 100_000]
+COLUMNS_PER_TABLE = 50
+REPEATS = 5
+SEED = 42
+
+QUESTION = "What is the total amount paid by customers from each city for orders shipped in 2020?"
+
+WORDS = [
+    "customer", "order", "product", "city", "country", "amount", "price", "date", "status", "name",
+    "category", "quantity", "discount", "payment", "shipment", "supplier", "region", "rating", "score", "title",
+]
+
+SAMPLE_SQL = [
+    "SELECT name FROM customer WHERE city = 'Cairo'",
+    "```sql\nSELECT T1.name, SUM(T2.amount) FROM customer AS T1 JOIN orders AS T2 ON T1.id = T2.customer_id GROUP BY T1.name;\n```",
+    "<think>the user wants the top one</think>SELECT title FROM movies ORDER BY rating DESC LIMIT 1",
+    "WITH totals AS (SELECT city, COUNT(*) AS n FROM customer GROUP BY city) SELECT city FROM totals WHERE n > 10",
+    "SELECT replace(name, 'a', 'b') FROM customer WHERE name = 'McDonald's'",
+    "SELECT 1; DROP TABLE customer",
+]
+
+UNIT_TEST = {
+    "schema_sql": "CREATE TABLE customer(id INTEGER PRIMARY KEY, name TEXT, city TEXT);"
+                  "CREATE TABLE orders(id INTEGER PRIMARY KEY, customer_id INT, amount REAL);",
+    "data_sql": "INSERT INTO customer VALUES (1, 'a', 'Cairo'), (2, 'b', 'Giza'), (3, 'c', 'Cairo');"
+                "INSERT INTO orders VALUES (1, 1, 10), (2, 1, 5), (3, 2, 7), (4, 3, 1);",
+    "expected": [["Cairo", 16.0], ["Giza", 7.0]],
+    "order_matters": False,
+}
+UNIT_TEST_CANDIDATES = [
+    "SELECT c.city, SUM(o.amount) FROM customer c JOIN orders o ON c.id = o.customer_id GROUP BY c.city",
+    "SELECT c.city, COUNT(*) FROM customer c JOIN orders o ON c.id = o.customer_id GROUP BY c.city",
+    "SELECT city, SUM(amount) FROM customer JOIN orders ON customer.id = orders.id GROUP BY city",
+]
+
+
+def timeit(fn, repeats=REPEATS, setup=None):
+    """Runs `fn` `repeats` times and returns min / median / max wall time in seconds."""
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "max": max(times), "repeats": repeats}
+
+
+def make_schema_db(path, n_columns, rows=100):
+    """Creates a database with `n_columns` columns spread over tables of COLUMNS_PER_TABLE columns."""
+    rng = random.Random(SEED)
+    conn = sqlite3.connect(path)
+    for t in range((n_columns + COLUMNS_PER_TABLE - 1) // COLUMNS_PER_TABLE):
+        width = min(COLUMNS_PER_TABLE, n_columns - t * COLUMNS_PER_TABLE)
+        cols = ["id INTEGER PRIMARY KEY"] + [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i} TEXT" for i in range(width - 1)]
+        table = f"{rng.choice(WORDS)}_{t}"
+        conn.execute(f"CREATE TABLE {table} ({', '.join(cols)})")
+        placeholders = ", ".join("?" * width)
+        conn.executemany(
+            f"INSERT INTO {table} VALUES ({placeholders})",
+            ([r] + [f"{rng.choice(WORDS)} {r}" for _ in range(width - 1)] for r in range(rows)),
+        )
+    conn.commit()
+    conn.close()
+
+
+def make_rows_db(path, n_rows):
+    """Creates a database with one `facts` table of `n_rows` rows."""
+    rng = np.random.default_rng(SEED)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE facts (id INTEGER PRIMARY KEY, category TEXT, city TEXT, amount REAL, quantity INTEGER, created_at TEXT)")
+    batch = 100_000
+    for start in range(0, n_rows, batch):
+        n = min(batch, n_rows - start)
+        conn.executemany(
+            "INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?)",
+            zip(
+                range(start, start + n),
+                (f"cat_{c}" for c in rng.integers(0, 20, n)),
+                (f"city_{c}" for c in rng.integers(0, 200, n)),
+                rng.normal(100, 25, n).tolist(),
+                rng.integers(1, 50, n).tolist(),
+                (f"2020-{m:02d}-01" for m in rng.integers(1, 13, n)),
+            ),
+        )
+    conn.commit()
+    conn.close()
+
+
+def forget_database(dbm):
+    """Removes the history the app keeps for a benchmark database, so the next connect is a new one."""
+    dbm.profiler.stop()
+    shutil.rmtree(dbm.history_dir, ignore_errors=True)
+
+
+def bench_schema(tmp, sizes, repeats, results):
+    spacy_model, bert_model = get_spacy_model(), get_embedding_model()
+    for n_columns in sizes:
+        path = os.path.join(tmp, f"bench_schema_{n_columns}.sqlite")
+        make_schema_db(path, n_columns)
+        dbm = DBManager(path)
+        key = str(n_columns)
+
+        results.setdefault("DBManager.setDatabase[new]", {})[key] = timeit(
+            lambda: dbm.setDatabase(path), repeats, setup=lambda: forget_database(dbm))
+        results.setdefault("DBManager.setDatabase[load]", {})[key] = timeit(lambda: dbm.setDatabase(path), repeats)
+        results.setdefault("fuzzy_match_phrases", {})[key] = timeit(
+            lambda: fuzzy_match_phrases(QUESTION, dbm.schema, spacy_model, threshold=80), repeats)
+        results.setdefault("semantic_similarity", {})[key] = timeit(
+            lambda: semantic_similarity(QUESTION, dbm.schema, dbm.embeddings, bert_model, threshold=0), repeats)
+        results.setdefault("select_schema", {})[key] = timeit(
+            lambda: select_schema(QUESTION, dbm.schema, dbm.embeddings, spacy_model, bert_model, fuzz_threshold=80, similarity_threshold=0), repeats)
+        forget_database(dbm)
+        print(f"  schema with {n_columns} columns done")
+
+
+def bench_sql_text(repeats, results):
+    batch = SAMPLE_SQL * 200
+
+    def cold_safety():
+        parse_sql.cache_clear()
+        for sql in batch:
+            is_safe_select(sql)
+
+    results["is_safe_select[cold]"] = {str(len(batch)): timeit(cold_safety, repeats)}
+    results["is_safe_select[cached]"] = {str(len(batch)): timeit(lambda: [is_safe_select(sql) for sql in batch], repeats)}
+    results["clean_sql"] = {str(len(batch)): timeit(lambda: [clean_sql(sql) for sql in batch], repeats)}
+
+
+def bench_execution(tmp, row_counts, repeats, results):
+    for n_rows in row_counts:
+        path = os.path.join(tmp, f"bench_rows_{n_rows}.sqlite")
+        make_rows_db(path, n_rows)
+        key = str(n_rows)
+        results.setdefault("execute_query[aggregate]", {})[key] = timeit(
+            lambda: execute_query(path, "SELECT category, SUM(amount), AVG(quantity) FROM facts GROUP BY category"), repeats)
+        results.setdefault("execute_query[filter]", {})[key] = timeit(
+            lambda: execute_query(path, "SELECT * FROM facts WHERE city = 'city_7' AND amount > 120"), repeats)
+        results.setdefault("execute_query[all rows]", {})[key] = timeit(
+            lambda: execute_query(path, "SELECT * FROM facts"), repeats)
+        print(f"  database with {n_rows} rows done")
+
+
+def bench_unit_tests(repeats, results):
+    tester = UnitTester.__new__(UnitTester)   # no LLM needed to run a unit test
+    batch = 50
+    results["UnitTester._run_unit_test"] = {str(batch): timeit(
+        lambda: [tester._run_unit_test(UNIT_TEST, UNIT_TEST_CANDIDATES) for _ in range(batch)], repeats)}
+
+
+def bench_plots(tmp, row_counts, repeats, results):
+    rng = np.random.default_rng(SEED)
+    for n_rows in row_counts:
+        df = pd.DataFrame({
+            "category": rng.choice([f"cat_{i}" for i in range(8)], n_rows),
+            "city": rng.choice([f"city_{i}" for i in range(40)], n_rows),
+            "amount": rng.normal(100, 25, n_rows),
+            "quantity": rng.integers(1, 50, n_rows),
+        })
+        plots_dir = os.path.join(tmp, f"plots_{n_rows}")
+        results.setdefault("DataVizTool._run", {})[str(n_rows)] = timeit(
+            lambda: DataVizTool(df.copy(), plots_dir, cache_dir=os.path.join(plots_dir, "cache"))._run("Plot automatically"),
+            repeats, setup=lambda: shutil.rmtree(plots_dir, ignore_errors=True))
+
+        # same result aggregated by SQLite around the query, as the sidebar does for large results
+        db_path = os.path.join(tmp, f"plots_{n_rows}.sqlite")
+        with sqlite3.connect(db_path) as conn:
+            df.to_sql("result", conn, index=False, if_exists="replace")
+        results.setdefault("DataVizTool._run (sql)", {})[str(n_rows)] = timeit(
+            lambda: DataVizTool(None, plots_dir, cache_dir=os.path.join(plots_dir, "cache"),
+                                db_path=db_path, query="SELECT * FROM result")._run("Plot automatically"),
+            repeats, setup=lambda: shutil.rmtree(plots_dir, ignore_errors=True))
+        print(f"  plots for {n_rows} rows done")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare_with_previous(report, out_path):
+    """Prints the median time ratio against the previous benchmark run, ratios above 1 are slower."""
+    previous = sorted(p for p in BENCH_ROOT.glob("*.json") if p != out_path)
+    if not previous:
+        return
+    with open(previous[-1], encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\nCompared with {previous[-1].name} ({old.get('commit')}):")
+    for name, params in report["results"].items():
+        for param, stats in params.items():
+            before = old["results"].get(name, {}).get(param)
+            if before:
+                ratio = stats["median"] / before["median"] if before["median"] else float("inf")
+                flag = "  <-- slower" if ratio > 1.2 else ""
+                print(f"  {name:<32} {param:>9}: {ratio:5.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the non-LLM stages of the pipeline.")
+    parser.add_argument("--quick", action="store_true", help="small sizes only, for a fast sanity run")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="runs per measurement")
+    parser.add_argument("--only", nargs="*", default=None, help="groups to run: schema sql execution unit_tests plots")
+    args = parser.parse_args()
+
+    schema_sizes = SCHEMA_SIZES[:2] if args.quick else SCHEMA_SIZES
+    row_counts = ROW_COUNTS[:1] if args.quick else ROW_COUNTS
+    plot_rows = PLOT_ROW_COUNTS[:1] if args.quick else PLOT_ROW_COUNTS
+    groups = set(args.only or ["schema", "sql", "execution", "unit_tests", "plots"])
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if "schema" in groups:
+            print("Schema selection ...")
+            bench_schema(tmp, schema_sizes, args.repeats, results)
+        if "sql" in groups:
+            print("SQL safety and cleaning ...")
+            bench_sql_text(args.repeats, results)
+        if "execution" in groups:
+            print("Query execution ...")
+            bench_execution(tmp, row_counts, args.repeats, results)
+        if "unit_tests" in groups:
+            print("Unit tests ...")
+            bench_unit_tests(args.repeats, results)
+        if "plots" in groups:
+            print("Plots ...")
+            bench_plots(tmp, plot_rows, args.repeats, results)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "run_at": datetime.now().isoformat(sep=" ", timespec="seconds"),
+        "python": sys.version.split()[0],
+        "quick": args.quick,
+        "results": results,
+    }
+    BENCH_ROOT.mkdir(parents=True, exist_ok=True)
+    out_path = BENCH_ROOT / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit}.json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n-----------------------------")
+    for name, params in results.items():
+        for param, stats in params.items():
+            print(f"{name:<32} {param:>9}: median {stats['median'] * 1000:9.2f} ms")
+    print("-----------------------------")
+    print(f"Results saved to {out_path}")
+    compare_with_previous(report, out_path)
+
+
+if __name__ == "__main__":
+    main()
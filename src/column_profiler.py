@@ -0,0 +1,256 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from value_lsh import ValueLSH
+
+SAMPLE_ROWS = 5000      # rows sampled per table, whatever its size
+TOP_VALUES = 20         # most frequent values kept per column
+INDEX_VALUES = 200      # most frequent text values of a column put in the value index
+MAX_VALUE_LEN = 64      # longer texts are free text, not entities worth indexing
+MAX_NGRAM = 4           # longest question phrase looked up in the value index
+SQL_VARIABLES = 500     # bound parameters per sampling query
+
+WORDS = re.compile(r"\w+(?:['\-.]\w+)*", re.UNICODE)
+QUOTED = re.compile(r"[\"'“”‘’]([^\"'“”‘’]{1,64})[\"'“”‘’]")
+
+
+def normalize_value(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+def question_phrases(question: str) -> Set[str]:
+    """Quoted spans and every phrase of up to MAX_NGRAM words of the question, normalized."""
+    # imported here, importing spaCy pulls in torch and this module is imported on the UI thread
+    from spacy.lang.en.stop_words import STOP_WORDS
+
+    phrases = {normalize_value(q) for q in QUOTED.findall(question)}
+    words = [w.lower() for w in WORDS.findall(question)]
+    for n in range(1, MAX_NGRAM + 1):
+        for i in range(len(words) - n + 1):
+            phrases.add(" ".join(words[i:i + n]))
+    return {p for p in phrases if p not in STOP_WORDS}
+
+
+def sample_table(conn: sqlite3.Connection, table: str, sample_rows: int = SAMPLE_ROWS):
+    """
+    Reads a uniform sample of at most `sample_rows` rows of `table` with bounded cost:
+    random rowids are looked up in the b-tree instead of scanning the table.
+
+    Returns:
+        (columns, rows, estimated row count)
+    """
+    quoted = '"' + table.replace('"', '""') + '"'
+    try:
+        max_rowid = conn.execute(f"SELECT max(rowid) FROM {quoted};").fetchone()[0] or 0
+    except sqlite3.Error:
+        max_rowid = None   # WITHOUT ROWID table
+
+    if max_rowid is None or max_rowid <= sample_rows:
+        cursor = conn.execute(f"SELECT * FROM {quoted} LIMIT {sample_rows};")
+        rows = cursor.fetchall()
+        return [d[0] for d in cursor.description], rows, len(rows)
+
+    rowids = random.sample(range(1, max_rowid + 1), sample_rows)
+    rows, columns = [], None
+    for start in range(0, len(rowids), SQL_VARIABLES):
+        chunk = rowids[start:start + SQL_VARIABLES]
+        cursor = conn.execute(f"SELECT * FROM {quoted} WHERE rowid IN ({','.join('?' * len(chunk))});", chunk)
+        columns = [d[0] for d in cursor.description]
+        rows.extend(cursor.fetchall())
+    # rowids can have gaps, the share of hits estimates how many rows really exist
+    return columns, rows, int(max_rowid * len(rows) / sample_rows)
+
+
+def profile_table(conn: sqlite3.Connection, table: str, sample_rows: int = SAMPLE_ROWS) -> Dict:
+    """
+    Profiles the columns of `table` from a sample:
+    {
+        "rows": estimated row count,
+        "sampled": rows sampled,
+        "columns": {"col": {"distinct": ..., "null_ratio": ..., "text_ratio": ..., "min": ..., "max": ..., "top": [[value, count], ...]}},
+        "values": {"normalized text value": [["col", value as stored], ...]}
+    }
+    "distinct" is counted in the sample, so it is a lower bound for large tables.
+    """
+    columns, rows, row_count = sample_table(conn, table, sample_rows)
+    profile = {"rows": row_count, "sampled": len(rows), "columns": {}, "values": defaultdict(list)}
+    for i, column in enumerate(columns):
+        values = [row[i] for row in rows]
+        present = [v for v in values if v is not None]
+        counts = Counter(present)
+        comparable = [v for v in present if isinstance(v, (int, float))] or [v for v in present if isinstance(v, str)]
+        profile["columns"][column] = {
+            "distinct": len(counts),
+            "null_ratio": round(1 - len(present) / len(values), 4) if values else 0.0,
+            "text_ratio": round(sum(isinstance(v, str) for v in present) / len(present), 4) if present else 0.0,
+            "min": min(comparable) if comparable else None,
+            "max": max(comparable) if comparable else None,
+            "top": [[v if not isinstance(v, bytes) else None, c] for v, c in counts.most_common(TOP_VALUES)],
+        }
+        for value, _ in counts.most_common(INDEX_VALUES):
+            if isinstance(value, str) and 1 < len(value) <= MAX_VALUE_LEN and not value.replace(".", "").isdigit():
+                profile["values"][normalize_value(value)].append([column, value])
+    profile["values"] = dict(profile["values"])
+    return profile
+
+
+class ColumnProfiler:
+    """
+    Profiles the columns of a database in a background thread and keeps an inverted index
+    from frequent text values to the columns that contain them.
+    Profiles are saved per table in `{history_dir}/profiles/`, as soon as each table is done,
+    and a table is profiled again only when its definition hash (from the DBManager fingerprint) changes.
+    Text columns with more distinct values than the exact index keeps are then indexed approximately (ValueLSH).
+
+    Args:
+        db_path (str): path to the database file
+        history_dir (str): history directory of the database
+        table_hashes (dict): {table: hash of its CREATE statement}
+    """
+    def __init__(self, db_path: str, history_dir: str, table_hashes: Dict[str, str]):
+        self.db_path = db_path
+        self.directory = os.path.join(history_dir, "profiles")
+        self.table_hashes = dict(table_hashes)
+        self.profiles: Dict[str, Dict] = {}
+        self.value_index: Dict[str, Dict[Tuple[str, str], str]] = defaultdict(dict)   # value -> {(table, column): stored spelling}
+        self.lsh = ValueLSH(history_dir)
+        self.ready = threading.Event()        # set once every table is profiled
+        self.lsh_ready = threading.Event()    # set once the high-cardinality columns are indexed
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._conn = None
+        self._load()
+
+    def _path(self, table: str) -> str:
+        safe = re.sub(r"[^\w\-]+", "_", table)
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def _load(self):
+        for table, table_hash in self.table_hashes.items():
+            path = self._path(table)
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+            if profile.get("table") == table and profile.get("table_hash") == table_hash:
+                self._add(table, profile)
+
+    def _add(self, table: str, profile: Dict):
+        with self._lock:
+            self.profiles[table] = profile
+            for value, columns in profile["values"].items():
+                for column, stored in columns:
+                    self.value_index[value][(table, column)] = stored
+
+    def pending_tables(self) -> List[str]:
+        return [table for table in self.table_hashes if table not in self.profiles]
+
+    def start(self):
+        """Profiles the tables that have no up-to-date profile, in a daemon thread."""
+        if not self.pending_tables() and not self.pending_lsh_columns():
+            self.ready.set()
+            self.lsh_ready.set()
+            return
+        self._thread = threading.Thread(target=self.run, name="column-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops profiling, interrupting the running query, and waits for the thread to exit."""
+        self._stop.set()
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.interrupt()
+            except sqlite3.ProgrammingError:
+                pass    # closed by the thread meanwhile
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        conn = self._conn = sqlite3.connect(f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            for table in self.pending_tables():
+                if self._stop.is_set():
+                    return
+                try:
+                    profile = profile_table(conn, table)
+                except sqlite3.Error as e:
+                    if self._stop.is_set():
+                        return
+                    print(f"Could not profile {table}: {e}")
+                    continue
+                profile.update(table=table, table_hash=self.table_hashes[table])
+                tmp = self._path(table) + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(profile, f, ensure_ascii=False, default=str)
+                os.replace(tmp, self._path(table))
+                self._add(table, profile)
+            self.ready.set()
+
+            for table, column in self.pending_lsh_columns():
+                if self._stop.is_set():
+                    return
+                try:
+                    self.lsh.index_column(conn, table, column, self.table_hashes[table])
+                except sqlite3.Error as e:
+                    if self._stop.is_set():
+                        return
+                    print(f"Could not index values of {table}.{column}: {e}")
+        finally:
+            self._conn = None
+            conn.close()
+            self.lsh.close()
+            self.ready.set()
+            self.lsh_ready.set()
+
+    def pending_lsh_columns(self) -> List[Tuple[str, str]]:
+        """Profiled text columns whose frequent values do not cover them, and that have no up-to-date LSH index."""
+        pending = []
+        for table, profile in list(self.profiles.items()):
+            for column, stats in profile["columns"].items():
+                if stats["distinct"] > INDEX_VALUES and stats.get("text_ratio", 0) >= 0.5 \
+                        and not self.lsh.is_indexed(table, column, self.table_hashes[table]):
+                    pending.append((table, column))
+        return pending
+
+    def value_matches(self, question: str, schema: Optional[Dict[str, Dict[str, str]]] = None) -> Dict[Tuple[str, str], List[str]]:
+        """
+        Finds the columns whose frequent values appear in the question.
+        Uses the profiles available so far, it does not wait for profiling to finish.
+
+        Returns:
+            {(table, column): [matched values, spelled as stored in the column]}
+        """
+        matches = defaultdict(list)
+        phrases = question_phrases(question)
+        unmatched = set(phrases)
+        with self._lock:
+            for phrase in phrases:
+                for (table, column), stored in self.value_index.get(phrase, {}).items():
+                    if schema is None or column in schema.get(table, {}):
+                        matches[(table, column)].append(stored)
+                        unmatched.discard(phrase)
+        # phrases missing from the exact index may still be values of high-cardinality columns
+        for key, values in self.lsh.match(unmatched, schema).items():
+            matches[key].extend(v for v in values if v not in matches[key])
+        # "English" is not a separate mention when "New Zealand English" matched the same column
+        return {
+            key: [v for v in values if not any(v != o and f" {normalize_value(v)} " in f" {normalize_value(o)} " for o in values)]
+            for key, values in matches.items()
+        }
+
+
+def format_value_hints(matches: Dict[Tuple[str, str], List[str]]) -> str:
+    """Describes the value matches for the candidate generation prompt."""
+    if not matches:
+        return ""
+    parts = [f"{table}.{column} contains " + ", ".join(f"'{v}'" for v in values) for (table, column), values in matches.items()]
+    return "Values mentioned in the question: " + "; ".join(parts) + "."
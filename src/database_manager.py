@@ -1,31 +1,201 @@
 import sqlite3
-from typing import Dict, List, Tuple
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
 import pickle
 import os
 from models import get_embedding_model
+from embedding_store import EmbeddingStore
+from column_profiler import ColumnProfiler
+
+HISTORY_ROOT = "history/databases"
+TRANSLATE_WORKERS = 8   # descriptions translated concurrently
+ENCODE_BATCH = 64
+READ_POOL_SIZE = 4      # read-only connections shared by exports and query runs
+
+
+def history_dir_for(db_path: str) -> str:
+    """
+    Directory where the app keeps the history of a database file.
+    The path hash keeps apart different files that share a basename.
+    """
+    db_name = os.path.splitext(os.path.basename(db_path))[0]
+    path_hash = hashlib.sha1(os.path.abspath(db_path).encode("utf-8")).hexdigest()[:8]
+    return f"{HISTORY_ROOT}/{db_name}_{path_hash}"
+
+
+class ConnectionPool:
+    """
+    Read-only connections to a database, opened on first use and reused across threads,
+    so background reads neither pay a connect per query nor can write to the database.
+
+    Args:
+        db_path (str): path to the database file
+        size (int): maximum number of open connections, callers wait for one beyond it
+    """
+    def __init__(self, db_path: str, size: int = READ_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            conn.set_progress_handler(None, 0)   # handlers set by the caller must not outlive it
+            self._release(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError(f"The connection pool of {self.db_path} is closed.")
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._opened < self.size:
+                self._opened += 1
+                return sqlite3.connect(f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True, check_same_thread=False)
+        conn = self._idle.get()
+        if conn is None:    # closed while waiting, wake the next waiter too
+            self._idle.put(None)
+            raise sqlite3.ProgrammingError(f"The connection pool of {self.db_path} is closed.")
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._lock:
+            if not self._closed:
+                self._idle.put(conn)
+                return
+        # returned after close(), e.g. by an export still running when the database was switched
+        conn.close()
+
+    def close(self):
+        """Closes the idle connections now and the ones in use as they are returned."""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if conn is not None:
+                    conn.close()
+            self._idle.put(None)    # wakes callers waiting for a connection
+
 
 class DBManager:
     def __init__(self, db_path: str):
+        self.schema_lock = threading.RLock()    # descriptions are edited from a worker thread while questions read the schema
         self.setDatabase(db_path)
 
+    @property
+    def embedding_model(self):
+        # Loaded on first use (or by the warm-up at startup), not while the UI is being built
+        return get_embedding_model()
+
     def setDatabase(self, db_path : str):
         self.db_path = db_path
         self.db_name = os.path.splitext(os.path.basename(self.db_path))[0]
+        self.history_dir = history_dir_for(db_path)
         self.conn = sqlite3.connect(db_path)
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
-        self.embedding_model = get_embedding_model()
+        if getattr(self, "read_pool", None) is not None:   # connected to another database before
+            self.read_pool.close()
+        self.read_pool = ConnectionPool(db_path)
+        self.migrateLegacyHistory()
         # New connected database
-        if not os.path.isdir(f"history/databases/{self.db_name}"):
-            os.makedirs(f"history/databases/{self.db_name}")
+        if not os.path.isdir(self.history_dir):
+            os.makedirs(self.history_dir)
             self.schema = self.loadSchema()
             self.primary_keys, self.foreign_keys = self.loadRelationships(self.schema)
-            self.embeddings = self.schema
+            self.embeddings = EmbeddingStore(self.history_dir)
+            self.fingerprint = self.computeFingerprint()
             self.save()
-        else: # was connected before
+        else: # was connected before, the database may have changed since
             self.load()
+            self.refresh()
+        # Column values are sampled in the background, questions use whatever is profiled so far
+        if getattr(self, "profiler", None) is not None:    # still profiling the previous database
+            self.profiler.stop()
+        self.profiler = ColumnProfiler(self.db_path, self.history_dir, self.fingerprint["tables"])
+        self.profiler.start()
+
+    def migrateLegacyHistory(self):
+        """Moves the history kept under the bare database name (before fingerprints) to `history_dir`."""
+        legacy_dir = f"{HISTORY_ROOT}/{self.db_name}"
+        if not os.path.isdir(self.history_dir) and os.path.isfile(f"{legacy_dir}/schema.pkl"):
+            os.rename(legacy_dir, self.history_dir)
+
+    def computeFingerprint(self) -> Dict:
+        """
+        Identifies the database file and the state of its schema:
+        {
+            "path": absolute path,
+            "schema_version": PRAGMA schema_version, bumped by SQLite on every schema change,
+            "file_id": [st_dev, st_ino], changes when the file is replaced,
+            "tables": {"table1": hash of its CREATE statement, ...}
+        }
+        """
+        stat = os.stat(self.db_path)
+        self.cursor.execute("PRAGMA schema_version;")
+        schema_version = self.cursor.fetchone()[0]
+        self.cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+        tables = {row["name"]: hashlib.sha1((row["sql"] or "").encode("utf-8")).hexdigest() for row in self.cursor.fetchall()}
+        return {
+            "path": os.path.abspath(self.db_path),
+            "schema_version": schema_version,
+            "file_id": [stat.st_dev, stat.st_ino],
+            "tables": tables,
+        }
+
+    def refresh(self) -> bool:
+        """
+        Brings the saved schema up to date with the database file.
+        Only tables that were added, removed or altered are re-introspected, the descriptions and
+        embeddings of the columns that still exist are kept.
+        Returns True if anything changed.
+        """
+        current = self.computeFingerprint()
+        stored = self.fingerprint or {}
+        if all(stored.get(key) == current[key] for key in ("schema_version", "file_id", "tables")):
+            return False
+
+        old_tables = stored.get("tables", {})
+        new_tables = current["tables"]
+        removed = [t for t in self.schema if t not in new_tables]
+        changed = [t for t in new_tables if t not in self.schema or old_tables.get(t) != new_tables[t]]
 
-    def loadSchema(self) -> Dict[str, Dict[str, str]]:
+        for table in removed:
+            self.schema.pop(table, None)
+            self.embeddings.remove_table(table)
+            self.primary_keys.pop(table, None)
+            self.foreign_keys.pop(table, None)
+
+        fresh = self.loadSchema(changed)
+        for table, columns in fresh.items():
+            old_columns = self.schema.get(table, {})
+            self.schema[table] = {col: old_columns.get(col, "") for col in columns}
+            self.embeddings.retain(table, columns)
+        primary_keys, foreign_keys = self.loadRelationships(fresh)
+        self.primary_keys.update(primary_keys)
+        self.foreign_keys.update(foreign_keys)
+
+        self.fingerprint = current
+        self.save()
+        return True
+
+    def loadSchema(self, tables: Optional[List[str]] = None) -> Dict[str, Dict[str, str]]:
         """
         Returns schema as:
         {
@@ -37,11 +207,13 @@ class DBManager:
             },
             ...
         }
+        Only `tables` are introspected when given.
         """
         schema = {}
-        # Get all user-defined tables (ignore internal SQLite tables)
-        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-        tables = [row["name"] for row in self.cursor.fetchall()]
+        if tables is None:
+            # Get all user-defined tables (ignore internal SQLite tables)
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+            tables = [row["name"] for row in self.cursor.fetchall()]
 
         for table in tables:
             self.cursor.execute(f"PRAGMA table_info('{table}');")
@@ -84,35 +256,118 @@ class DBManager:
         return primary_keys, foreign_keys
     
     def setDescription(self, table_name : str, column_name : str, desc: str):
-        self.schema[table_name][column_name] = desc
+        with self.schema_lock:
+            self.schema[table_name][column_name] = desc
 
     def embedDescription(self, table, column, desc):
         if desc != "":
-            desc_emb = self.embedding_model.encode(desc, convert_to_tensor=True)
-            self.embeddings[table][column] = desc_emb
+            desc_emb = self.embedding_model.encode(desc)
+            self.embeddings.put(table, column, desc_emb)
+        else:
+            self.embeddings.remove(table, column)
     
+    def embedDescriptions(self, descriptions: Dict[Tuple[str, str], str], translate: Callable[[str], str] = None,
+                          progress: Callable[[int, int], None] = None) -> int:
+        """
+        Sets many column descriptions at once, e.g. all the fields of the schema viewer.
+        Only descriptions that changed (or have no embedding yet) are translated, concurrently,
+        and then encoded in one batched call.
+
+        Args:
+            descriptions: {(table, column): description}
+            translate: translates a description to English before encoding, identity if None
+            progress: called with (done, total) as descriptions are translated and encoded
+
+        Returns:
+            number of descriptions embedded
+        """
+        changed, cleared = {}, []
+        with self.schema_lock:
+            for (table, column), desc in descriptions.items():
+                previous = self.schema[table].get(column, "")
+                if desc == "":
+                    cleared.append((table, column))
+                elif desc != previous or (table, column) not in self.embeddings:
+                    changed[(table, column)] = desc
+
+        total = len(changed) + 1   # the encoding counts as the last step
+        done = 0
+        translated = {}
+        if translate is None:
+            translated = dict(changed)
+        elif changed:
+            with ThreadPoolExecutor(max_workers=TRANSLATE_WORKERS) as pool:
+                futures = {pool.submit(translate, desc): key for key, desc in changed.items()}
+                for future in as_completed(futures):
+                    translated[futures[future]] = future.result()
+                    done += 1
+                    if progress:
+                        progress(done, total)
+
+        vectors = {}
+        if translated:
+            keys = list(translated)
+            vectors = dict(zip(keys, self.embedding_model.encode([translated[key] for key in keys], batch_size=ENCODE_BATCH)))
+
+        # The schema only takes the new descriptions once their embeddings are stored,
+        # a failed translation leaves both as they were so the next save retries it
+        with self.schema_lock:
+            if vectors:
+                self.embeddings.put_many(vectors)
+            for table, column in cleared:
+                self.embeddings.remove(table, column)
+            for (table, column), desc in descriptions.items():
+                self.schema[table][column] = desc
+        if progress:
+            progress(total, total)
+        return len(translated)
+
     def saveDescToFile(self):
-        with open(f'history/databases/{self.db_name}/embeddings.pkl', 'wb') as f:
-            pickle.dump(self.embeddings, f)
+        self.embeddings.save()
 
     def loadDescFromFile(self):
-        with open(f'history/databases/{self.db_name}/embeddings.pkl', 'rb') as f:
-            self.embeddings = pickle.load(f)
+        self.embeddings = EmbeddingStore(self.history_dir)
+        legacy_path = f'{self.history_dir}/embeddings.pkl'
+        if os.path.exists(legacy_path):
+            self.embeddings.migrate_pickle(legacy_path)
+        # Older versions aliased the embeddings to the schema, so some descriptions were saved as tensors
+        moved = {(table, col): desc for table, columns in self.schema.items() for col, desc in columns.items() if not isinstance(desc, str)}
+        for table, col in moved:
+            if (table, col) not in self.embeddings:
+                self.embeddings.put(table, col, moved[(table, col)])
+            self.schema[table][col] = ""
+        if moved:
+            self.save()
 
     def saveSchemaToFile(self):
-        with open(f"history/databases/{self.db_name}/schema.pkl", 'wb') as f:
+        with open(f"{self.history_dir}/schema.pkl", 'wb') as f:
             pickle.dump((self.schema, self.primary_keys, self.foreign_keys), f)
 
     def loadSchemaFromFile(self):
-        with open(f"history/databases/{self.db_name}/schema.pkl", 'rb') as f:
+        with open(f"{self.history_dir}/schema.pkl", 'rb') as f:
             self.schema, self.primary_keys, self.foreign_keys = pickle.load(f)
 
+    def saveFingerprintToFile(self):
+        with open(f"{self.history_dir}/fingerprint.json", 'w', encoding="utf-8") as f:
+            json.dump(self.fingerprint, f, indent=2)
+
+    def loadFingerprintFromFile(self):
+        # histories saved before fingerprints have none, the first refresh re-introspects every table
+        path = f"{self.history_dir}/fingerprint.json"
+        self.fingerprint = None
+        if os.path.exists(path):
+            with open(path, 'r', encoding="utf-8") as f:
+                self.fingerprint = json.load(f)
+
     def save(self):
-        self.saveSchemaToFile()
-        self.saveDescToFile()
+        with self.schema_lock:
+            self.saveSchemaToFile()
+            self.saveDescToFile()
+            self.saveFingerprintToFile()
     
     def load(self):
         self.loadSchemaFromFile()
+        self.loadFingerprintFromFile()
         self.loadDescFromFile()
 
 
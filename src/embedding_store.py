@@ -0,0 +1,176 @@
+import glob
+import json
+import os
+import pickle
+import threading
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+KEY_SEP = "\x1f"   # joins table and column names in the index keys
+VECTORS_FILE = "vectors.bin"   # vectors file of stores that were never compacted
+
+
+class EmbeddingStore:
+    """
+    Description embeddings of one database, stored as a matrix with one row per (table, column):
+      -> vectors.bin (vectors.<id>.bin once compacted): raw rows of `dtype`, appended to and memory-mapped on load, so loading does not depend on the schema width.
+      -> index.json: {"dim": ..., "dtype": ..., "rows": {"table<SEP>column": row number}, "stored": rows in the vectors file,
+                      "vectors": name of the vectors file}
+    Updating a description appends a new row and repoints the index, the old row is dropped at the next compaction.
+    Compaction writes a new vectors file and the index is switched to it afterwards, so a crash leaves the old pair intact.
+    All reads and writes hold the store lock, descriptions are saved from a worker thread while questions read them.
+
+    Args:
+        directory (str): history directory of the database
+        dtype: numpy type of the stored vectors (float32 or float16)
+    """
+    def __init__(self, directory: str, dtype=np.float32):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, VECTORS_FILE)
+        self.index_path = os.path.join(directory, "index.json")
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.rows: Dict[str, int] = {}
+        self.stored = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(table: str, column: str) -> str:
+        return f"{table}{KEY_SEP}{column}"
+
+    def load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.dim, self.rows, self.stored = index["dim"], index["rows"], index["stored"]
+            self.dtype = np.dtype(index["dtype"])
+            self.vectors_path = os.path.join(self.directory, index.get("vectors", VECTORS_FILE))
+        self._open()
+
+    def _open(self):
+        # np.memmap cannot map an empty file
+        self._matrix = None
+        if self.stored and self.dim:
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self.stored, self.dim))
+
+    def get(self, table: str, column: str) -> Optional[np.ndarray]:
+        """The embedding of a column description, None if it has none."""
+        with self._lock:
+            row = self.rows.get(self._key(table, column))
+            if row is None or self._matrix is None:
+                return None
+            return np.array(self._matrix[row], dtype=np.float32)   # a copy, callers never hold the mapping
+
+    def __contains__(self, item: Tuple[str, str]) -> bool:
+        with self._lock:
+            return self._key(*item) in self.rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.rows)
+
+    def put(self, table: str, column: str, vector):
+        self.put_many({(table, column): vector})
+
+    def put_many(self, vectors: Dict[Tuple[str, str], "np.ndarray"]):
+        """Appends the vectors of (table, column) pairs, replacing their previous embeddings."""
+        if not vectors:
+            return
+        matrix = np.stack([np.asarray(_to_numpy(v), dtype=self.dtype).reshape(-1) for v in vectors.values()])
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding size {matrix.shape[1]} does not match the store ({self.dim}).")
+            os.makedirs(self.directory, exist_ok=True)
+            self._matrix = None   # a mapped file cannot be resized on Windows
+            # write right after the rows known to the index, rows appended by a run that crashed before save() are overwritten
+            with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+                f.seek(self.stored * self.dim * self.dtype.itemsize)
+                f.write(matrix.tobytes())
+                f.truncate()
+            for i, (table, column) in enumerate(vectors):
+                self.rows[self._key(table, column)] = self.stored + i
+            self.stored += len(matrix)
+            self._open()
+
+    def remove(self, table: str, column: str):
+        with self._lock:
+            self.rows.pop(self._key(table, column), None)
+
+    def remove_table(self, table: str):
+        prefix = f"{table}{KEY_SEP}"
+        with self._lock:
+            for key in [k for k in self.rows if k.startswith(prefix)]:
+                del self.rows[key]
+
+    def retain(self, table: str, columns: Iterable[str]):
+        """Drops the embeddings of the columns of `table` that are not in `columns`."""
+        keep = {self._key(table, column) for column in columns}
+        prefix = f"{table}{KEY_SEP}"
+        with self._lock:
+            for key in [k for k in self.rows if k.startswith(prefix) and k not in keep]:
+                del self.rows[key]
+
+    def save(self):
+        """Writes the index, compacting the vectors first when most stored rows are no longer referenced."""
+        with self._lock:
+            previous = None
+            if self.stored > 2 * len(self.rows) + 16:
+                previous = self._compact()
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype.name, "rows": self.rows, "stored": self.stored,
+                           "vectors": os.path.basename(self.vectors_path)}, f)
+            os.replace(tmp, self.index_path)
+            # the old vectors file is only dropped once the index points at the new one
+            if previous is not None and os.path.exists(previous):
+                os.remove(previous)
+
+    def _compact(self) -> str:
+        """Writes the referenced rows to a new vectors file and switches to it, returns the path of the previous file."""
+        keys = list(self.rows)
+        matrix = np.asarray(self._matrix[[self.rows[k] for k in keys]]) if keys else np.empty((0, self.dim or 0), self.dtype)
+        self._matrix = None   # release the mapping before the old file is removed
+        previous = self.vectors_path
+        # files of compactions that crashed before their index was written
+        for stale in glob.glob(os.path.join(self.directory, "vectors.*.bin")):
+            if stale != previous:
+                os.remove(stale)
+        self.vectors_path = os.path.join(self.directory, f"vectors.{uuid.uuid4().hex[:8]}.bin")
+        with open(self.vectors_path, "wb") as f:
+            f.write(matrix.tobytes())
+        self.rows = {k: i for i, k in enumerate(keys)}
+        self.stored = len(keys)
+        self._open()
+        return previous
+
+    def migrate_pickle(self, pickle_path: str) -> int:
+        """
+        Imports the embeddings.pkl of older versions, a {table: {column: tensor or description}} dict,
+        then removes it. Returns the number of embeddings imported.
+        """
+        with open(pickle_path, "rb") as f:
+            legacy = pickle.load(f)
+        vectors = {
+            (table, column): value
+            for table, columns in legacy.items()
+            for column, value in columns.items()
+            if not isinstance(value, str)
+        }
+        self.put_many(vectors)
+        self.save()
+        os.remove(pickle_path)
+        return len(vectors)
+
+
+def _to_numpy(vector):
+    # torch tensors from older histories, possibly on the GPU
+    if hasattr(vector, "detach"):
+        return vector.detach().cpu().numpy()
+    return vector
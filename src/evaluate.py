@@ -1,23 +1,30 @@
 # Compare our CHESS-based pipeline against BIRD train answers.
 import json, random, csv, argparse, collections, sys
 from pathlib import Path
-import pandas as pd
-import time, itertools
+import time, itertools, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from Params import *
 from run_pipeline import run_pipeline
 from database_manager import DBManager
-from pipeline.query_generator.CandidateGenerator import execute_query_rows_columns, execute_query   
+from tracer import StageTracer, percentiles
+from result_compare import compare, digest_query, digest_rows, sample_to_json
+from gt_cache import GTCache, CACHE_PATH, GT_TIMEOUT, GT_WORKERS
 
 DATASET_ROOT = Path("datasets/train")
 TRAIN_JSON = DATASET_ROOT / "train.json"
 DB_ROOT = DATASET_ROOT / "train_databases"
 REPORT_ROOT = Path("reports")
 CSV_OUT= REPORT_ROOT/"mismatches.csv"
+CHECKPOINT = REPORT_ROOT/"checkpoint.jsonl"
 
 MAX_SAMPLES = 50          
+WORKERS = 4               # samples evaluated concurrently, the pipeline mostly waits on the LLM API
 SEED = 42
 
+_db_managers = {}                    # db_id -> DBManager, shared by all workers
+_db_managers_lock = threading.Lock()
+
 random.seed(SEED)
 
 
@@ -44,18 +51,6 @@ def uniform_sample(entries, k):
                 buckets.pop(db)   # empty bucket
     return selected
 
-def set_f1(pred_rows, gt_rows):
-    """Return precision, recall, f1 for one sample (set-based)."""
-    pred_set, gt_set = set(pred_rows), set(gt_rows)
-    tp = len(pred_set & gt_set)
-    prec = tp / len(pred_set) if pred_set else 0.0
-    rec  = tp / len(gt_set)   if gt_set   else 0.0
-    f1   = 2*prec*rec/(prec+rec) if prec+rec else 0.0
-    return prec, rec, f1
-
-def count_tokens(text: str) -> int:
-    return len(text.split())
-
 def next_metrics_path(base= REPORT_ROOT/ "metrics.txt") -> Path:
     p = Path(base)
     if not p.exists():
@@ -66,105 +61,178 @@ def next_metrics_path(base= REPORT_ROOT/ "metrics.txt") -> Path:
         if not alt.exists():
             return alt
 
-def rows_to_multiset(rows, ignore_pos=False):
-    if ignore_pos:
-        return collections.Counter(frozenset(r) for r in rows) 
-    return collections.Counter(tuple(r) for r in (rows or []))
+def sample_key(item) -> str:
+    """
+    Identifies a BIRD sample across runs, used to resume from a checkpoint.
+    Keyed on the position of the sample in the dataset, the same question can appear more than once.
+    """
+    return f"{item['dataset_index']}::{item['db_id']}"
 
-def evaluate(max_samples=MAX_SAMPLES):
+def get_db_manager(db_id, db_path):
+    """
+    Returns the DBManager of a database, building it only once per db_id for the whole run.
+    """
+    with _db_managers_lock:
+        if db_id not in _db_managers:
+            _db_managers[db_id] = DBManager(str(db_path))
+        return _db_managers[db_id]
+
+def load_checkpoint(path: Path):
+    """Reads the records of samples completed by a previous run."""
+    records = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["key"]] = record
+    return records
+
+def evaluate_sample(idx, item, gt_cache=None, gt_timeout=GT_TIMEOUT):
+    """
+    Runs the pipeline and the ground-truth SQL of one sample and compares them.
+    Returns a JSON-serialisable record, its "status" is one of:
+    no-db, pipeline-crash, pipeline-empty, gt-error, ok.
+    The gold result is read from `gt_cache` when it was precomputed.
+    """
+    # get db_id, question, and ground-truth SQL from BIRD
+    db_id    = item["db_id"]
+    question = item["question"]
+    gt_sql   = item["SQL"]
+    record = {"key": sample_key(item), "idx": idx, "db_id": db_id, "question": question, "gt_sql": gt_sql}
+
+    db_path = DB_ROOT / db_id / f"{db_id}.sqlite"
+
+    # if the data base file does not exist, skip this sample and add one bad test as it exists inside bird but can't find it.
+    if not db_path.exists():
+        print(f"[{idx:03}] X DB file not found for {db_id}; skipping.")
+        record["status"] = "no-db"
+        return record
+
+    dbm = get_db_manager(db_id, db_path)
+    tracer = StageTracer()
+
+    try:
+        # our pipeline
+        start_time = time.perf_counter()
+        pred_sql, pred_rows, pred_cols = run_pipeline(question, dbm, tracer=tracer)
+        record["latency"] = time.perf_counter() - start_time
+        record["pred_sql"] = pred_sql
+    # if pipeline crashes, catch the exception and add one bad test
+    except Exception as e:   # hard failure inside pipeline
+        print(f"[{idx:03}] X Pipeline crashed: {e}")
+        record["status"] = "pipeline-crash"
+        record["error"] = str(e)
+        return record
+    finally:
+        record["trace"] = tracer.to_dict()
+
+    # pipeline returned None add one bad test
+    if pred_rows is None:
+        print(f"[{idx:03}] X Pipeline produced no answer.")
+        record["status"] = "pipeline-empty"
+        return record
+
+    # ---- ground-truth execution --------------------------
+    # GT rows are digested while streamed from the cursor, they are never held in memory
+    cached = gt_cache.get(db_id, str(db_path), gt_sql, gt_timeout) if gt_cache else None
+    if cached is None:
+        cached = digest_query(str(db_path), gt_sql, timeout_sec=gt_timeout)
+        if gt_cache:
+            gt_cache.put(db_id, str(db_path), gt_sql, *cached, gt_timeout)
+    gt_digest, err = cached
+    if err:
+        print(f"[{idx:03}] ! GT SQL failed ({err}); skipping.")
+        record["status"] = "gt-error"
+        record["error"] = err
+        return record
+
+    # compare 
+    pred_digest = digest_rows(pred_rows, pred_cols)
+    result = compare(pred_digest, gt_digest)
+
+    # F1 for this sample and counts for micro
+    record.update(
+        status="ok",
+        f1=result.f1,
+        tp=result.tp,
+        pred_n=len(pred_digest.row_hashes),
+        gt_n=len(gt_digest.row_hashes),
+        correct=result.correct,
+    )
+
+    tag = "/" if result.correct else "X"
+    print(f"[{idx:03}] {tag}  {question[:]}  (rows: pipeline {pred_digest.row_count}, true {gt_digest.row_count})")
+
+    # only mismatches carry rows, capped to the first SAMPLE_ROWS of each side
+    if not result.correct:
+        record["pred_rows"] = sample_to_json(pred_digest)
+        record["gt_rows"] = sample_to_json(gt_digest)
+    return record
+
+def evaluate(max_samples=MAX_SAMPLES, workers=WORKERS, checkpoint=CHECKPOINT, resume=False,
+             gt_cache_path=CACHE_PATH, gt_workers=GT_WORKERS, gt_timeout=GT_TIMEOUT):
     # ---------- load dataset ---------------------------------
     with open(TRAIN_JSON, encoding="utf-8") as f:
         dataset = json.load(f)
+    for i, item in enumerate(dataset):
+        item["dataset_index"] = i
 
     samples = uniform_sample(dataset, max_samples)
-    print(f"Running evaluation on {len(samples)} samples (≤{MAX_SAMPLES}).\n")
+    print(f"Running evaluation on {len(samples)} samples with {workers} workers.\n")
+
+    # ---------- resume ---------------------------------------
+    checkpoint = Path(checkpoint)
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    done = load_checkpoint(checkpoint) if resume else {}
+    records = [done[sample_key(item)] for item in samples if sample_key(item) in done]
+    pending = [(idx, item) for idx, item in enumerate(samples, 1) if sample_key(item) not in done]
+    if records:
+        print(f"Resuming from {checkpoint}: {len(records)} samples already done.\n")
+
+    # ---------- gold results ---------------------------------
+    # Gold queries run once in parallel processes, later runs read them from the cache
+    gt_cache = GTCache(gt_cache_path)
+    gt_cache.precompute([item for _, item in pending], DB_ROOT, gt_workers, gt_timeout)
 
     # ---------- main loop ------------------------------------
-    good, bad = 0, 0
+    # Each finished sample is appended to the checkpoint right away, so a crash loses nothing
+    with open(checkpoint, "a" if resume else "w", encoding="utf-8") as ckpt, \
+         ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(evaluate_sample, idx, item, gt_cache, gt_timeout) for idx, item in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            ckpt.write(json.dumps(record, ensure_ascii=False) + "\n")
+            ckpt.flush()
+
+    gt_cache.close()
+    records.sort(key=lambda r: r["idx"])
+
+    good = sum(1 for r in records if r.get("correct"))
+    bad = sum(1 for r in records if r["status"] in ("no-db", "pipeline-crash", "pipeline-empty") or r.get("correct") is False)
+    latencies = [r["latency"] for r in records if "latency" in r]
+    traces = [r["trace"] for r in records if "trace" in r]
+    stage_names = sorted({stage for t in traces for stage in t["stages"]})
+    # optional stages (revision, unit tests, ...) only count the samples that ran them
+    stage_times = {stage: [t["stages"][stage] for t in traces if stage in t["stages"]] for stage in stage_names}
+    stage_pcts = {stage: percentiles(times) for stage, times in stage_times.items()}
+    token_keys = ("input_tokens", "output_tokens", "total_tokens")
+    avg_tokens = {k: sum(t["tokens"].get(k, 0) for t in traces) / len(traces) if traces else 0.0 for k in token_keys}
+    scored = [r for r in records if r["status"] == "ok"]
+    f1_scores = [r["f1"] for r in scored]
+    tp_sum = sum(r["tp"] for r in scored)
+    pred_total = sum(r["pred_n"] for r in scored)
+    gt_total = sum(r["gt_n"] for r in scored)
+
     mismatch_rows = []
-    latencies = []
-    f1_scores = []
-    token_costs = []
-
-    tp_sum = pred_total = gt_total = 0
-
-    for idx, item in enumerate(samples, 1):
-        # get db_id, question, and ground-truth SQL from BIRD
-        db_id    = item["db_id"]
-        question = item["question"]
-        gt_sql   = item["SQL"]
-
-        db_path = DB_ROOT / db_id / f"{db_id}.sqlite"
-
-        # if the data base file does not exist, skip this sample and add one bad test as it exists inside bird but can't find it.
-        if not db_path.exists():
-            print(f"[{idx:03}] X DB file not found for {db_id}; skipping.")
-            bad += 1
-            continue
-
-        dbm = DBManager(str(db_path))
-
-        try:
-            # our pipeline
-            start_time = time.perf_counter()
-            pred_sql, pred_rows, pred_cols = run_pipeline(question, dbm)
-            latencies.append(time.perf_counter() - start_time)
-            token_costs.append(count_tokens(pred_sql or "")) 
-        # if pipeline crashes, catch the exception and add one bad test
-        except Exception as e:   # hard failure inside pipeline
-            print(f"[{idx:03}] X Pipeline crashed: {e}")
-            bad += 1
-            mismatch_rows.append(
-                (db_id, question, "pipeline-crash", str(e))
-            )
-            continue
-
-        # pipeline returned None add one bad test
-        if pred_rows is None:
-            print(f"[{idx:03}] X Pipeline produced no answer.")
-            bad += 1
-            mismatch_rows.append(
-                (db_id, question, "pipeline-empty", "")
-            )
-            continue
-
-        # ---- ground-truth execution --------------------------
-        gt_rows, gt_cols, err = execute_query_rows_columns(str(db_path), gt_sql)
-        if err:
-            print(f"[{idx:03}] ! GT SQL failed ({err}); skipping.")
-            continue
-
-        # compare 
-        # F1 for this sample
-        prec, rec, f1 = set_f1(pred_rows, gt_rows)
-        f1_scores.append(f1)
-
-        # accumulate for micro
-        tp_sum += len(set(pred_rows) & set(gt_rows))
-        pred_total += len(set(pred_rows))
-        gt_total += len(set(gt_rows))
-
-        print(f"{db_id} the rows of each output: pipeline {rows_to_multiset(pred_rows)}, true {rows_to_multiset(gt_rows)}")
-
-        correct = ( rows_to_multiset(pred_rows, ignore_pos=True) == rows_to_multiset(gt_rows, ignore_pos=True) )
-
-        tag = "/" if correct else "X"
-        print(f"[{idx:03}] {tag}  {question[:]}")
-
-        if correct:
-            good += 1
-        else:
-            bad += 1
-            mismatch_rows.append(
-                (
-                    db_id,
-                    question,
-                    pred_sql,
-                    gt_sql,
-                    pd.DataFrame(pred_rows, columns=pred_cols).to_json(orient="records"),
-                    pd.DataFrame(gt_rows,   columns=gt_cols).to_json(orient="records"),
-                )
-            )
+    for r in records:
+        if r["status"] == "pipeline-crash":
+            mismatch_rows.append((r["db_id"], r["question"], "pipeline-crash", r["error"]))
+        elif r["status"] == "pipeline-empty":
+            mismatch_rows.append((r["db_id"], r["question"], "pipeline-empty", ""))
+        elif r.get("correct") is False:
+            mismatch_rows.append((r["db_id"], r["question"], r["pred_sql"], r["gt_sql"], r["pred_rows"], r["gt_rows"]))
 
     # ---------- report --------------------------------------
     total = good + bad
@@ -176,7 +244,7 @@ def evaluate(max_samples=MAX_SAMPLES):
     micro_f1   = 2*micro_prec*micro_rec/(micro_prec+micro_rec) if micro_prec+micro_rec else 0.0
 
     avg_latency = sum(latencies)/len(latencies) if latencies else 0.0
-    avg_tokens  = sum(token_costs)/len(token_costs) if token_costs else 0.0
+    latency_pcts = percentiles(latencies)
 
     print("\n-----------------------------")
     print(f"Correct      : {good}")
@@ -184,8 +252,10 @@ def evaluate(max_samples=MAX_SAMPLES):
     print(f"Accuracy     : {accuracy:.2%}")
     print(f"Macro F1     : {macro_f1:.3f}")
     print(f"Micro F1     : {micro_f1:.3f}")
-    print(f"Avg Latency  : {avg_latency:.2f}s")
-    print(f"Avg SQL Tokens: {avg_tokens:.1f}")
+    print(f"Avg Latency  : {avg_latency:.2f}s (p50 {latency_pcts[50]:.2f}s, p95 {latency_pcts[95]:.2f}s, p99 {latency_pcts[99]:.2f}s)")
+    print(f"Avg LLM Tokens: {avg_tokens['total_tokens']:.1f} (in {avg_tokens['input_tokens']:.1f}, out {avg_tokens['output_tokens']:.1f})")
+    for stage, pcts in stage_pcts.items():
+        print(f"  {stage:<22}: p50 {pcts[50]:.2f}s  p95 {pcts[95]:.2f}s  p99 {pcts[99]:.2f}s  ({len(stage_times[stage])}/{len(traces)} samples)")
     print("-----------------------------\n")
 
     # ---------- metrics CSV ------------------------------
@@ -203,10 +273,26 @@ def evaluate(max_samples=MAX_SAMPLES):
         f.write(f"Macro_F1           : {macro_f1:.4f}\n")
         f.write(f"Micro_F1           : {micro_f1:.4f}\n")
         f.write(f"Avg_Latency_sec    : {avg_latency:.3f}\n")
-        f.write(f"Avg_SQL_Tokens     : {avg_tokens:.1f}\n")
+        f.write(f"Latency_p50_sec    : {latency_pcts[50]:.3f}\n")
+        f.write(f"Latency_p95_sec    : {latency_pcts[95]:.3f}\n")
+        f.write(f"Latency_p99_sec    : {latency_pcts[99]:.3f}\n")
+        f.write(f"Avg_Input_Tokens   : {avg_tokens['input_tokens']:.1f}\n")
+        f.write(f"Avg_Output_Tokens  : {avg_tokens['output_tokens']:.1f}\n")
+        f.write(f"Avg_Total_Tokens   : {avg_tokens['total_tokens']:.1f}\n")
+        f.write("\nStage latency (sec per sample that ran the stage)  p50 / p95 / p99  samples\n")
+        for stage, pcts in stage_pcts.items():
+            f.write(f"{stage:<24}: {pcts[50]:.3f} / {pcts[95]:.3f} / {pcts[99]:.3f}  {len(stage_times[stage])}/{len(traces)}\n")
         
     print(f"Metrics saved to {metrics_path}")
 
+    # ---------- per-sample trace ----------------------------
+    trace_path = metrics_path.with_suffix(".trace.jsonl")
+    with open(trace_path, "w", encoding="utf-8") as f:
+        for r in records:
+            if "trace" in r:
+                f.write(json.dumps({"idx": r["idx"], "key": r["key"], "status": r["status"], "latency": r.get("latency"), **r["trace"]}, ensure_ascii=False) + "\n")
+    print(f"Trace written to {trace_path}")
+
     # ---------- mismatches CSV ------------------------------
     if mismatch_rows:
         header = [
@@ -227,7 +313,14 @@ def evaluate(max_samples=MAX_SAMPLES):
 if __name__ == "__main__":
 ## reading the arguments from the command line
     parser = argparse.ArgumentParser(description="Evaluate CHESS pipeline on BIRD subset.")
-    parser.add_argument("--k", type=int, default=MAX_SAMPLES, help="number of questions to sample (<=100)")
+    parser.add_argument("--k", type=int, default=MAX_SAMPLES, help="number of questions to sample")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="number of samples evaluated concurrently")
+    parser.add_argument("--checkpoint", default=str(CHECKPOINT), help="JSONL file where each finished sample is written")
+    parser.add_argument("--resume", action="store_true", help="skip the samples already in the checkpoint")
     parser.add_argument("--out", default="mismatches.csv", help="CSV path for mismatched answers")
+    parser.add_argument("--gt-cache", default=str(CACHE_PATH), help="cache of the gold query results")
+    parser.add_argument("--gt-workers", type=int, default=GT_WORKERS, help="processes executing the gold queries")
+    parser.add_argument("--gt-timeout", type=float, default=GT_TIMEOUT, help="seconds a gold query may run")
     args = parser.parse_args()
-    evaluate(max_samples=min(args.k, MAX_SAMPLES))
+    evaluate(max_samples=args.k, workers=args.workers, checkpoint=args.checkpoint, resume=args.resume,
+             gt_cache_path=args.gt_cache, gt_workers=args.gt_workers, gt_timeout=args.gt_timeout)
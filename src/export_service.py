@@ -0,0 +1,195 @@
+# Streams the result of a query from the database into a file, without holding the rows in memory.
+import csv
+import gzip
+import os
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+
+FETCH_BATCH = 5_000
+PROGRESS_INTERVAL = 0.2     # seconds between progress reports
+FORMATS = ("csv", "csv.gz", "parquet")
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def export_format(path: str) -> str:
+    """The export format of a file name, from its extension."""
+    lower = path.lower()
+    if lower.endswith(".csv.gz") or lower.endswith(".gz"):
+        return "csv.gz"
+    if lower.endswith(".parquet"):
+        return "parquet"
+    return "csv"
+
+
+def export_query(pool, sql: str, path: str, fmt: Optional[str] = None,
+                 progress: Optional[Callable[[int], None]] = None, cancel: Optional[threading.Event] = None) -> int:
+    """
+    Runs `sql` on a connection of `pool` (database_manager.ConnectionPool) and writes its rows to `path`,
+    FETCH_BATCH rows at a time, so memory stays flat whatever the result size.
+    The file is written under a temporary name and only appears once complete.
+
+    Args:
+        fmt: "csv", "csv.gz" or "parquet" (needs pyarrow), from the extension of `path` by default
+        progress: called with the number of rows written so far
+        cancel: set to stop the export, the query is interrupted and ExportCancelled raised
+
+    Returns:
+        the number of rows written
+    """
+    fmt = fmt or export_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt}")
+    cancel = cancel or threading.Event()
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+
+    with pool.connection() as conn:
+        # a cancelled export also interrupts a query still computing its first rows
+        conn.set_progress_handler(lambda: 1 if cancel.is_set() else 0, 10_000)
+        try:
+            cursor = conn.execute(sql)
+            columns = [d[0] for d in cursor.description]
+            writer = _ParquetWriter(tmp, columns) if fmt == "parquet" else _CSVWriter(tmp, columns, compress=fmt == "csv.gz")
+            written, last_report = 0, 0.0
+            try:
+                while True:
+                    batch = cursor.fetchmany(FETCH_BATCH)
+                    if not batch:
+                        break
+                    if cancel.is_set():
+                        raise ExportCancelled()
+                    writer.write(batch)
+                    written += len(batch)
+                    if progress is not None and time.monotonic() - last_report > PROGRESS_INTERVAL:
+                        progress(written)
+                        last_report = time.monotonic()
+            finally:
+                writer.close()
+        except BaseException as e:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if cancel.is_set():
+                raise ExportCancelled() from e
+            raise
+
+    os.replace(tmp, path)
+    if progress is not None:
+        progress(written)
+    return written
+
+
+class _CSVWriter:
+    def __init__(self, path: str, columns: List[str], compress: bool = False):
+        self.file = gzip.open(path, "wt", newline="", encoding="utf-8") if compress else open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    """
+    Writes row batches as Parquet row groups. Column types are inferred from the rows: integers,
+    floats (integers mixed with floats), blobs, anything else as text, null until a value is seen.
+    When a batch holds a value its column type cannot, e.g. a float after integers, the type is widened
+    and the row groups already written are rewritten one at a time, so the query still runs only once.
+    Every batch is cast safely, a value that does not fit raises instead of being truncated.
+    """
+    def __init__(self, path: str, columns: List[str]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow), export as CSV instead.")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        # positional names, result columns can repeat a name
+        self.names = [name if columns.count(name) == 1 else f"{name}_{i}" for i, name in enumerate(columns)]
+        self.schema = None
+        self.writer = None
+
+    def _batch_type(self, values):
+        pa = self.pa
+        kinds = {type(v) for v in values if v is not None}
+        if not kinds:
+            return pa.null()
+        if kinds <= {int, bool}:
+            return pa.int64()
+        if kinds <= {int, bool, float}:
+            return pa.float64()
+        if kinds == {bytes}:
+            return pa.binary()
+        return pa.string()
+
+    def _widen(self, current, new):
+        pa = self.pa
+        if current == new or pa.types.is_null(new):
+            return current
+        if pa.types.is_null(current):
+            return new
+        if {current, new} <= {pa.int64(), pa.float64()}:
+            return pa.float64()
+        return pa.string()
+
+    def _array(self, values, arrow_type, name):
+        pa = self.pa
+        if pa.types.is_string(arrow_type):
+            values = [None if v is None else v if isinstance(v, str) else str(v) for v in values]
+        try:
+            return pa.array(values).cast(arrow_type, safe=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+            raise ValueError(f"Column {name} does not fit its Parquet type {arrow_type}, export as CSV instead.")
+
+    def write(self, rows):
+        pa = self.pa
+        columns = [[row[i] for row in rows] for i in range(len(self.names))]
+        types = [self._batch_type(values) for values in columns]
+        if self.schema is None:
+            schema = pa.schema([pa.field(name, kind) for name, kind in zip(self.names, types)])
+        else:
+            schema = pa.schema([pa.field(f.name, self._widen(f.type, kind)) for f, kind in zip(self.schema, types)])
+        if schema != self.schema:
+            self._rewrite(schema)
+        arrays = [self._array(values, f.type, f.name) for values, f in zip(columns, self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def _rewrite(self, schema):
+        """Switches to `schema`, converting the row groups written so far."""
+        previous = self.schema
+        self.schema = schema
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, schema)
+            return
+        self.writer.close()
+        old_path = self.path + ".old"
+        os.replace(self.path, old_path)
+        try:
+            self.writer = self.pq.ParquetWriter(self.path, schema)
+            old = self.pq.ParquetFile(old_path)
+            for group in range(old.num_row_groups):
+                table = old.read_row_group(group)
+                arrays = [
+                    column if old_field.type == field.type else self._array(column.to_pylist(), field.type, field.name)
+                    for column, old_field, field in zip(table.columns, previous, schema)
+                ]
+                self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=schema))
+            old.close()
+        finally:
+            os.remove(old_path)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            # empty result, still a valid file with the column names
+            pa = self.pa
+            self.pq.write_table(pa.table({name: pa.array([], pa.string()) for name in self.names}), self.path)
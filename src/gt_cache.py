@@ -0,0 +1,139 @@
+# Precomputed results of the BIRD gold queries, so evaluation runs do not re-execute them.
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from result_compare import ResultDigest, digest_query
+
+CACHE_PATH = Path("reports/gt_cache.sqlite")
+GT_TIMEOUT = 120    # seconds a gold query may run before it is given up
+GT_WORKERS = os.cpu_count() or 4
+
+
+def sql_hash(sql: str) -> str:
+    return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+
+def _run_gold(db_id: str, db_path: str, sql: str, timeout_sec: float):
+    """Worker process: executes one gold query and returns its digest or error."""
+    digest, error = digest_query(db_path, sql, timeout_sec=timeout_sec)
+    return db_id, db_path, sql, digest, error
+
+
+class GTCache:
+    """
+    On-disk cache of gold query results, one row per (db_id, sql hash, db file mtime).
+    Only the digest, the distinct row hashes and a few sample rows are stored, never the full result.
+    Safe to share between the evaluation threads.
+
+    Args:
+        path: SQLite file of the cache
+    """
+    def __init__(self, path=CACHE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS gt_results (
+                    db_id TEXT, sql_hash TEXT, db_mtime REAL,
+                    row_count INTEGER, multiset_digest TEXT, row_hashes BLOB,
+                    sample TEXT, columns TEXT, error TEXT, timeout_sec REAL,
+                    PRIMARY KEY (db_id, sql_hash, db_mtime)
+                )""")
+            self._conn.commit()
+
+    def get(self, db_id: str, db_path: str, sql: str, timeout_sec: float = GT_TIMEOUT) -> Optional[Tuple[Optional[ResultDigest], Optional[str]]]:
+        """
+        Returns the cached (digest, error) of a gold query, or None when it must be (re)executed:
+        not cached, database modified since, or a timeout recorded with a shorter limit.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT row_count, multiset_digest, row_hashes, sample, columns, error, timeout_sec "
+                "FROM gt_results WHERE db_id = ? AND sql_hash = ? AND db_mtime = ?",
+                (db_id, sql_hash(sql), os.path.getmtime(db_path)),
+            ).fetchone()
+        if row is None:
+            return None
+        row_count, digest, hashes, sample, columns, error, cached_timeout = row
+        if error == "timeout" and cached_timeout < timeout_sec:
+            return None
+        if error:
+            return None, error
+        return ResultDigest(
+            row_count,
+            int(digest),
+            frozenset(array("Q", hashes)),
+            [tuple(r) for r in json.loads(sample)],
+            json.loads(columns),
+        ), None
+
+    def put(self, db_id: str, db_path: str, sql: str, digest: Optional[ResultDigest], error: Optional[str], timeout_sec: float = GT_TIMEOUT):
+        if digest is None:
+            values = (None, None, None, None, None)
+        else:
+            values = (
+                digest.row_count,
+                str(digest.multiset_digest),   # unsigned 64-bit does not fit an SQLite INTEGER
+                array("Q", sorted(digest.row_hashes)).tobytes(),
+                json.dumps(digest.sample, ensure_ascii=False, default=str),
+                json.dumps(digest.columns, ensure_ascii=False),
+            )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gt_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (db_id, sql_hash(sql), os.path.getmtime(db_path), *values, error, timeout_sec),
+            )
+            self._conn.commit()
+
+    def precompute(self, samples: Iterable[dict], db_root: Path, workers: int = GT_WORKERS, timeout_sec: float = GT_TIMEOUT) -> int:
+        """
+        Executes the gold queries of `samples` that are not cached yet, in parallel processes.
+        Returns the number of queries executed.
+        """
+        pending = {}
+        for item in samples:
+            db_path = db_root / item["db_id"] / f"{item['db_id']}.sqlite"
+            if db_path.exists() and self.get(item["db_id"], str(db_path), item["SQL"], timeout_sec) is None:
+                pending[(item["db_id"], item["SQL"])] = str(db_path)
+        if not pending:
+            return 0
+
+        print(f"Executing {len(pending)} gold queries with {workers} processes (timeout {timeout_sec}s).")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_gold, db_id, db_path, sql, timeout_sec) for (db_id, sql), db_path in pending.items()]
+            for done, future in enumerate(as_completed(futures), 1):
+                db_id, db_path, sql, digest, error = future.result()
+                self.put(db_id, db_path, sql, digest, error, timeout_sec)
+                if error:
+                    print(f"  [{done}/{len(futures)}] ! {db_id}: {error}")
+        return len(pending)
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    # Precompute the whole train set once: python gt_cache.py
+    from evaluate import DB_ROOT, TRAIN_JSON
+
+    parser = argparse.ArgumentParser(description="Execute the BIRD gold queries and cache their results.")
+    parser.add_argument("--workers", type=int, default=GT_WORKERS, help="number of processes")
+    parser.add_argument("--timeout", type=float, default=GT_TIMEOUT, help="seconds per gold query")
+    parser.add_argument("--cache", default=str(CACHE_PATH), help="cache file")
+    args = parser.parse_args()
+
+    with open(TRAIN_JSON, encoding="utf-8") as f:
+        dataset = json.load(f)
+    cache = GTCache(args.cache)
+    executed = cache.precompute(dataset, DB_ROOT, args.workers, args.timeout)
+    print(f"{executed} gold queries executed, cache at {args.cache}")
+    cache.close()
@@ -0,0 +1,283 @@
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Sequence
+
+META_FILE = "meta.json"
+ROWS_FILE = "result.sqlite"
+INSERT_BATCH = 10_000
+MMAP_SIZE = 256 * 1024 * 1024   # bytes of the result file memory-mapped by readers
+
+
+class ResultStore:
+    """
+    Result of one history entry, stored in its directory as:
+      -> meta.json: {"query_id", "query_text", "timestamp", "query_sql", "columns", "row_count"}
+      -> result.sqlite: the rows in a `result` table with positional columns (c0, c1, ...), in query order
+    Reads are paged on the rowid and memory-mapped, so showing a page costs the rows of the page, not the result size.
+    A sorted or filtered view stores only the rowids of its rows, in order, in a temporary table, and is paged the same way.
+    Entries saved as a single `{id}.json` by older versions are converted on first open.
+
+    Args:
+        entry_dir (str): directory of the history entry
+    """
+    def __init__(self, entry_dir: str):
+        self.entry_dir = entry_dir
+        self.meta_path = os.path.join(entry_dir, META_FILE)
+        self.rows_path = os.path.join(entry_dir, ROWS_FILE)
+        if not os.path.exists(self.meta_path):
+            migrate_legacy_entry(entry_dir)
+        self.meta = read_meta(entry_dir)
+        self._conn = None
+        self._view = False   # whether reads go through temp.result_view
+
+    @classmethod
+    def write(cls, entry_dir: str, meta: Dict, columns: Sequence[str], rows: Sequence[Sequence]) -> "ResultStore":
+        """Saves a result, replacing the previous result of the entry. `meta` holds the query fields."""
+        os.makedirs(entry_dir, exist_ok=True)
+        tmp_rows = os.path.join(entry_dir, f"{ROWS_FILE}.tmp")
+        if os.path.exists(tmp_rows):
+            os.remove(tmp_rows)
+
+        conn = sqlite3.connect(tmp_rows)
+        try:
+            conn.execute("PRAGMA journal_mode=OFF;")
+            conn.execute("PRAGMA synchronous=OFF;")
+            names = [f"c{i}" for i in range(len(columns))]
+            # no declared types, values keep the storage class they had in the database
+            conn.execute(f"CREATE TABLE result ({', '.join(names) or 'c0'});")
+            if names:
+                insert = f"INSERT INTO result VALUES ({', '.join('?' * len(names))});"
+                for start in range(0, len(rows), INSERT_BATCH):
+                    conn.executemany(insert, rows[start:start + INSERT_BATCH])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_rows, os.path.join(entry_dir, ROWS_FILE))
+
+        meta = dict(meta, columns=list(columns), row_count=len(rows))
+        write_meta(entry_dir, meta)
+        return cls(entry_dir)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(f"file:{os.path.abspath(self.rows_path)}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+        return self._conn
+
+    @property
+    def columns(self) -> List[str]:
+        return self.meta["columns"]
+
+    @property
+    def row_count(self) -> int:
+        return self.meta["row_count"]
+
+    def read_rows(self, offset: int = 0, limit: int = 100) -> List[tuple]:
+        """Rows [offset, offset + limit) of the result (or of the current view), rowids are dense so this is an index range scan."""
+        if self._view:
+            return self._connection().execute(
+                "SELECT result.* FROM temp.result_view AS v JOIN result ON result.rowid = v.source "
+                "WHERE v.rowid > ? ORDER BY v.rowid LIMIT ?;", (offset, limit)).fetchall()
+        return self._connection().execute(
+            "SELECT * FROM result WHERE rowid > ? ORDER BY rowid LIMIT ?;", (offset, limit)).fetchall()
+
+    def set_view(self, sort_column: Optional[int] = None, descending: bool = False, filter_text: str = "") -> int:
+        """
+        Sorts the rows on one column and keeps those where any value contains `filter_text`,
+        for the following read_rows calls. Returns the number of rows of the view.
+        """
+        conn = self._connection()
+        conn.execute("DROP TABLE IF EXISTS temp.result_view;")
+        self._view = False
+        if sort_column is None and not filter_text:
+            return self.row_count
+
+        where, params = "", ()
+        if filter_text:
+            names = [f"c{i}" for i in range(len(self.columns))]
+            where = "WHERE " + " OR ".join(f"CAST({name} AS TEXT) LIKE ? ESCAPE '\\'" for name in names)
+            pattern = filter_text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params = (f"%{pattern}%",) * len(names)
+        order = f"ORDER BY c{sort_column} {'DESC' if descending else 'ASC'}, rowid" if sort_column is not None else "ORDER BY rowid"
+        conn.execute(f"CREATE TEMP TABLE result_view AS SELECT rowid AS source FROM result {where} {order};", params)
+        self._view = True
+        return conn.execute("SELECT COUNT(*) FROM temp.result_view;").fetchone()[0]
+
+    def iter_rows(self, batch_size: int = INSERT_BATCH) -> Iterator[List[tuple]]:
+        """All the rows, `batch_size` at a time."""
+        cursor = self._connection().execute("SELECT * FROM result ORDER BY rowid;")
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                return
+            yield batch
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def read_meta(entry_dir: str) -> Optional[Dict]:
+    """The metadata of a history entry without opening its rows, None if it has none."""
+    path = os.path.join(entry_dir, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_meta(entry_dir: str, meta: Dict):
+    tmp = os.path.join(entry_dir, f"{META_FILE}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(entry_dir, META_FILE))
+
+
+def legacy_entry_file(entry_dir: str) -> Optional[str]:
+    """The `{id}.json` result file of older versions, if the entry has one."""
+    name = os.path.basename(os.path.normpath(entry_dir))
+    path = os.path.join(entry_dir, f"{name}.json")
+    return path if os.path.exists(path) else None
+
+
+def migrate_legacy_entry(entry_dir: str) -> bool:
+    """Converts an `{id}.json` entry to meta.json + result.sqlite, returns if there was one."""
+    path = legacy_entry_file(entry_dir)
+    if path is None:
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    rows, columns = result.pop("rows"), result.pop("columns")
+    ResultStore.write(entry_dir, result, columns, [tuple(row) for row in rows]).close()
+    os.remove(path)
+    return True
+
+
+CATALOG_FILE = "catalog.sqlite"
+CATALOG_COLUMNS = ("id", "question", "timestamp", "sql", "row_count", "location")
+
+
+class HistoryCatalog:
+    """
+    Index of the history entries of one database, in `{results_directory}/catalog.sqlite`:
+    one row per entry (id, question, timestamp, sql, row_count, location of the entry directory),
+    with full-text search over the questions (FTS5, or LIKE where SQLite is built without it).
+    Listing a page of the history is one indexed query, whatever the number of entries.
+    Entries saved before the catalog existed are imported on first open.
+
+    Args:
+        results_directory (str): directory holding the entry directories of the database
+    """
+    def __init__(self, results_directory: str):
+        self.results_directory = results_directory
+        os.makedirs(results_directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(results_directory, CATALOG_FILE))
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY, question TEXT, timestamp TEXT, sql TEXT, row_count INTEGER, location TEXT
+            );
+            CREATE TABLE IF NOT EXISTS catalog_info (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.has_fts = self._create_fts()
+        self.conn.commit()
+        if self._info("imported") is None:
+            self.import_entries()
+
+    def _create_fts(self) -> bool:
+        try:
+            self.conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(question, content='history', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, question) VALUES (new.id, new.question);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, question) VALUES ('delete', old.id, old.question);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_au AFTER UPDATE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, question) VALUES ('delete', old.id, old.question);
+                    INSERT INTO history_fts (rowid, question) VALUES (new.id, new.question);
+                END;
+            """)
+            return True
+        except sqlite3.OperationalError:   # no FTS5 in this SQLite build
+            return False
+
+    def _info(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM catalog_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def import_entries(self) -> int:
+        """Adds the entry directories missing from the catalog, returns how many were added."""
+        known = {row[0] for row in self.conn.execute("SELECT id FROM history")}
+        added = 0
+        for name in os.listdir(self.results_directory):
+            entry_dir = os.path.join(self.results_directory, name)
+            if not name.isdigit() or int(name) in known or not os.path.isdir(entry_dir):
+                continue
+            meta = read_meta(entry_dir)
+            if meta is None and migrate_legacy_entry(entry_dir):   # saved by an older version
+                meta = read_meta(entry_dir)
+            if meta is None:
+                continue
+            self.add(int(name), meta["query_text"], meta.get("timestamp"), meta["query_sql"], meta.get("row_count"), commit=False)
+            added += 1
+        self.conn.execute("INSERT OR REPLACE INTO catalog_info VALUES ('imported', '1')")
+        self.conn.commit()
+        return added
+
+    def add(self, entry_id: int, question: str, timestamp: Optional[str], sql: str, row_count: Optional[int], commit: bool = True):
+        """Adds an entry, or updates it when the id exists (a provisional result replaced)."""
+        self.conn.execute(
+            "INSERT INTO history VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+            "question = excluded.question, timestamp = excluded.timestamp, sql = excluded.sql, "
+            "row_count = excluded.row_count, location = excluded.location",
+            (entry_id, question, timestamp, sql, row_count, str(entry_id)))
+        if commit:
+            self.conn.commit()
+
+    def remove(self, entry_id: int):
+        self.conn.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM history")
+        self.conn.commit()
+
+    def _search_clause(self, search: Optional[str]):
+        words = (search or "").split()
+        if not words:
+            return "", ()
+        if self.has_fts:
+            # every word as a quoted prefix, so user input is never parsed as FTS syntax
+            match = " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+            return "WHERE id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)", (match,)
+        patterns = tuple("%" + w.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for w in words)
+        return "WHERE " + " AND ".join("question LIKE ? ESCAPE '\\'" for _ in words), patterns
+
+    def page(self, offset: int = 0, limit: int = 50, search: Optional[str] = None) -> List[Dict]:
+        """Entries newest first, optionally only those whose question matches `search`."""
+        where, params = self._search_clause(search)
+        rows = self.conn.execute(
+            f"SELECT {', '.join(CATALOG_COLUMNS)} FROM history {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+            params + (limit, offset))
+        return [dict(zip(CATALOG_COLUMNS, row)) for row in rows]
+
+    def count(self, search: Optional[str] = None) -> int:
+        where, params = self._search_clause(search)
+        return self.conn.execute(f"SELECT COUNT(*) FROM history {where}", params).fetchone()[0]
+
+    def max_id(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0]
+
+    def queries(self) -> List[tuple]:
+        """(question, sql) of every entry."""
+        return self.conn.execute("SELECT question, sql FROM history ORDER BY id").fetchall()
+
+    def entry_dir(self, entry: Dict) -> str:
+        return os.path.join(self.results_directory, entry["location"])
+
+    def close(self):
+        self.conn.close()
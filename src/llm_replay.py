@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import Runnable
+from langchain_groq import ChatGroq
+
+DEFAULT_CASSETTE_DIR = "history/llm_cassettes"
+
+_lock = threading.Lock()
+
+
+def prompt_to_text(prompt: Any) -> str:
+    """Serialises what is passed to `invoke` (prompt value, message list or string) in a stable way."""
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, list):
+        return "\n".join(f"{m.type}: {m.content}" if isinstance(m, BaseMessage) else str(m) for m in prompt)
+    return str(prompt)
+
+
+def cassette_path(cassette_dir: str, model_name: str, temperature: float, prompt: Any) -> str:
+    key = json.dumps({"model": model_name, "temperature": temperature, "prompt": prompt_to_text(prompt)}, sort_keys=True)
+    return os.path.join(cassette_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+
+class RecordingChatModel(Runnable):
+    """
+    Wraps a chat model and saves every prompt and response to `cassette_dir`, one JSON file per prompt.
+    The same prompt asked several times keeps all its responses in order.
+
+    Args:
+        llm: the live chat model
+        model_name (str): name of the model, part of the recording key
+        temperature (float): sampling temperature, part of the recording key
+        cassette_dir (str): directory of the recordings
+    """
+    def __init__(self, llm, model_name: str, temperature: float, cassette_dir: str = DEFAULT_CASSETTE_DIR):
+        self.llm = llm
+        self.model_name = model_name
+        self.temperature = temperature
+        self.cassette_dir = cassette_dir
+
+    def invoke(self, input, config=None, **kwargs):
+        start = time.perf_counter()
+        response = self.llm.invoke(input, config, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        path = cassette_path(self.cassette_dir, self.model_name, self.temperature, input)
+        with _lock:
+            os.makedirs(self.cassette_dir, exist_ok=True)
+            entry = {"model": self.model_name, "temperature": self.temperature, "prompt": prompt_to_text(input), "responses": []}
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            entry["responses"].append({
+                "content": response.content,
+                "response_metadata": getattr(response, "response_metadata", {}) or {},
+                "usage_metadata": getattr(response, "usage_metadata", None),
+                "elapsed": elapsed,
+            })
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(tmp, path)
+        return response
+
+
+class ReplayChatModel(Runnable):
+    """
+    Answers prompts from the recordings of RecordingChatModel without any network access.
+    Repeated prompts get the recorded responses in order, cycling when they run out.
+
+    Args:
+        model_name (str): name of the model, part of the recording key
+        temperature (float): sampling temperature, part of the recording key
+        cassette_dir (str): directory of the recordings
+        latency: seconds to wait before each response, or "recorded" to replay the original durations
+    """
+    def __init__(self, model_name: str, temperature: float, cassette_dir: str = DEFAULT_CASSETTE_DIR, latency: Optional[Any] = None):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.cassette_dir = cassette_dir
+        self.latency = latency
+        self._served = defaultdict(int)
+
+    def invoke(self, input, config=None, **kwargs):
+        path = cassette_path(self.cassette_dir, self.model_name, self.temperature, input)
+        if not os.path.exists(path):
+            raise KeyError(f"No recorded {self.model_name} response for this prompt ({os.path.basename(path)}).")
+        with open(path, "r", encoding="utf-8") as f:
+            responses = json.load(f)["responses"]
+
+        with _lock:
+            recorded = responses[self._served[path] % len(responses)]
+            self._served[path] += 1
+
+        if self.latency == "recorded":
+            time.sleep(recorded.get("elapsed", 0))
+        elif self.latency:
+            time.sleep(float(self.latency))
+
+        return AIMessage(
+            content=recorded["content"],
+            response_metadata=recorded.get("response_metadata") or {},
+            usage_metadata=recorded.get("usage_metadata"),
+        )
+
+
+def get_chat_model(model_name: str, temperature: float, groq_api_key: Optional[str] = None):
+    """
+    Returns the chat model used by the pipeline, configured by environment variables:
+      -> LLM_MODE: live (default) calls the API, record also saves every exchange, replay answers from saved exchanges only.
+      -> LLM_CASSETTE_DIR: directory of the recordings (default history/llm_cassettes).
+      -> LLM_REPLAY_LATENCY: seconds to wait per replayed call, or "recorded" for the original durations.
+    """
+    mode = os.getenv("LLM_MODE", "live")
+    cassette_dir = os.getenv("LLM_CASSETTE_DIR", DEFAULT_CASSETTE_DIR)
+    if mode == "replay":
+        return ReplayChatModel(model_name, temperature, cassette_dir, os.getenv("LLM_REPLAY_LATENCY") or None)
+
+    llm = ChatGroq(groq_api_key=groq_api_key or os.getenv("GROQ_API_KEY"), model_name=model_name, temperature=temperature)
+    if mode == "record":
+        return RecordingChatModel(llm, model_name, temperature, cassette_dir)
+    return llm
@@ -1,17 +1,61 @@
-from sentence_transformers import SentenceTransformer
-import spacy
+import threading
 
+# The libraries are imported with the models, importing torch alone takes seconds
 _embedding_model = None
 _spacy_model = None
+_embedding_lock = threading.Lock()
+_spacy_lock = threading.Lock()
+_embedding_ready = threading.Event()
+_spacy_ready = threading.Event()
+_warmup_threads = []
 
 def get_embedding_model():
     global _embedding_model
-    if _embedding_model is None:
-        _embedding_model = SentenceTransformer('models/embedding_model')
+    with _embedding_lock:
+        if _embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            _embedding_model = SentenceTransformer('models/embedding_model')
+            _embedding_ready.set()
     return _embedding_model
 
 def get_spacy_model():
     global _spacy_model
-    if _spacy_model is None:
-        _spacy_model = spacy.load("models/fuzzy_model") 
+    with _spacy_lock:
+        if _spacy_model is None:
+            import spacy
+            _spacy_model = spacy.load("models/fuzzy_model")
+            _spacy_ready.set()
     return _spacy_model
+
+def _warm_embedding_model():
+    get_embedding_model().encode(["warm up"])
+
+def _warm_spacy_model():
+    get_spacy_model()("warm up")
+
+def start_warmup():
+    """
+    Loads both models concurrently in the background and runs a dummy encode and parse,
+    so the first question does not pay for loading them. Safe to call more than once.
+    A model that fails to load here raises again when the pipeline asks for it.
+    """
+    if _warmup_threads:
+        return
+    for target in (_warm_embedding_model, _warm_spacy_model):
+        thread = threading.Thread(target=_ignore_errors, args=(target,), name=f"warmup{target.__name__}", daemon=True)
+        _warmup_threads.append(thread)
+        thread.start()
+
+def _ignore_errors(target):
+    try:
+        target()
+    except Exception:
+        pass
+
+def models_ready() -> bool:
+    """True once both models are loaded"""
+    return _embedding_ready.is_set() and _spacy_ready.is_set()
+
+def warmup_running() -> bool:
+    """True while the warm-up started by start_warmup is still loading a model"""
+    return any(thread.is_alive() for thread in _warmup_threads)
@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable
+
+# blocking calls that cannot be interrupted (LLM requests) run here, so a cancelled run can return without waiting for them
+_calls = ThreadPoolExecutor(max_workers=8, thread_name_prefix="cancellable-call")
+
+
+class PipelineCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    """
+    Cancels one pipeline run. Stages check it between steps, running SQLite statements are interrupted
+    through the callbacks registered with `interrupting`, and blocking calls made through `run` are abandoned.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def check(self):
+        """Raises PipelineCancelled if the run was cancelled."""
+        if self._event.is_set():
+            raise PipelineCancelled()
+
+    @contextmanager
+    def interrupting(self, callback: Callable[[], None]):
+        """Calls `callback` (e.g. sqlite3.Connection.interrupt) if the run is cancelled within the block."""
+        with self._lock:
+            self._callbacks.append(callback)
+            cancelled = self._event.is_set()
+        if cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.remove(callback)
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """
+        Calls `fn` in a helper thread and returns its result, or raises PipelineCancelled as soon as the run
+        is cancelled. The abandoned call finishes in the background and its result is dropped.
+        """
+        self.check()
+        future = _calls.submit(fn, *args, **kwargs)
+        wake = threading.Event()
+        future.add_done_callback(lambda _: wake.set())
+        with self.interrupting(wake.set):
+            wake.wait()
+        if not future.done():
+            raise PipelineCancelled()
+        return future.result()
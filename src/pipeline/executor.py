@@ -0,0 +1,103 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from pipeline.cancellation import CancellationToken, PipelineCancelled
+
+MAX_PENDING = 4     # questions waiting to run, further submissions are refused
+
+
+class PipelineBusy(Exception):
+    """Raised by PipelineExecutor.submit when the request queue is full."""
+
+
+class PipelineRequest:
+    """
+    One question submitted to the PipelineExecutor.
+    `future` resolves to (query_sql, rows, columns), or to PipelineCancelled if the request was cancelled.
+    """
+    def __init__(self, question: str, db_manager, on_provisional: Optional[Callable] = None):
+        self.question = question
+        self.db_manager = db_manager
+        self.on_provisional = on_provisional
+        self.token = CancellationToken()
+        self.future = Future()
+
+    def cancel(self):
+        """Cancels the request, whether it is still queued or already running."""
+        self.token.cancel()
+
+
+class PipelineExecutor:
+    """
+    Runs questions through the pipeline one at a time on a long-lived thread, in submission order.
+    The thread keeps the models loaded and the pooled connections of each DBManager open between questions,
+    at most `max_pending` questions wait in the queue, and every request can be cancelled through its token.
+
+    Args:
+        max_pending (int): size of the request queue
+    """
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self.requests = queue.Queue(maxsize=max_pending)
+        self.current: Optional[PipelineRequest] = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, question: str, db_manager, on_provisional: Optional[Callable] = None) -> PipelineRequest:
+        """Queues a question, raises PipelineBusy if `max_pending` questions are already waiting."""
+        request = PipelineRequest(question, db_manager, on_provisional)
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            raise PipelineBusy(f"{self.requests.maxsize} questions are already waiting.")
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pipeline-executor", daemon=True)
+                self._thread.start()
+        return request
+
+    def pending(self) -> int:
+        return self.requests.qsize()
+
+    def cancel_all(self):
+        """Cancels the running question and every queued one."""
+        current = self.current
+        if current is not None:
+            current.cancel()
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            request.cancel()
+            request.future.set_exception(PipelineCancelled())
+
+    def _run(self):
+        from run_pipeline import run_pipeline   # imported on the executor thread, it loads the pipeline modules
+
+        while True:
+            request = self.requests.get()
+            if request.token.cancelled:
+                request.future.set_exception(PipelineCancelled())
+                continue
+            self.current = request
+            try:
+                result = run_pipeline(request.question, request.db_manager,
+                                      on_provisional=request.on_provisional, cancel_token=request.token)
+            except BaseException as e:
+                request.future.set_exception(PipelineCancelled() if request.token.cancelled else e)
+            else:
+                request.future.set_result(result)
+            finally:
+                self.current = None
+
+
+_executor = None
+
+def get_pipeline_executor() -> PipelineExecutor:
+    """Executor shared by the whole app, started on first use."""
+    global _executor
+    if _executor is None:
+        _executor = PipelineExecutor()
+    return _executor
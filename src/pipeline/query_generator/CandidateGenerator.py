@@ -1,5 +1,4 @@
 import sqlite3
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
 import os
 from dotenv import load_dotenv
@@ -9,19 +8,17 @@ import time
 from Params import *
 from database_manager import DBManager
 from pipeline.query_generator.Promots import *
+from pipeline.query_generator.SQLParser import parse_sql, normalize_sql, escape_apostrophes
+from pipeline.query_generator.QueryChecker import ColumnIndex, repair_query
+from pipeline.query_generator.QueryPlanner import check_cost
+from tracer import StageTracer
+from llm_replay import get_chat_model
+from pipeline.cancellation import CancellationToken
 from pipeline.question_processing.schema_selector import *
 
 load_dotenv()
 groq_api_key = os.getenv('GROQ_API_KEY')
 
-FORBIDDEN_TOKENS = re.compile(
-    r"\b("
-    r"INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|CREATE|REPLACE|MERGE|"
-    r"GRANT|REVOKE|PRAGMA|ATTACH|DETACH|EXEC|EXECUTE|CALL"
-    r")\b",
-    flags=re.I,
-)
-
 class CandidateGenerator:
     """
     CandidateGenerator (CG) synthesizes SQL queries to answer a natural language question.
@@ -31,9 +28,11 @@ class CandidateGenerator:
       -> revise_query: Revises the SQL query if execution produces an error or empty result or timeout. until it finds a working query or reaches the maximum number of revisions.
     """
     
-    def __init__(self, llm, max_revisions=MAX_REVISIONS):
+    def __init__(self, llm, max_revisions=MAX_REVISIONS, tracer=None, cancel_token=None):
         self.llm = llm
         self.max_revisions = max_revisions
+        self.tracer = tracer or StageTracer()
+        self.cancel_token = cancel_token or CancellationToken()
 
         # Prompt that is generating the candidate SQL query.
         self.gen_prompt = PromptTemplate(
@@ -53,11 +52,13 @@ class CandidateGenerator:
 
 
     def generate_candidate_query(self, question, schema, context):
-        response = self.gen_chain.invoke({
-            "question": question,
-            "schema": schema,
-            "context": context
-        })
+        with self.tracer.stage("generation"):
+            response = self.cancel_token.run(self.gen_chain.invoke, {
+                "question": question,
+                "schema": schema,
+                "context": context
+            })
+        self.tracer.record_llm(response)
         if hasattr(response, "content"):
             response = response.content
         # Clean the output to remove any markdown formatting or code fences
@@ -65,13 +66,15 @@ class CandidateGenerator:
         return response
 
     def revise_query(self, question, schema, context, faulty_query, error_description):
-        response = self.revise_chain.invoke({
-            "question": question,
-            "schema": schema,
-            "context": context,
-            "faulty_query": faulty_query,
-            "error_description": error_description
-        })
+        with self.tracer.stage("revision"):
+            response = self.cancel_token.run(self.revise_chain.invoke, {
+                "question": question,
+                "schema": schema,
+                "context": context,
+                "faulty_query": faulty_query,
+                "error_description": error_description
+            })
+        self.tracer.record_llm(response)
         if hasattr(response, "content"):
             response = response.content
         # Clean the output to remove any markdown formatting or code fences
@@ -82,34 +85,16 @@ class CandidateGenerator:
 
 def is_safe_select(sql: str) -> bool:
     """
-    Return True iff `sql` appears to be a single read-only statement.
+    Return True iff `sql` is a single read-only statement.
     Rules
     -----
-    1. First non-comment token must be SELECT or WITH.
-    2. No forbidden keywords (DML / DDL / admin) anywhere outside strings.
-    3. At most one semicolon, and only as the final char (optional).
+    1. The statement is a SELECT, or a WITH clause whose main statement is a SELECT.
+    2. Exactly one statement, an optional trailing semicolon is allowed.
+    3. No calls to functions that touch the file system or load extensions.
+    Keywords inside strings, quoted identifiers and function names (e.g. replace()) are not rejected,
+    as the check works on SQLite tokens instead of raw text. Results are memoized per normalized SQL.
     """
-
-    # strip leading comments / whitespace
-    sql_no_comments = re.sub(r"--.*?$|/\*.*?\*/", "", sql, flags=re.S | re.M).strip()
-
-    # first word must be SELECT or WITH 
-    # (case-insensitive, but we convert it to upper-case for consistency)
-    first_word = re.match(r"^\s*(\w+)", sql_no_comments, flags=re.I)
-    if not first_word or first_word.group(1).upper() not in {"SELECT", "WITH"}:
-        return False
-
-    # search inside forbidden tokens 
-    if FORBIDDEN_TOKENS.search(sql_no_comments):
-        return False
-
-    parts = re.split(r";", sql_no_comments)
-    if len(parts) > 2:                       # more than one semicolon return false
-        return False
-    if len(parts) == 2 and parts[1].strip(): # trailing text after last semicolon
-        return False
-
-    return True
+    return parse_sql(sql).is_read_only
 
 def clean_sql(sql_str: str) -> str:
     """
@@ -117,6 +102,7 @@ def clean_sql(sql_str: str) -> str:
     1. Removes code fences (```) and extractes the content inside them.
     2. Removing <think> tags and their content if there was any.
     3. Replacing smart quotes with standard quotes.
+    4. Escaping apostrophes inside string literals.
     """
     fence = re.search(r"```(?:\w+)?\s*(.*?)\s*```", sql_str, flags=re.S)
     if fence:
@@ -132,31 +118,17 @@ def clean_sql(sql_str: str) -> str:
     sql_str = sql_str.translate(quote_map)
 
 
-    def _escape_in_literal(match: re.Match) -> str:
-        """
-        Receives a single-quoted literal (e.g.  'McDonald's')
-        and doubles any *un-escaped* apostrophes inside it.
-        Already-doubled quotes remain doubled.
-        """
-        literal = match.group(0)          # full match including outer quotes
-        body = literal[1:-1]              # strip leading ands trailing quote
-
-        sentinel = "\x00"                 # temp placeholder unlikely in text
-        body = body.replace("''", sentinel)   # protect correctly-escaped ones
-        body = body.replace("'", "''")        # escape the rest
-        body = body.replace(sentinel, "''")   # restore originals man
-
-        return f"'{body}'"
-
-    sql_str = re.sub(r"'[^']*'", _escape_in_literal, sql_str, flags=re.S)
+    sql_str = escape_apostrophes(sql_str)
 
     return sql_str.strip()
 
-def execute_query(db_path, query, timeout_sec: int = 10):
+def execute_query(db_path, query, timeout_sec: int = 10, cancel_token=None):
     """
-    Execute a SQL query within a time limit.
+    Execute a SQL query within a time limit, returns (rows, columns, error).
+    The query is interrupted if `cancel_token` is cancelled, the error is then "cancelled".
     """
     conn = sqlite3.connect(db_path)
+    cancel_token = cancel_token or CancellationToken()
     try:
         start = time.time()
 
@@ -167,37 +139,49 @@ def execute_query(db_path, query, timeout_sec: int = 10):
         conn.set_progress_handler(_watchdog, 1_000)
 
         cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
+        with cancel_token.interrupting(conn.interrupt):
+            cursor.execute(query)
+            results = cursor.fetchall()
         conn.commit()
-        return results, None
+        return results, [d[0] for d in cursor.description], None
 
     except sqlite3.OperationalError as e:
         # The handler aborts the query with "interrupted". and we catch it here.
         if "interrupted" in str(e).lower():
-            return None, "timeout"
-        return None, str(e)
+            return None, None, "cancelled" if cancel_token.cancelled else "timeout"
+        return None, None, str(e)
 
     finally:
         conn.set_progress_handler(None, 0)   # clear handler so it doesn't linger
         conn.close()
 
 
-def execute_query_rows_columns(db_path, query):
+def execute_query_rows_columns(db_path, query, cancel_token=None, pool=None):
     """
     Execute a SQL query and return the rows and columns.
+    With `pool` (database_manager.ConnectionPool) a pooled read-only connection is used instead of a new one.
+    The query is interrupted if `cancel_token` is cancelled.
     """
+    cancel_token = cancel_token or CancellationToken()
+    if pool is not None:
+        with pool.connection() as conn:
+            return _rows_columns(conn, query, cancel_token)
     conn = sqlite3.connect(db_path)
+    try:
+        return _rows_columns(conn, query, cancel_token)
+    finally:
+        conn.close()
+
+def _rows_columns(conn, query, cancel_token):
     cursor = conn.cursor()
     try:
-        cursor.execute(query)
-        rows    = cursor.fetchall()
+        with cancel_token.interrupting(conn.interrupt):
+            cursor.execute(query)
+            rows    = cursor.fetchall()
         columns = [d[0] for d in cursor.description] 
         return rows, columns, None
     except Exception as e:
-        return None, None, str(e)
-    finally:
-        conn.close()
+        return None, None, "cancelled" if cancel_token.cancelled else str(e)
 
 def get_schema_and_context(db_path):
     """
@@ -234,40 +218,80 @@ def get_schema_and_context(db_path):
     context_str = f"The database contains the following tables: {', '.join(table_names)}."
     return schema_str, context_str
 
-def run_candidate_generator(question, db_path, schema, num_candidates=3):
+def check_and_execute(db_path, query, conn, column_index, tracer=None, cancel_token=None):
+    """
+    Validates the query with EXPLAIN before running it, fixing obvious typos in identifiers.
+    Queries that still fail to compile, or whose plan is estimated too expensive, are not executed.
+
+    Returns:
+        (query, results, columns, error): the possibly repaired query and its execution result
+    """
+    tracer = tracer or StageTracer()
+    with tracer.stage("prevalidation"):
+        query, error = repair_query(conn, query, column_index)
+        if error is None:
+            error = check_cost(conn, db_path, query)
+    if error is not None:
+        return query, None, None, error
+    with tracer.stage("execution"):
+        results, columns, error = execute_query(db_path, query, cancel_token=cancel_token)
+    return query, results, columns, error
+
+def run_candidate_generator(question, db_path, schema, num_candidates=3, on_candidate=None, full_schema=None, tracer=None, value_hints="", cancel_token=None):
     """
     this function generates N candidate SQL queries for a given question using the CandidateGenerator class.
+    Returns a (query, results, columns, error) tuple per candidate.
+    If `on_candidate` is given, it is called with (query, results, columns, error) as soon as each candidate is final,
+    so callers can act on early candidates while the rest are still being generated.
+    Misspelled identifiers are repaired against `full_schema` (defaults to `schema`) before asking the LLM for a revision.
+    Time spent in each stage and token usage are recorded in `tracer` if given.
+    `value_hints` (columns holding the values mentioned in the question) are added to the context.
+    Raises PipelineCancelled as soon as `cancel_token` is cancelled, interrupting the running LLM call or query.
     """
+    tracer = tracer or StageTracer()
+    cancel_token = cancel_token or CancellationToken()
     # Load schema and context from the database
     _, context = get_schema_and_context(db_path)
-    llm = ChatGroq(groq_api_key=groq_api_key, model_name=CANDIDATE_MODEL, temperature=0)
-    candidate_generator = CandidateGenerator(llm=llm)
+    if value_hints:
+        context = f"{context} {value_hints}"
+    llm = get_chat_model(CANDIDATE_MODEL, temperature=0, groq_api_key=groq_api_key)
+    candidate_generator = CandidateGenerator(llm=llm, tracer=tracer, cancel_token=cancel_token)
+    column_index = ColumnIndex(full_schema or schema)
+    check_conn = sqlite3.connect(db_path)
     
     all_candidates = []
     # Generate N candidate queries
-    for i in range(num_candidates):
-        candidate_query = candidate_generator.generate_candidate_query(question, schema, context)
-        if not is_safe_select(candidate_query):
-            break
-
-        results, error = execute_query(db_path, candidate_query)
-        revision_count = 0
-        # If the query execution fails or returns empty results, revise the query until it succeeds or reaches the maximum number of revisions.
-        while (error is not None or (results is not None and len(results) == 0)) and revision_count < candidate_generator.max_revisions:
-            issue_description = error if error is not None else "Empty result returned"
-            
-            candidate_query = candidate_generator.revise_query(
-                question=question,
-                schema=schema,
-                context=context,
-                faulty_query=candidate_query,
-                error_description=issue_description
-            )
-
-            
-            results, error = execute_query(db_path, candidate_query)
-            revision_count += 1
-
-        all_candidates.append((candidate_query, results, error))
-
+    try:
+        with cancel_token.interrupting(check_conn.interrupt):   # a cancel also stops EXPLAIN checks
+            for i in range(num_candidates):
+                candidate_query = candidate_generator.generate_candidate_query(question, schema, context)
+                if not is_safe_select(candidate_query):
+                    break
+
+                candidate_query, results, columns, error = check_and_execute(db_path, candidate_query, check_conn, column_index, tracer, cancel_token)
+                cancel_token.check()
+                revision_count = 0
+                # If the query execution fails or returns empty results, revise the query until it succeeds or reaches the maximum number of revisions.
+                while (error is not None or (results is not None and len(results) == 0)) and revision_count < candidate_generator.max_revisions:
+                    issue_description = error if error is not None else "Empty result returned"
+                    
+                    candidate_query = candidate_generator.revise_query(
+                        question=question,
+                        schema=schema,
+                        context=context,
+                        faulty_query=candidate_query,
+                        error_description=issue_description
+                    )
+
+                    
+                    candidate_query, results, columns, error = check_and_execute(db_path, candidate_query, check_conn, column_index, tracer, cancel_token)
+                    cancel_token.check()
+                    revision_count += 1
+
+                all_candidates.append((candidate_query, results, columns, error))
+                if on_candidate is not None:
+                    on_candidate(candidate_query, results, columns, error)
+    finally:
+        check_conn.close()
     return all_candidates
+
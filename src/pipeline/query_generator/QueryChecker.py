@@ -0,0 +1,112 @@
+import re
+import sqlite3
+from typing import Dict, Optional, Tuple
+from fuzzywuzzy import fuzz
+
+from pipeline.query_generator.SQLParser import tokenize_sql, unquote_identifier, quote_identifier
+
+MISSING_IDENTIFIER = re.compile(r"no such (column|table): (.+)$", flags=re.I)
+SEPARATORS = re.compile(r"[\s_\-]+")
+
+
+class ColumnIndex:
+    """
+    Case-insensitive lookup of the tables and columns of a schema, used to repair misspelled identifiers.
+
+    Args:
+        schema (dict): schema as in DBManager.schema, {table: {column: description}}
+    """
+    def __init__(self, schema: Dict[str, Dict[str, str]]):
+        self.tables = {table.lower(): table for table in schema}
+        self.columns = {table.lower(): {col.lower(): col for col in cols} for table, cols in schema.items()}
+        self.all_columns = {col.lower(): col for cols in schema.values() for col in cols}
+
+    def closest_table(self, name: str, threshold: int = 85) -> Optional[str]:
+        return self._closest(name, self.tables, threshold)
+
+    def closest_column(self, name: str, table: Optional[str] = None, threshold: int = 85) -> Optional[str]:
+        """
+        Returns the column name closest to `name`, only searching `table` if it is a known table.
+        Returns None if no column is close enough or if two columns are equally close.
+        """
+        columns = self.columns.get(table.lower(), self.all_columns) if table else self.all_columns
+        return self._closest(name, columns, threshold)
+
+    @staticmethod
+    def _closest(name: str, names: Dict[str, str], threshold: int) -> Optional[str]:
+        # Separators are ignored, so "release_year" still matches "release year"
+        name = SEPARATORS.sub("", name.lower())
+        scores = sorted(((fuzz.ratio(name, SEPARATORS.sub("", key)), key) for key in names), reverse=True)
+        if not scores or scores[0][0] < threshold:
+            return None
+        if len(scores) > 1 and scores[1][0] == scores[0][0]:
+            return None   # ambiguous, let the LLM decide
+        return names[scores[0][1]]
+
+
+def explain_error(conn: sqlite3.Connection, sql: str) -> Optional[str]:
+    """
+    Compiles `sql` with EXPLAIN, which prepares the statement and resolves every identifier
+    without reading any rows. Returns the error message, or None if the query is valid.
+    """
+    try:
+        conn.execute(f"EXPLAIN {sql}").fetchall()
+        return None
+    except sqlite3.Error as e:
+        return str(e)
+
+
+def replace_identifier(sql: str, name: str, replacement: str, qualifier: Optional[str] = None) -> str:
+    """
+    Replaces every reference to the identifier `name` (optionally `qualifier.name`) in `sql`,
+    leaving string literals and the rest of the formatting untouched.
+    """
+    tokens = tokenize_sql(sql)
+    targets = []
+    for i, token in enumerate(tokens):
+        if token.kind not in ("word", "identifier") or unquote_identifier(token).lower() != name.lower():
+            continue
+        if qualifier is not None:
+            if i < 2 or tokens[i - 1].value != "." or unquote_identifier(tokens[i - 2]).lower() != qualifier.lower():
+                continue
+        targets.append(token)
+
+    for token in reversed(targets):
+        sql = sql[:token.start] + quote_identifier(replacement) + sql[token.start + len(token.value):]
+    return sql
+
+
+def repair_query(conn: sqlite3.Connection, sql: str, index: ColumnIndex, max_repairs: int = 3) -> Tuple[str, Optional[str]]:
+    """
+    Checks `sql` before it is executed and fixes obvious typos in table and column names
+    using the closest names in `index`.
+
+    Returns:
+        (sql, error): the possibly repaired query, and the error left if it could not be repaired
+    """
+    error = explain_error(conn, sql)
+    for _ in range(max_repairs):
+        if error is None:
+            break
+        match = MISSING_IDENTIFIER.search(error)
+        if not match:
+            break
+        kind, name = match.group(1).lower(), match.group(2).strip()
+
+        qualifier = None
+        if kind == "column" and "." in name:
+            qualifier, name = name.rsplit(".", 1)
+
+        if kind == "table":
+            replacement = index.closest_table(name)
+        else:
+            replacement = index.closest_column(name, table=qualifier)
+        if replacement is None or replacement.lower() == name.lower():
+            break
+
+        repaired = replace_identifier(sql, name, replacement, qualifier)
+        if repaired == sql:
+            break
+        sql = repaired
+        error = explain_error(conn, sql)
+    return sql, error
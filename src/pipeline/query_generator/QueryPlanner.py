@@ -0,0 +1,323 @@
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from Params import MAX_QUERY_COST
+from history_store import CATALOG_FILE, HistoryCatalog, read_meta, legacy_entry_file
+from pipeline.query_generator.SQLParser import tokenize_sql, unquote_identifier
+
+PLAN_TABLE = re.compile(r"^(SCAN|SEARCH)(?: TABLE)? (\S+)")
+PLAN_DERIVED = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (.+)$")   # subqueries and CTEs later scanned by name
+COMPARISONS = {"=", "==", "<", ">", "<=", ">=", "<>", "!="}
+COMPARISON_WORDS = {"IN", "LIKE", "GLOB", "BETWEEN", "IS"}
+CLAUSE_WORDS = {
+    "WHERE", "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER",
+    "GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW", "UNION", "EXCEPT", "INTERSECT", "INDEXED", "NOT",
+}
+
+DEFAULT_ROWS = 1000     # rows assumed for names without statistics (views, unresolved aliases)
+SEARCH_FANOUT = 10      # rows assumed to match an index lookup
+MIN_INDEX_ROWS = 10_000 # tables smaller than this are not worth an index
+
+_row_counts_cache: Dict[Tuple[str, float], Dict[str, int]] = {}
+
+
+class PlanReport(NamedTuple):
+    cost: float             # estimated number of rows visited
+    full_scans: List[str]   # tables read without an index
+    temp_btrees: int        # sorts / distincts that need a temporary b-tree
+    correlated: int         # correlated subqueries re-run for every outer row
+    details: List[str]      # raw EXPLAIN QUERY PLAN lines
+
+
+class IndexSuggestion(NamedTuple):
+    table: str
+    column: str
+    statement: str          # CREATE INDEX statement to apply offline
+
+
+def table_row_counts(conn: sqlite3.Connection, db_path: str = None) -> Dict[str, int]:
+    """
+    Estimates the number of rows of every table without counting them:
+    uses sqlite_stat1 when ANALYZE was run, otherwise max(rowid) which is a single b-tree lookup.
+    Cached per database file and modification time.
+    """
+    key = (os.path.abspath(db_path), os.path.getmtime(db_path)) if db_path else None
+    if key in _row_counts_cache:
+        return _row_counts_cache[key]
+
+    counts = {}
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")]
+    try:
+        for table, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1 WHERE idx IS NULL OR idx = tbl;"):
+            counts[table] = int(stat.split()[0])
+    except sqlite3.Error:
+        pass   # no ANALYZE statistics
+
+    for table in tables:
+        if table in counts:
+            continue
+        try:
+            counts[table] = conn.execute(f'SELECT max(rowid) FROM "{table}";').fetchone()[0] or 0
+        except sqlite3.Error:
+            counts[table] = DEFAULT_ROWS   # WITHOUT ROWID table
+
+    if key is not None:
+        _row_counts_cache[key] = counts
+    return counts
+
+
+def plan_report(conn: sqlite3.Connection, sql: str, row_counts: Dict[str, int]) -> PlanReport:
+    """
+    Runs EXPLAIN QUERY PLAN on `sql` and estimates its cost as the number of rows it visits:
+    a SCAN reads the whole table, a SEARCH reads about log(n) pages, nested loops multiply
+    and correlated subqueries run once per outer row.
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    # Plans name tables and CTEs by their alias, map them back to real tables or CTEs
+    derived_names = {_plan_name(m.group(1)): _plan_name(m.group(1)) for m in map(PLAN_DERIVED.match, (row[3] for row in plan)) if m}
+    tables = {table.lower(): table for table in row_counts}
+    tables.update(_table_aliases(sql, {**derived_names, **tables}))
+    children = defaultdict(list)
+    for node_id, parent, _, detail in plan:
+        children[parent].append((node_id, detail))
+
+    full_scans, counters = [], {"temp": 0, "correlated": 0}
+    derived_rows = {}   # rows produced by each materialized subquery or co-routine, estimated from its own plan
+
+    def subtree_cost(node, outer_loops):
+        """Returns (rows visited, rows produced per outer loop) of the children of `node`."""
+        cost, loops = 0.0, outer_loops
+        scanned, parts_rows = False, 0.0
+        for child, detail in children.get(node, []):
+            match = PLAN_TABLE.match(detail)
+            if detail.startswith("SCAN CONSTANT ROW"):
+                continue
+            if match:
+                name = _plan_name(match.group(2))
+                table = tables.get(name)
+                if table in derived_rows or name in derived_rows:
+                    rows = derived_rows.get(table, derived_rows.get(name))
+                else:
+                    rows = row_counts.get(table, DEFAULT_ROWS)
+                if match.group(1) == "SCAN" and table in row_counts:
+                    full_scans.append(table)
+                if match.group(1) == "SCAN":
+                    cost += loops * rows
+                    loops *= max(rows, 1)
+                else:
+                    cost += loops * math.log2(rows + 2)
+                    loops *= min(SEARCH_FANOUT, max(rows, 1))
+                scanned = True
+                cost += subtree_cost(child, loops)[0]
+            elif "TEMP B-TREE" in detail:
+                counters["temp"] += 1
+                cost += loops * math.log2(loops + 2)
+                if children.get(child):   # e.g. "UNION USING TEMP B-TREE", a part of a compound select
+                    child_cost, child_rows = subtree_cost(child, 1)
+                    cost += child_cost
+                    parts_rows += child_rows
+            elif detail.startswith("CORRELATED"):
+                counters["correlated"] += 1
+                cost += subtree_cost(child, loops)[0]
+            else:   # subqueries, compound selects, co-routines run once
+                child_cost, child_rows = subtree_cost(child, 1)
+                cost += child_cost
+                derived = PLAN_DERIVED.match(detail)
+                if derived:
+                    derived_rows[_plan_name(derived.group(1))] = child_rows
+                else:   # parts of a compound select add up
+                    parts_rows += child_rows
+        return cost, loops / outer_loops if scanned else parts_rows
+
+    cost = subtree_cost(0, 1)[0]
+    return PlanReport(cost, full_scans, counters["temp"], counters["correlated"], [row[3] for row in plan])
+
+
+def _plan_name(name: str) -> str:
+    return name.strip('"[]`').lower()
+
+
+def _table_aliases(sql: str, tables: Dict[str, str]) -> Dict[str, str]:
+    """Maps the aliases in `sql` (lower-cased) to the real table names, e.g. "movies AS T1" -> {"t1": "movies"}."""
+    tokens = tokenize_sql(sql)
+    aliases = {}
+    for i, token in enumerate(tokens[:-1]):
+        table = tables.get(unquote_identifier(token).lower()) if token.kind in ("word", "identifier") else None
+        if table is None:
+            continue
+        alias = tokens[i + 1]
+        if alias.kind == "word" and alias.value.upper() == "AS" and i + 2 < len(tokens):
+            alias = tokens[i + 2]
+        elif alias.kind == "word" and alias.value.upper() in CLAUSE_WORDS:
+            continue
+        if alias.kind in ("word", "identifier"):
+            aliases[unquote_identifier(alias).lower()] = table
+    return aliases
+
+
+def describe_plan(report: PlanReport) -> str:
+    """Human readable reason used when a query is rejected, also given to the LLM for revision."""
+    parts = [f"Query is too expensive (about {report.cost:,.0f} row visits)"]
+    if report.full_scans:
+        parts.append(f"full scans of {', '.join(sorted(set(report.full_scans)))}")
+    if report.correlated:
+        parts.append(f"{report.correlated} correlated subquer{'y' if report.correlated == 1 else 'ies'} re-run for every row")
+    if report.temp_btrees:
+        parts.append(f"{report.temp_btrees} temporary sort b-tree(s)")
+    return "; ".join(parts) + ". Rewrite it with joins or filters on indexed columns."
+
+
+def check_cost(conn: sqlite3.Connection, db_path: str, sql: str, max_cost: float = MAX_QUERY_COST):
+    """
+    Returns an error description if the estimated cost of `sql` is above `max_cost`, else None.
+    """
+    try:
+        report = plan_report(conn, sql, table_row_counts(conn, db_path))
+    except sqlite3.Error as e:
+        return str(e)
+    if report.cost > max_cost:
+        return describe_plan(report)
+    return None
+
+
+def rank_candidates(db_path: str, queries: Sequence[str], max_cost: float = MAX_QUERY_COST) -> List[str]:
+    """
+    Orders candidate queries from cheapest to most expensive plan (stable for equal costs)
+    and drops the ones above `max_cost`, unless that would drop all of them.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        row_counts = table_row_counts(conn, db_path)
+        costs = []
+        for query in queries:
+            try:
+                costs.append(plan_report(conn, query, row_counts).cost)
+            except sqlite3.Error:
+                costs.append(math.inf)
+    finally:
+        conn.close()
+
+    order = sorted(range(len(queries)), key=costs.__getitem__)
+    kept = [queries[i] for i in order if costs[i] <= max_cost]
+    return kept or [queries[i] for i in order]
+
+
+class IndexAdvisor:
+    """
+    Suggests indexes for the columns that queries filter or join on while the plan scans the whole table.
+    Suggestions are printed as CREATE INDEX statements for an admin to apply offline,
+    nothing is written to the database.
+
+    Args:
+        db_path (str): path to the database file
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.row_counts = table_row_counts(self.conn, db_path)
+        self.columns = {}
+        self.indexed = defaultdict(set)   # columns that already lead an index
+        for table in self.row_counts:
+            table_info = self.conn.execute(f'PRAGMA table_info("{table}");').fetchall()
+            self.columns[table] = {row[1].lower(): row[1] for row in table_info}
+            self.indexed[table].update(row[1].lower() for row in table_info if row[5] == 1)
+            for idx in self.conn.execute(f'PRAGMA index_list("{table}");'):
+                first = self.conn.execute(f'PRAGMA index_info("{idx[1]}");').fetchone()
+                if first and first[2]:
+                    self.indexed[table].add(first[2].lower())
+
+    def suggest(self, sql: str) -> List[IndexSuggestion]:
+        """Returns the indexes that would turn the large full scans of `sql` into searches."""
+        try:
+            report = plan_report(self.conn, sql, self.row_counts)
+        except sqlite3.Error:
+            return []
+        predicate_columns = self._predicate_columns(sql)
+
+        suggestions = []
+        for table in dict.fromkeys(report.full_scans):
+            if self.row_counts.get(table, 0) < MIN_INDEX_ROWS:
+                continue
+            for column in predicate_columns:
+                col = self.columns[table].get(column)
+                if col is None or column in self.indexed[table]:
+                    continue
+                name = re.sub(r"\W+", "_", f"idx_{table}_{col}")
+                statement = f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ("{col}");'
+                suggestions.append(IndexSuggestion(table, col, statement))
+        return suggestions
+
+    def advise_history(self, history: Iterable[Tuple[str, str]]) -> List[Tuple[IndexSuggestion, List[str]]]:
+        """
+        Aggregates suggestions over past (question, sql) pairs.
+        Returns (suggestion, questions that would benefit), most useful first.
+        """
+        benefits = defaultdict(list)
+        for question, sql in history:
+            for suggestion in self.suggest(sql):
+                benefits[suggestion].append(question)
+        return sorted(benefits.items(), key=lambda item: len(item[1]), reverse=True)
+
+    @staticmethod
+    def _predicate_columns(sql: str) -> set:
+        """Names (lower-cased) of the identifiers compared in WHERE / ON / HAVING clauses."""
+        tokens = tokenize_sql(sql)
+        columns = set()
+        for i, token in enumerate(tokens):
+            if token.kind not in ("word", "identifier"):
+                continue
+            after = tokens[i + 1] if i + 1 < len(tokens) else None
+            before = tokens[i - 1] if i > 0 else None
+            compared = (
+                (after is not None and (after.value in COMPARISONS or after.value.upper() in COMPARISON_WORDS))
+                or (before is not None and before.value in COMPARISONS)
+            )
+            if compared:
+                columns.add(unquote_identifier(token).lower())
+        return columns
+
+
+def load_history(results_directory: str) -> List[Tuple[str, str]]:
+    """Reads the (question, sql) pairs saved by the app for one database."""
+    if os.path.exists(os.path.join(results_directory, CATALOG_FILE)):
+        catalog = HistoryCatalog(results_directory)
+        try:
+            return [tuple(row) for row in catalog.queries()]
+        finally:
+            catalog.close()
+
+    history = []
+    for entry_dir in glob.glob(os.path.join(results_directory, "*", "")):
+        result = read_meta(entry_dir)
+        if result is None and legacy_entry_file(entry_dir):   # saved by an older version
+            with open(legacy_entry_file(entry_dir), "r", encoding="utf-8") as f:
+                result = json.load(f)
+        if result is not None:
+            history.append((result["query_text"], result["query_sql"]))
+    return history
+
+
+if __name__ == "__main__":
+    # Run from src/: python -m pipeline.query_generator.QueryPlanner <db_path>
+    parser = argparse.ArgumentParser(description="Suggest indexes for the questions asked about a database.")
+    parser.add_argument("db_path", help="path to the SQLite database")
+    parser.add_argument("--history", help="query_results directory of the database (default: the app history)")
+    args = parser.parse_args()
+
+    from database_manager import history_dir_for
+
+    advisor = IndexAdvisor(args.db_path)
+    history = load_history(args.history or f"{history_dir_for(args.db_path)}/query_results")
+
+    for suggestion, questions in advisor.advise_history(history):
+        print(suggestion.statement)
+        print(f"  -- would help {len(questions)} past question(s):")
+        for question in questions:
+            print(f"  --   {question}")
@@ -0,0 +1,259 @@
+from functools import lru_cache
+from typing import List, NamedTuple
+
+# Functions that can touch the file system or load code even inside a SELECT
+UNSAFE_FUNCTIONS = {"LOAD_EXTENSION", "WRITEFILE", "READFILE", "EDIT", "FTS3_TOKENIZER"}
+
+# Keywords that start the main statement after a WITH clause
+MAIN_STATEMENTS = {"SELECT", "VALUES", "INSERT", "UPDATE", "DELETE", "REPLACE"}
+
+# SQLite's keywords (https://sqlite.org/lang_keywords.html), quoted when used as names
+SQLITE_KEYWORDS = frozenset("""
+    ABORT ACTION ADD AFTER ALL ALTER ALWAYS ANALYZE AND AS ASC ATTACH AUTOINCREMENT BEFORE BEGIN BETWEEN BY
+    CASCADE CASE CAST CHECK COLLATE COLUMN COMMIT CONFLICT CONSTRAINT CREATE CROSS CURRENT CURRENT_DATE
+    CURRENT_TIME CURRENT_TIMESTAMP DATABASE DEFAULT DEFERRABLE DEFERRED DELETE DESC DETACH DISTINCT DO DROP
+    EACH ELSE END ESCAPE EXCEPT EXCLUDE EXCLUSIVE EXISTS EXPLAIN FAIL FILTER FIRST FOLLOWING FOR FOREIGN FROM
+    FULL GENERATED GLOB GROUP GROUPS HAVING IF IGNORE IMMEDIATE IN INDEX INDEXED INITIALLY INNER INSERT INSTEAD
+    INTERSECT INTO IS ISNULL JOIN KEY LAST LEFT LIKE LIMIT MATCH MATERIALIZED NATURAL NO NOT NOTHING NOTNULL
+    NULL NULLS OF OFFSET ON OR ORDER OTHERS OUTER OVER PARTITION PLAN PRAGMA PRECEDING PRIMARY QUERY RAISE
+    RANGE RECURSIVE REFERENCES REGEXP REINDEX RELEASE RENAME REPLACE RESTRICT RETURNING RIGHT ROLLBACK ROW
+    ROWS SAVEPOINT SELECT SET TABLE TEMP TEMPORARY THEN TIES TO TRANSACTION TRIGGER UNBOUNDED UNION UNIQUE
+    UPDATE USING VACUUM VALUES VIEW VIRTUAL WHEN WHERE WINDOW WITH WITHOUT
+""".split())
+
+OPERATORS = ("->>", "||", "<=", ">=", "<>", "!=", "==", "<<", ">>", "->")
+
+
+class Token(NamedTuple):
+    kind: str   # word, string, blob, identifier, number, param, op, semicolon
+    value: str
+    start: int = 0  # offset of the token in the source text
+
+
+class ParsedSQL(NamedTuple):
+    normalized: str         # canonical text, used for dedup and caching
+    statement_type: str     # SELECT, INSERT, ..., "" if empty
+    statement_count: int
+    is_read_only: bool
+
+
+def tokenize_sql(sql: str) -> List[Token]:
+    """
+    Splits `sql` into tokens following SQLite's lexical rules.
+    Comments and whitespace are dropped, string literals and quoted identifiers are kept whole
+    so keywords inside them are never mistaken for statements.
+    """
+    tokens = []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c.isspace():
+            i += 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif c == "'":
+            end = _find_closing(sql, i, "'")
+            tokens.append(Token("string", sql[i:end], i))
+            i = end
+        elif c in "\"`[":
+            close = "]" if c == "[" else c
+            end = _find_closing(sql, i, close)
+            tokens.append(Token("identifier", sql[i:end], i))
+            i = end
+        elif c in "xX" and i + 1 < n and sql[i + 1] == "'":
+            end = _find_closing(sql, i + 1, "'")
+            tokens.append(Token("blob", "X" + sql[i + 1:end], i))
+            i = end
+        elif c.isdigit() or (c == "." and i + 1 < n and sql[i + 1].isdigit()):
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] in "._" or (sql[j] in "+-" and sql[j - 1] in "eE")):
+                j += 1
+            tokens.append(Token("number", sql[i:j], i))
+            i = j
+        elif c.isalpha() or c == "_":
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] in "_$"):
+                j += 1
+            tokens.append(Token("word", sql[i:j], i))
+            i = j
+        elif c in "?:@$":
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] == "_"):
+                j += 1
+            tokens.append(Token("param", sql[i:j], i))
+            i = j
+        elif c == ";":
+            tokens.append(Token("semicolon", c, i))
+            i += 1
+        else:
+            op = next((o for o in OPERATORS if sql.startswith(o, i)), c)
+            tokens.append(Token("op", op, i))
+            i += len(op)
+    return tokens
+
+
+def _find_closing(sql: str, start: int, close: str) -> int:
+    """Returns the index right after the quote closing the one at `start` (doubled quotes are escapes)."""
+    i = start + 1
+    while True:
+        end = sql.find(close, i)
+        if end == -1:
+            return len(sql)
+        if close != "]" and sql.startswith(close * 2, end):
+            i = end + 2
+            continue
+        return end + 1
+
+
+def _join_tokens(tokens: List[Token]) -> str:
+    # Bare words are case-insensitive in SQLite, so upper-casing them keeps the meaning
+    return " ".join(t.value.upper() if t.kind == "word" else t.value for t in tokens)
+
+
+def unquote_identifier(token: Token) -> str:
+    """Returns the name a word or quoted identifier token refers to."""
+    if token.kind != "identifier":
+        return token.value
+    if token.value.startswith("["):
+        return token.value[1:-1]
+    quote = token.value[0]
+    return token.value[1:-1].replace(quote * 2, quote)
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes `name` only when it is not a plain identifier, keywords are always quoted."""
+    if name and (name[0].isalpha() or name[0] == "_") and all(c.isalnum() or c == "_" for c in name) \
+            and name.upper() not in SQLITE_KEYWORDS:
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Returns a canonical form of `sql`: no comments, single spaces, upper-cased keywords and
+    unquoted identifiers, no trailing semicolon. Queries that differ only in formatting normalize equally.
+    """
+    tokens = tokenize_sql(sql)
+    while tokens and tokens[-1].kind == "semicolon":
+        tokens.pop()
+    return _join_tokens(tokens)
+
+
+@lru_cache(maxsize=4096)
+def parse_sql(sql: str) -> ParsedSQL:
+    """
+    Classifies `sql`. Results are memoized per raw string and per normalized string.
+    """
+    return _parse_normalized(normalize_sql(sql))
+
+
+@lru_cache(maxsize=4096)
+def _parse_normalized(normalized: str) -> ParsedSQL:
+    tokens = tokenize_sql(normalized)
+
+    statements = [[]]
+    for token in tokens:
+        if token.kind == "semicolon":
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    statements = [s for s in statements if s]
+
+    if not statements:
+        return ParsedSQL(normalized, "", 0, False)
+
+    statement_type = _statement_type(statements[0])
+    read_only = (
+        len(statements) == 1
+        and statement_type == "SELECT"
+        and not _calls_unsafe_function(statements[0])
+    )
+    return ParsedSQL(normalized, statement_type, len(statements), read_only)
+
+
+def _statement_type(tokens: List[Token]) -> str:
+    """
+    Returns the keyword of the main statement. For WITH clauses the CTE bodies are skipped,
+    as they are always inside parentheses.
+    """
+    first = tokens[0].value.upper() if tokens[0].kind == "word" else ""
+    if first != "WITH":
+        return first
+
+    depth = 0
+    for token in tokens[1:]:
+        if token.kind == "op" and token.value == "(":
+            depth += 1
+        elif token.kind == "op" and token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.kind == "word" and token.value.upper() in MAIN_STATEMENTS:
+            return token.value.upper()
+    return ""
+
+
+def _calls_unsafe_function(tokens: List[Token]) -> bool:
+    for token, next_token in zip(tokens, tokens[1:]):
+        if token.kind == "word" and token.value.upper() in UNSAFE_FUNCTIONS and next_token.value == "(":
+            return True
+    return False
+
+
+def escape_apostrophes(sql: str) -> str:
+    """
+    Doubles un-escaped apostrophes inside single-quoted literals, e.g. 'McDonald's' -> 'McDonald''s'.
+    An apostrophe between two word characters is taken as part of the text only when closing the literal
+    there would leave a quote unmatched (_is_inner_apostrophe), any other one closes the literal.
+    Already-doubled quotes, comments and quoted identifiers are left untouched.
+    """
+    out = []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith("--", i) or sql.startswith("/*", i):
+            end = sql.find("\n" if c == "-" else "*/", i + 2)
+            end = n if end == -1 else end + (1 if c == "-" else 2)
+            out.append(sql[i:end])
+            i = end
+        elif c in "\"`[":
+            end = _find_closing(sql, i, "]" if c == "[" else c)
+            out.append(sql[i:end])
+            i = end
+        elif c == "'":
+            out.append(c)
+            i += 1
+            while i < n:
+                if sql[i] != "'":
+                    out.append(sql[i])
+                    i += 1
+                elif sql.startswith("''", i):
+                    out.append("''")
+                    i += 2
+                elif i + 1 < n and sql[i - 1].isalnum() and sql[i + 1].isalnum() and _is_inner_apostrophe(sql, i):
+                    out.append("''")
+                    i += 1
+                else:
+                    out.append("'")
+                    i += 1
+                    break
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+
+def _is_inner_apostrophe(sql: str, i: int) -> bool:
+    """
+    Whether the apostrophe at `i`, between two word characters, belongs to the text rather than closing the literal:
+    the word after it ends with a quote ('McDonald's'), or the rest of the query has an odd number of quotes
+    ('O'Brien Ltd' AND ...). A literal directly followed by a keyword ('x'AND b='y') is closed.
+    """
+    j = i + 1
+    while j < len(sql) and not sql[j].isspace() and sql[j] not in ",;()=<>!":
+        if sql[j] == "'":
+            return not sql.startswith("''", j)
+        j += 1
+    return sql[i + 1:].replace("''", "").count("'") % 2 == 1
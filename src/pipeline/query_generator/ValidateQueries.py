@@ -5,10 +5,12 @@ import ast
 import sqlite3
 from typing import List, Sequence, Dict, Any
 from collections import Counter
-from langchain_groq import ChatGroq
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
 from Params import *
 from pipeline.query_generator.Promots import *
+from tracer import StageTracer
+from llm_replay import get_chat_model
+from pipeline.cancellation import CancellationToken
 JSONTest = Dict[str, Any]
 
 try:
@@ -76,17 +78,17 @@ class UnitTester:
         model_name: str = VALIDATION_MODEL,
         k_unit_tests: int = 5,
         temperature_gen: float = 0.2,
+        tracer: StageTracer | None = None,
+        cancel_token: CancellationToken | None = None,
     ) -> None:
         self.k = k_unit_tests
+        self.tracer = tracer or StageTracer()
+        self.cancel_token = cancel_token or CancellationToken()
         groq_api_key = groq_api_key or os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
+        if not groq_api_key and os.getenv("LLM_MODE", "live") != "replay":
             raise ValueError("Set GROQ_API_KEY env-var or pass groq_api_key.")
 
-        self.llm_gen = ChatGroq(
-            groq_api_key=groq_api_key,
-            model_name=model_name,
-            temperature=temperature_gen,
-        )
+        self.llm_gen = get_chat_model(model_name, temperature_gen, groq_api_key)
 
     def choose_best(
         self,
@@ -103,11 +105,13 @@ class UnitTester:
         unit_tests = self._generate_unit_tests(question, candidates)
 
         scores = [0] * len(candidates)
-        for ut in unit_tests:
-            results = self._run_unit_test(ut, candidates)
-            for i, passed in enumerate(results):
-                # Increment the score for each candidate that passed the test by the number of tests it passed.
-                scores[i] += int(passed)
+        with self.tracer.stage("unit_test_execution"):
+            for ut in unit_tests:
+                self.cancel_token.check()
+                results = self._run_unit_test(ut, candidates)
+                for i, passed in enumerate(results):
+                    # Increment the score for each candidate that passed the test by the number of tests it passed.
+                    scores[i] += int(passed)
 
         best_idx = max(range(len(scores)), key=scores.__getitem__)
         return candidates[best_idx]
@@ -130,7 +134,9 @@ class UnitTester:
         human = HumanMessage(
             content=f"QUESTION:\n{question}\n\nHere are {len(candidates)} candidate SQL queries:\n{cand_block}"
         )
-        resp: AIMessage = self.llm_gen.invoke([system, human])
+        with self.tracer.stage("unit_test_generation"):
+            resp: AIMessage = self.cancel_token.run(self.llm_gen.invoke, [system, human])
+        self.tracer.record_llm(resp)
 
         tests = _extract_json_array(resp.content)
         if len(tests) != self.k:
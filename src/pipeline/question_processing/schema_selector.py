@@ -25,28 +25,27 @@ def fuzzy_match_phrases(question, schema, spacy_model, threshold=70):
 
 def semantic_similarity(question, schema, embeddings, bert_model, threshold=0.4):
     """Compute semantic similarity between keywords and column descriptions."""
-    question_vec = bert_model.encode(question, convert_to_tensor=True)
+    question_vec = bert_model.encode(question)
     similarities = set()
     for table in schema:
         for col in schema[table]:
-            desc = schema[table][col]
-            score = 0
-            if desc != "":
-                desc_vec = embeddings[table][col]
-                score = util.cos_sim(question_vec, desc_vec).item()
-            else:
-                col_vec = bert_model.encode(col, convert_to_tensor=True)
-                score = util.cos_sim(question_vec, col_vec).item()
+            desc_vec = embeddings.get(table, col)
+            if desc_vec is None:
+                desc_vec = bert_model.encode(col)
+            score = util.cos_sim(question_vec, desc_vec).item()
             if score >= threshold:
                 similarities.add((table, col))
 
     return similarities
 
-def select_schema(question, schema : dict[str, dict[str,str]], embeddings, spacy_model, bert_model, fuzz_threshold=80, similarity_threshold=0.4):
-    """Selects the part of schema that is related to the given question"""
+def select_schema(question, schema : dict[str, dict[str,str]], embeddings, spacy_model, bert_model, fuzz_threshold=80, similarity_threshold=0.4, value_matches=None):
+    """
+    Selects the part of schema that is related to the given question.
+    `value_matches` are (table, column) pairs whose values appear in the question, they are always kept.
+    """
     fuzzy = fuzzy_match_phrases(question, schema, spacy_model, threshold=fuzz_threshold)
     semantic = semantic_similarity(question, schema, embeddings, bert_model, threshold=similarity_threshold)
-    related_schema = fuzzy.union(semantic)
+    related_schema = fuzzy.union(semantic).union(value_matches or ())
     selected_schema = {}
     # Remove unrelated columns
     for table in schema:
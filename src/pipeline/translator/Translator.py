@@ -1,7 +1,14 @@
+import re
 import requests
 
+ARABIC_CHARS = re.compile(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]")
+
 # using mymemory to generate the Arabic Training Data
 def translate(text):
+    # Text without Arabic letters is already English, no need for a network call
+    if not ARABIC_CHARS.search(text):
+        return text
+
     url = "https://api.mymemory.translated.net/get"
     params = {
         "q": text,
@@ -1,92 +1,269 @@
-import os, uuid, re, itertools
+import os, uuid, re, itertools, hashlib, shutil, json, pickle
+import multiprocessing
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from typing import ClassVar
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import ClassVar, Dict, List, Optional
 from pydantic import PrivateAttr
 from langchain.tools import BaseTool
-import re 
+from plotter.render import PlotSpec, render_plot
+from plotter.sql_aggregates import SQLPlotSource
+
+MAX_PLOTS = 24                              # plots kept per result, the most useful first
+PLOT_WORKERS = min(4, os.cpu_count() or 1)  # processes rendering plots
+PLOT_CACHE_DIR = "history/plot_cache"       # rendered plots by content hash, shared by all results
+PLOT_CACHE_BYTES = 256 * 1024 * 1024        # size of the plot cache, least recently used files are evicted beyond it
+PLOT_MANIFEST = "manifest.json"             # plots of a result, in the plots directory
+PLOT_DATA_DIR = "data"                      # aggregated data of the plots, full-size images are drawn from it
+THUMBNAIL_DPI = 30                          # thumbnails are shown at 150x150
+RENDER_VERSION = 2                          # bump when the plot styles change, so cached images are not reused
+SCATTER_POINTS = 1000                       # numeric pairs with more rows are binned instead of scattered
+DENSITY_BINS = 60                           # bins per axis of binned numeric pairs
+HISTOGRAM_BINS = 30                         # bins of single numeric distributions
+TOP_CATEGORIES = 25                         # values shown in categorical distributions, the rest is 'Other'
+VIOLIN_CATEGORIES = 14                      # categories shown in violin plots, the rest is 'Other'
+VIOLIN_POINTS = 2000                        # rows kept per category for violin plots
+SQL_AGGREGATE_ROWS = 50_000                 # larger results are aggregated by SQLite instead of pandas
+
+_pool = None
+
+def get_plot_pool():
+    """
+    Process pool shared by all DataVizTool runs, started on first use.
+    Workers are spawned rather than forked, a fork of the app would inherit locks held by its Qt and model threads.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PLOT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
 
 class DataVizTool(BaseTool):
+    """
+    Plots a query result. Small results are aggregated in pandas, while results larger than SQL_AGGREGATE_ROWS
+    (or results not loaded at all, `df=None`) are aggregated by SQLite around `query` when `db_path` is given,
+    so only the aggregated rows are read into Python.
+    """
     name: ClassVar[str] = "auto_data_visualiser"
     description: ClassVar[str] = "Automatically generate all relevant visualizations from tabular data."
     model_config = {"arbitrary_types_allowed": True}
     _df: pd.DataFrame = PrivateAttr()
     _plots_dir: str = PrivateAttr()
-
-    def __init__(self, df : pd.DataFrame, plots_dir= "plots"):
+    _cache_dir: str = PrivateAttr()
+    _max_plots: int = PrivateAttr()
+    _db_path: Optional[str] = PrivateAttr()
+    _query: Optional[str] = PrivateAttr()
+    _source: Optional[SQLPlotSource] = PrivateAttr(default=None)
+
+    def __init__(self, df : Optional[pd.DataFrame] = None, plots_dir= "plots", cache_dir=PLOT_CACHE_DIR, max_plots=MAX_PLOTS,
+                 db_path: Optional[str] = None, query: Optional[str] = None):
         super().__init__()
+        if df is None and (db_path is None or query is None):
+            raise ValueError("DataVizTool needs a dataframe, or the database and query of the result.")
         self._df = df
         self._plots_dir = plots_dir
+        self._cache_dir = cache_dir
+        self._max_plots = max_plots
+        self._db_path = db_path
+        self._query = query
 
-    def _run(self, request: str) -> str:
-        info_list = []
-        if self._df.shape[0] > 1: 
-            for col in self._df.columns:
-                dtype = self._df[col].dtype
-                nunique = self._df[col].nunique()
-                uniqued=False
-                if nunique==self._df.shape[0]:
-                    uniqued=True
-                    
-                info_list.append((col, dtype, nunique,uniqued,nunique/self._df.shape[0]))
-        info_df = pd.DataFrame(info_list, columns=['Column Name', 'Data Type', 'UniqueValues','Is_Unique_valued','unique_over_size'])
+    def uses_sql(self) -> bool:
+        """Whether the plots are aggregated by SQLite rather than from the dataframe."""
+        if self._db_path is None or self._query is None:
+            return False
+        return self._df is None or len(self._df) > SQL_AGGREGATE_ROWS
 
-        #### Exclude columns
-        valid_cols = info_df.copy()
+    def _run(self, request: str) -> str:
+        if self.uses_sql():
+            self._source = SQLPlotSource(self._db_path, self._query)
+        try:
+            specs = self.plan_plots()
+            if not specs:
+                return "No plots needed"
+            generated_plots = self.render(specs)
+        finally:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+        return f"Generated {len(generated_plots)} plots: {generated_plots}"
 
-        if len(valid_cols)==0:
-            return "No plots needed"
-        valid_cols = valid_cols[~valid_cols["Column Name"].str.lower().apply(self.is_id_column)]
-        ## one valued 
-        #if len(valid_cols)==0:
-        #   return "No plots needed"
-        #valid_cols = valid_cols[~(valid_cols['UniqueValues'] == 1)]
+    def column_stats(self):
+        """
+        Returns:
+            (row count, {column: dtype}, {column: non-null count}, {column: distinct count}, frame to correlate numeric columns)
+        In SQL mode dtypes and correlations come from the first rows of the result, counts from the whole result.
+        """
+        if self._source is not None:
+            sample, n_rows, non_null, nunique = self._source.column_info()
+            return n_rows, sample.dtypes.to_dict(), non_null, nunique, sample
+        df = self._df
+        return len(df), df.dtypes.to_dict(), df.count().to_dict(), {col: df[col].nunique() for col in df.columns}, df
+
+    def plan_plots(self) -> List[PlotSpec]:
+        """
+        Lists the plots worth drawing for the data, most useful first and capped to `max_plots`:
+        single categorical distributions, numeric histograms, then numeric pairs by correlation strength,
+        numeric by categorical, and categorical pairs last.
+        """
+        n_rows, dtypes, non_null, nunique, frame = self.column_stats()
+        if n_rows <= 1:
+            return []
 
+        #### Exclude columns
+        valid_cols = [col for col in dtypes if not self.is_id_column(str(col))]
         if len(valid_cols)==0:
-            return "No plots needed"
-        
+            return []
 
-        
-        num_cols = valid_cols[valid_cols["Data Type"].apply(lambda x: np.issubdtype(np.dtype(x), np.number))]["Column Name"].tolist()
-        cat_cols = valid_cols[valid_cols["Data Type"].apply(lambda x: not np.issubdtype(np.dtype(x), np.number))]["Column Name"].tolist()
-
-        # Shorten categorical values in the dataframe
-        for col in cat_cols:
-            self._df[col] = self._df[col].apply(lambda x: self.shorten_label(x, max_len=10))
+        is_numeric = {col: pd.api.types.is_numeric_dtype(dtypes[col]) and not pd.api.types.is_bool_dtype(dtypes[col]) for col in valid_cols}
+        num_cols = [col for col in valid_cols if is_numeric[col]]
+        cat_cols = [col for col in valid_cols if not is_numeric[col]]
 
+        # Shorten categorical values in the dataframe, SQL aggregates are shortened once aggregated
+        if self._source is None:
+            for col in cat_cols:
+                self._df[col] = shorten_labels(self._df[col], max_len=10)
 
-        generated_plots = []
+        specs = []
 
-        # Single Categorical
+        # Single Categorical, skipped when almost every value is unique
         for col in cat_cols:
-            path = self.vis_single_cat(self._df, col)
-            generated_plots.append(path)
+            if non_null[col] and nunique[col] / non_null[col] < 0.95:
+                specs.append(PlotSpec("single_cat", (col,), 3.0 if nunique[col] <= 25 else 2.0))
 
-        # Pairwise Numeric
-        for col1, col2 in itertools.combinations(num_cols, 2):
-            path = self.vis_two_num(self._df, col1, col2)
-            generated_plots.append(path)
+        # Single Numeric histograms
+        for col in num_cols:
+            if nunique[col] > 1:
+                specs.append(PlotSpec("single_num", (col,), 2.5))
 
-        # Pairwise Categorical
-        for col1, col2 in itertools.combinations(cat_cols, 2):
-            path = self.vis_two_cat(self._df, col1, col2)
-            generated_plots.append(path)
+        # Pairwise Numeric, strongly correlated pairs first
+        corr = frame[num_cols].corr() if len(num_cols) > 1 else None
+        for col1, col2 in itertools.combinations(num_cols, 2):
+            strength = corr.loc[col1, col2]
+            specs.append(PlotSpec("two_num", (col1, col2), 2.0 + (0.0 if pd.isna(strength) else abs(strength))))
 
         # Numeric vs Categorical
         for num_col in num_cols:
             for cat_col in cat_cols:
-                path = self.vis_cat_num(self._df, cat_col, num_col)
-                generated_plots.append(path)
+                specs.append(PlotSpec("cat_num", (cat_col, num_col), 2.0 if nunique[cat_col] <= 14 else 1.5))
 
-        return f"Generated {len(generated_plots)} plots: {generated_plots}"
+        # Pairwise Categorical
+        for col1, col2 in itertools.combinations(cat_cols, 2):
+            specs.append(PlotSpec("two_cat", (col1, col2), 1.5 if nunique[col1] < 10 and nunique[col2] < 10 else 1.0))
+
+        specs.sort(key=lambda spec: spec.priority, reverse=True)
+        return specs[:self._max_plots]
+
+    def content_hash(self, spec: PlotSpec) -> str:
+        """Identifies a plot by its kind and the values it shows, identical data gives the same image."""
+        digest = hashlib.blake2b(f"{RENDER_VERSION}|{spec.kind}|{spec.columns}".encode("utf-8"), digest_size=16)
+        if self._source is not None:
+            digest.update(self._source.fingerprint().encode("utf-8"))
+            return digest.hexdigest()
+        try:
+            digest.update(pd.util.hash_pandas_object(self._df[list(spec.columns)], index=False).values.tobytes())
+        except TypeError:
+            digest.update(uuid.uuid4().bytes)   # unhashable values, never reused
+        return digest.hexdigest()
+
+    def render(self, specs: List[PlotSpec]) -> List[str]:
+        """
+        Renders low-resolution thumbnails of the plots into the plots directory, reusing cached ones
+        and drawing the missing ones in parallel processes. The aggregated data of every plot is kept
+        with a manifest, so full-size images are only drawn when opened (see render_full_size).
+        """
+        data_dir = os.path.join(self._plots_dir, PLOT_DATA_DIR)
+        os.makedirs(data_dir, exist_ok=True)
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+        entries, pending = [], []
+        for rank, spec in enumerate(specs):
+            key = self.content_hash(spec)
+            thumbnail = os.path.join(self._cache_dir, f"{key}.thumb.png")
+            cached_data = os.path.join(self._cache_dir, f"{key}.pkl")
+            # the rank prefix keeps the plots in priority order when listed
+            entries.append({
+                "file": f"{rank:02d}_{spec.name}_{key[:8]}.png",
+                "kind": spec.kind,
+                "columns": list(spec.columns),
+                "priority": spec.priority,
+                "key": key,
+            })
+            if not (os.path.exists(thumbnail) and os.path.exists(cached_data)):
+                pending.append((spec, thumbnail, cached_data))
+
+        # aggregated here, only the small aggregates are sent to the rendering processes
+        jobs = []
+        for spec, thumbnail, cached_data in pending:
+            try:
+                data = self.aggregate(spec)
+            except Exception as e:
+                print(f"Could not aggregate {spec.name}: {e}")
+                continue
+            tmp = f"{cached_data}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(data, f)
+            os.replace(tmp, cached_data)
+            if not os.path.exists(thumbnail):
+                jobs.append((spec, data, thumbnail))
+
+        if len(jobs) > 1 and PLOT_WORKERS > 1:
+            try:
+                futures = [(get_plot_pool().submit(render_plot, spec, data, self._tmp_path(cached), THUMBNAIL_DPI), cached)
+                           for spec, data, cached in jobs]
+                for future, cached in futures:
+                    self._finish(future.result, cached)
+                jobs = []
+            except BrokenProcessPool:
+                global _pool
+                _pool = None    # rendered inline below, a new pool is started next time
+        for spec, data, cached in jobs:
+            if not os.path.exists(cached):
+                self._finish(lambda: render_plot(spec, data, self._tmp_path(cached), THUMBNAIL_DPI), cached)
+
+        generated_plots, manifest = [], []
+        for entry in entries:
+            thumbnail = os.path.join(self._cache_dir, f"{entry['key']}.thumb.png")
+            cached_data = os.path.join(self._cache_dir, f"{entry['key']}.pkl")
+            if os.path.exists(thumbnail) and os.path.exists(cached_data):
+                target = os.path.join(self._plots_dir, entry["file"])
+                # linked, so the result keeps its plots when the cache evicts them
+                _link_or_copy(thumbnail, target)
+                _link_or_copy(cached_data, os.path.join(data_dir, f"{entry['key']}.pkl"))
+                touch(thumbnail, cached_data)
+                manifest.append(entry)
+                generated_plots.append(target)
+
+        write_manifest(self._plots_dir, {"version": RENDER_VERSION, "cache_dir": os.path.abspath(self._cache_dir), "plots": manifest})
+        evict_lru(self._cache_dir)
+        return generated_plots
+
+    def aggregate(self, spec: PlotSpec):
+        """The data drawn by a plot, see aggregate_for_plot."""
+        if self._source is None:
+            return aggregate_for_plot(self._df, spec)
+        data = self._source.aggregate(spec, top_categories=TOP_CATEGORIES, scatter_points=SCATTER_POINTS,
+                                      density_bins=DENSITY_BINS, histogram_bins=HISTOGRAM_BINS,
+                                      violin_categories=VIOLIN_CATEGORIES, violin_points=VIOLIN_POINTS)
+        return shorten_aggregate(spec, data, max_len=10)
+
+    @staticmethod
+    def _tmp_path(cached):
+        return f"{cached[:-4]}.{uuid.uuid4().hex}.tmp.png"
+
+    @staticmethod
+    def _finish(result, cached):
+        """Moves a rendered image into the cache, a plot that fails is skipped."""
+        try:
+            tmp = result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            print(f"Could not render {os.path.basename(cached)}: {e}")
+            return
+        os.replace(tmp, cached)
 
     # tiny helpers 
-    def _ensure_plot_dir(self):
-        if not os.path.exists(self._plots_dir):
-            os.makedirs(self._plots_dir, exist_ok=True)
-
     def is_id_column(self, colname):
         colname = colname.lower()
         pattern = r'(^id$|^id[\-_].*|.*[\-_]id$|.*[\-_]id[\-_].*|.*id$)'
@@ -96,146 +273,170 @@ class DataVizTool(BaseTool):
         if not isinstance(label, str):
             return label  
         return label if len(label) <= max_len else label[:max_len].rstrip() + "..."
-    
-
-    def vis_single_cat(self, df, col, target_col=None):
-        # Drop NA to avoid counting them as unique
-        non_null_values = df[col].dropna()
-        unique_ratio = non_null_values.nunique() / len(non_null_values)
-
-        # Return early if uniqueness is too high
-        if unique_ratio >= 0.95:
-            return None
-
-        value_counts = non_null_values.value_counts()
-        self._ensure_plot_dir()
-
-        if len(value_counts) > 25:
-            # Group top 25 values, rest to 'Other'
-            top_25 = value_counts.head(25).index
-            df[col] = df[col].apply(lambda x: x if x in top_25 else 'Other')
-            value_counts = df[col].value_counts()
-
-        if len(value_counts) <= 10:
-            plt.figure(figsize=(6, 6))
-            value_counts.plot.pie(autopct='%1.1f%%', startangle=90)
-            plt.title(f'Pie plot of {col}')
-            plt.ylabel('')
-        else:
-            plt.figure(figsize=(10, 5))
-            sns.countplot(data=df, x=col, order=value_counts.index)
-            plt.title(f'Bar Plot for {col}')
-            plt.xticks(rotation=45)
-
-        path = os.path.join(self._plots_dir, f"{col}_cat_{uuid.uuid4().hex}.png")
-        plt.savefig(path, bbox_inches="tight")
-        plt.close()
-        return path
-
-    def vis_two_cat(self, df, col1, col2):
-        self._ensure_plot_dir()
-        n1 = df[col1].nunique()
-        n2 = df[col2].nunique()
-
-        if n1 < 10 and n2 < 10:
-            ct = pd.crosstab(df[col1], df[col2])
-            ct.plot(kind='bar', figsize=(10, 6))
-            plt.title(f'Grouped Bar Plot: {col1} vs {col2}')
-            plt.xlabel(col1)
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            plt.legend(title=col2)
-            plt.tight_layout()
-
-        elif n1 < 10 and n2 >= 10:
-            top_col2 = df[col2].value_counts().nlargest(10).index
-            df_filtered = df[df[col2].isin(top_col2)]
-            plt.figure(figsize=(12, 6))
-            sns.countplot(data=df_filtered, x=col2, hue=col1, order=top_col2)
-            plt.title(f'Top 10 {col2} by {col1}')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-
-        elif n2 < 10 and n1 >= 10:
-            top_col1 = df[col1].value_counts().nlargest(10).index
-            df_filtered = df[df[col1].isin(top_col1)]
-            plt.figure(figsize=(12, 6))
-            sns.countplot(data=df_filtered, x=col1, hue=col2, order=top_col1)
-            plt.title(f'Top 10 {col1} by {col2}')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-
-        else:
-            ct = pd.crosstab(df[col1], df[col2])
-            top_rows = ct.sum(axis=1).nlargest(10).index
-            top_cols = ct.sum(axis=0).nlargest(10).index
-            ct_filtered = ct.loc[top_rows, top_cols]
-            plt.figure(figsize=(10, 8))
-            sns.heatmap(ct_filtered, annot=True, fmt='d', cmap='Blues')
-            plt.title(f'Heatmap of Top 10 {col1} vs Top 10 {col2}')
-            plt.xlabel(col2)
-            plt.ylabel(col1)
-            plt.tight_layout()
-
-            path = os.path.join(self._plots_dir, f"{col1}_{col2}_2cat_{uuid.uuid4().hex}.png")
-            plt.savefig(path, bbox_inches="tight")
-            plt.close()
-            return path
-
-
-    def vis_two_num(self, df, col1, col2):
-        self._ensure_plot_dir()
-        threshold = 1000
-
-        sub_df = df[[col1, col2]].dropna()
-        n_points = len(sub_df)
-        corr = sub_df.corr().iloc[0, 1]
-
-        plt.figure(figsize=(8, 6))
-
-        if n_points <= threshold:
-            sns.scatterplot(x=col1, y=col2, data=sub_df)
-            plt.title(f'Scatter Plot: {col1} vs {col2} (corr={corr:.2f})')
-        else:
-            sns.kdeplot(x=sub_df[col1], y=sub_df[col2], cmap="Blues", fill=True, thresh=0.05)
-            plt.title(f'2D Density Plot: {col1} vs {col2} (corr={corr:.2f})')
-
-        plt.xlabel(col1)
-        plt.ylabel(col2)
-        plt.tight_layout()
-
-        path = os.path.join(self._plots_dir, f"{col1}_{col2}_2num_{uuid.uuid4().hex}.png")
-        plt.savefig(path, bbox_inches="tight")
-        plt.close()
-        return path
 
 
-    def vis_cat_num(self, df, cat_col, num_col):
-        self._ensure_plot_dir()
-
-        # Drop missing values
+def shorten_labels(series: pd.Series, max_len=11) -> pd.Series:
+    """Vectorized DataVizTool.shorten_label over a column, non-string values are kept as they are."""
+    try:
+        too_long = series.str.len().gt(max_len).fillna(False).astype(bool)
+    except AttributeError:   # no string values at all
+        return series
+    if not too_long.any():
+        return series
+    shortened = series[too_long].str.slice(0, max_len).str.rstrip() + "..."
+    return series.where(~too_long, shortened)
+
+
+def shorten_aggregate(spec: PlotSpec, data, max_len=11):
+    """Shortens the categorical labels of an aggregate, merging the values that become equal."""
+    if spec.kind == "single_cat":
+        data = data.groupby(shorten_labels(data.index.to_series(), max_len).values, sort=False).sum()
+        return data.sort_values(ascending=False)
+    if spec.kind == "two_cat":
+        data = data.groupby(shorten_labels(data.index.to_series(), max_len).values).sum()
+        data = data.T.groupby(shorten_labels(data.columns.to_series(), max_len).values).sum().T
+        data.index.name, data.columns.name = spec.columns
+        return data
+    if spec.kind == "cat_num":
+        cat_col = spec.columns[0]
+        return data.assign(**{cat_col: shorten_labels(data[cat_col], max_len)})
+    return data
+
+
+def aggregate_for_plot(df: pd.DataFrame, spec: PlotSpec, seed=0):
+    """
+    Reduces the rows of a plot to what it draws, so rendering time and the data sent to the
+    rendering processes stay bounded whatever the number of rows:
+      -> single_cat: value counts, values beyond TOP_CATEGORIES grouped into 'Other'
+      -> two_cat: crosstab of the two columns
+      -> single_num: np.histogram of the column
+      -> two_num: the points up to SCATTER_POINTS rows, else a np.histogram2d density
+      -> cat_num: at most VIOLIN_POINTS random rows per category
+    """
+    if spec.kind == "single_cat":
+        (col,) = spec.columns
+        counts = df[col].value_counts()
+        if len(counts) > TOP_CATEGORIES:
+            other = counts.iloc[TOP_CATEGORIES:].sum()
+            counts = pd.concat([counts.iloc[:TOP_CATEGORIES], pd.Series({"Other": other})]).sort_values(ascending=False)
+        return counts
+
+    if spec.kind == "two_cat":
+        col1, col2 = spec.columns
+        return pd.crosstab(df[col1], df[col2])
+
+    if spec.kind == "single_num":
+        (col,) = spec.columns
+        return np.histogram(df[col].dropna().to_numpy(dtype=float), bins=HISTOGRAM_BINS)
+
+    if spec.kind == "two_num":
+        col1, col2 = spec.columns
+        sub_df = df[[col1, col2]].dropna()
+        corr = sub_df[col1].corr(sub_df[col2]) if len(sub_df) > 1 else float("nan")
+        if len(sub_df) <= SCATTER_POINTS:
+            return {"points": sub_df, "density": None, "corr": corr}
+        density = np.histogram2d(sub_df[col1].to_numpy(dtype=float), sub_df[col2].to_numpy(dtype=float), bins=DENSITY_BINS)
+        return {"points": None, "density": density, "corr": corr}
+
+    if spec.kind == "cat_num":
+        cat_col, num_col = spec.columns
         sub_df = df[[cat_col, num_col]].dropna()
-
-        # Count unique categories
-        unique_vals = sub_df[cat_col].nunique()
-        threshold = 14
-
-        # Group rare categories into 'Other'
-        if unique_vals > threshold:
-            top_categories = sub_df[cat_col].value_counts().nlargest(threshold).index
-            sub_df[cat_col] = sub_df[cat_col].where(sub_df[cat_col].isin(top_categories), other='Other')
-
-        plt.figure(figsize=(10, 6))
-        sns.violinplot(x=cat_col, y=num_col, data=sub_df,cut=0)
-        plt.title(f'Violin Plot of {num_col} by {cat_col}')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-
-        path = os.path.join(self._plots_dir, f"{num_col}_{cat_col}_catnum_{uuid.uuid4().hex}.png")
-        plt.savefig(path, bbox_inches="tight")
-        plt.close()
-
-        return path
+        if sub_df[cat_col].nunique() > VIOLIN_CATEGORIES:
+            top_categories = sub_df[cat_col].value_counts().nlargest(VIOLIN_CATEGORIES).index
+            sub_df = sub_df.assign(**{cat_col: sub_df[cat_col].where(sub_df[cat_col].isin(top_categories), other="Other")})
+        if len(sub_df) > VIOLIN_POINTS:
+            # shuffle once, then keep the first rows of every category
+            sub_df = sub_df.sample(frac=1, random_state=seed).groupby(cat_col, sort=False).head(VIOLIN_POINTS)
+        return sub_df
+
+    raise ValueError(f"Unknown plot kind {spec.kind}")
+
+
+def write_manifest(plots_dir: str, manifest: Dict):
+    tmp = os.path.join(plots_dir, f"{PLOT_MANIFEST}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp, os.path.join(plots_dir, PLOT_MANIFEST))
+
+
+def read_manifest(plots_dir: str) -> Optional[Dict]:
+    """The manifest of a plots directory, None for results plotted before manifests existed."""
+    path = os.path.join(plots_dir, PLOT_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def render_full_size(image_path: str) -> str:
+    """
+    Returns the full-size image of a plot thumbnail, drawing it from the aggregated data of the plot
+    the first time it is requested. Full-size images live in the plot cache, so they are shared by
+    identical plots and evicted when not used for long.
+    Images without a manifest entry (older results) are returned as they are.
+    """
+    plots_dir, name = os.path.split(os.path.abspath(image_path))
+    manifest = read_manifest(plots_dir)
+    entry = next((e for e in manifest["plots"] if e["file"] == name), None) if manifest else None
+    if entry is None:
+        return image_path
+
+    cache_dir = manifest.get("cache_dir", PLOT_CACHE_DIR)
+    full_size = os.path.join(cache_dir, f"{entry['key']}.png")
+    if os.path.exists(full_size):
+        touch(full_size)
+        return full_size
+
+    data_path = os.path.join(plots_dir, PLOT_DATA_DIR, f"{entry['key']}.pkl")
+    if not os.path.exists(data_path):
+        return image_path
+    with open(data_path, "rb") as f:
+        data = pickle.load(f)
+    os.makedirs(cache_dir, exist_ok=True)
+    spec = PlotSpec(entry["kind"], tuple(entry["columns"]), entry["priority"])
+    tmp = render_plot(spec, data, DataVizTool._tmp_path(full_size))
+    os.replace(tmp, full_size)
+    evict_lru(cache_dir, keep=full_size)
+    return full_size
+
+
+def touch(*paths):
+    """Marks cache files as used, eviction goes by modification time."""
+    for path in paths:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def evict_lru(cache_dir: str, max_bytes: int = PLOT_CACHE_BYTES, keep: Optional[str] = None):
+    """Removes the least recently used files of the plot cache until it fits in `max_bytes`."""
+    files = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.is_file() and ".tmp" not in entry.name:
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.samefile(path, keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
 
 
 
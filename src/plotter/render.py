@@ -0,0 +1,159 @@
+# Plot rendering without pyplot: every plot draws on its own Figure with the Agg canvas,
+# so plots can be rendered concurrently in worker processes.
+import os
+from typing import NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class PlotSpec(NamedTuple):
+    kind: str                   # single_cat, single_num, two_num, two_cat or cat_num
+    columns: Tuple[str, ...]
+    priority: float             # higher is rendered first, and kept when plots are capped
+
+    @property
+    def name(self) -> str:
+        return "_".join(self.columns) + f"_{self.kind}"
+
+
+def _new_axes(figsize):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _save(fig, path, dpi=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fig.savefig(path, bbox_inches="tight", dpi=dpi)
+
+
+def plot_single_cat(counts, col, path, dpi=None):
+    """`counts`: value counts of the column, rare values already grouped into 'Other'."""
+    if len(counts) <= 10:
+        fig, ax = _new_axes((6, 6))
+        counts.plot.pie(ax=ax, autopct='%1.1f%%', startangle=90)
+        ax.set_title(f'Pie plot of {col}')
+        ax.set_ylabel('')
+    else:
+        fig, ax = _new_axes((10, 5))
+        sns.barplot(x=counts.index.astype(str), y=counts.values, ax=ax)
+        ax.set_title(f'Bar Plot for {col}')
+        ax.set_xlabel(col)
+        ax.set_ylabel('count')
+        ax.tick_params(axis="x", labelrotation=45)
+    _save(fig, path, dpi)
+
+
+def plot_single_num(histogram, col, path, dpi=None):
+    """`histogram`: (counts, bin edges) of the column, as from np.histogram."""
+    counts, edges = histogram
+    fig, ax = _new_axes((8, 5))
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge", edgecolor="white")
+    ax.set_title(f'Histogram of {col}')
+    ax.set_xlabel(col)
+    ax.set_ylabel('count')
+    fig.tight_layout()
+    _save(fig, path, dpi)
+
+
+def plot_two_cat(ct, col1, col2, path, dpi=None):
+    """`ct`: crosstab of the two columns (col1 values as rows, col2 values as columns)."""
+    n1, n2 = ct.shape
+
+    if n1 < 10 and n2 < 10:
+        fig, ax = _new_axes((10, 6))
+        ct.plot(kind='bar', ax=ax)
+        ax.set_title(f'Grouped Bar Plot: {col1} vs {col2}')
+        ax.set_xlabel(col1)
+        ax.set_ylabel('Count')
+        ax.tick_params(axis="x", labelrotation=45)
+        ax.legend(title=col2)
+
+    elif n1 < 10 and n2 >= 10:
+        top_col2 = ct.sum(axis=0).nlargest(10).index
+        fig, ax = _new_axes((12, 6))
+        ct[top_col2].T.plot(kind='bar', ax=ax)
+        ax.set_title(f'Top 10 {col2} by {col1}')
+        ax.set_xlabel(col2)
+        ax.set_ylabel('count')
+        ax.tick_params(axis="x", labelrotation=45)
+        ax.legend(title=col1)
+
+    elif n2 < 10 and n1 >= 10:
+        top_col1 = ct.sum(axis=1).nlargest(10).index
+        fig, ax = _new_axes((12, 6))
+        ct.loc[top_col1].plot(kind='bar', ax=ax)
+        ax.set_title(f'Top 10 {col1} by {col2}')
+        ax.set_xlabel(col1)
+        ax.set_ylabel('count')
+        ax.tick_params(axis="x", labelrotation=45)
+        ax.legend(title=col2)
+
+    else:
+        top_rows = ct.sum(axis=1).nlargest(10).index
+        top_cols = ct.sum(axis=0).nlargest(10).index
+        fig, ax = _new_axes((10, 8))
+        sns.heatmap(ct.loc[top_rows, top_cols], annot=True, fmt='d', cmap='Blues', ax=ax)
+        ax.set_title(f'Heatmap of Top 10 {col1} vs Top 10 {col2}')
+        ax.set_xlabel(col2)
+        ax.set_ylabel(col1)
+
+    fig.tight_layout()
+    _save(fig, path, dpi)
+
+
+def plot_two_num(data, col1, col2, path, dpi=None):
+    """
+    `data`: {"points": DataFrame of the two columns, or None when binned,
+             "density": (counts, x edges, y edges) from np.histogram2d, or None,
+             "corr": correlation over all the rows}
+    """
+    corr = data["corr"]
+    fig, ax = _new_axes((8, 6))
+    if data["points"] is not None:
+        sns.scatterplot(x=col1, y=col2, data=data["points"], ax=ax)
+        ax.set_title(f'Scatter Plot: {col1} vs {col2} (corr={corr:.2f})')
+    else:
+        counts, xedges, yedges = data["density"]
+        counts = np.ma.masked_equal(counts.T, 0)   # empty bins stay blank
+        mesh = ax.pcolormesh(xedges, yedges, counts, cmap="Blues")
+        fig.colorbar(mesh, ax=ax, label="count")
+        ax.set_title(f'2D Density Plot: {col1} vs {col2} (corr={corr:.2f})')
+
+    ax.set_xlabel(col1)
+    ax.set_ylabel(col2)
+    fig.tight_layout()
+    _save(fig, path, dpi)
+
+
+def plot_cat_num(sub_df, cat_col, num_col, path, dpi=None):
+    """`sub_df`: the two columns, rare categories grouped into 'Other' and large categories sampled."""
+    fig, ax = _new_axes((10, 6))
+    sns.violinplot(x=cat_col, y=num_col, data=sub_df, cut=0, ax=ax)
+    ax.set_title(f'Violin Plot of {num_col} by {cat_col}')
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    _save(fig, path, dpi)
+
+
+PLOTTERS = {
+    "single_cat": plot_single_cat,
+    "single_num": plot_single_num,
+    "two_cat": plot_two_cat,
+    "two_num": plot_two_num,
+    "cat_num": plot_cat_num,
+}
+
+
+def render_plot(spec: PlotSpec, data, path: str, dpi=None) -> str:
+    """
+    Renders one plot to `path` from the small pre-aggregated `data` of the spec
+    (see plotter.Plotter.aggregate_for_plot). Runs in worker processes.
+    `dpi` defaults to the matplotlib setting, thumbnails use a lower one.
+    """
+    PLOTTERS[spec.kind](data, *spec.columns, path, dpi=dpi)
+    return path
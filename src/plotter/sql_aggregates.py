@@ -0,0 +1,161 @@
+# Plot aggregations computed by SQLite, so large results never have to be loaded into pandas.
+import hashlib
+import math
+import os
+import sqlite3
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from plotter.render import PlotSpec
+
+PLOT_QUERY_TIMEOUT = 60     # seconds for materializing the result and every aggregation
+SAMPLE_ROWS = 1000          # rows read to infer column types and correlations
+SOURCE = "temp.plot_source"
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLPlotSource:
+    """
+    The result of `query`, materialized once into a temporary table of a read-only connection,
+    from which the plot aggregations (GROUP BY counts, bucketed histograms, per-category samples) are computed.
+    Only the aggregated rows are returned to Python, in the same shapes as plotter.Plotter.aggregate_for_plot.
+
+    Args:
+        db_path (str): path to the database file
+        query (str): the query whose result is plotted
+    """
+    def __init__(self, db_path: str, query: str, timeout_sec: float = PLOT_QUERY_TIMEOUT):
+        self.db_path = db_path
+        self.query = query.strip().rstrip(";")
+        self.timeout_sec = timeout_sec
+        self.conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+        # same watchdog as the pipeline executor, every statement gets `timeout_sec`
+        self._start = time.time()
+        self.conn.set_progress_handler(lambda: 1 if time.time() - self._start > self.timeout_sec else 0, 1_000)
+        self._execute(f"CREATE TEMP TABLE plot_source AS SELECT * FROM ({self.query});")
+        self.columns = [row[1] for row in self._execute("PRAGMA temp.table_info(plot_source);")]
+
+    def _execute(self, sql: str, params=()):
+        self._start = time.time()
+        return self.conn.execute(sql, params).fetchall()
+
+    def fingerprint(self) -> str:
+        """Identifies the plotted data: the query and the state of the database file."""
+        key = f"{os.path.abspath(self.db_path)}|{os.path.getmtime(self.db_path)}|{self.query}"
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+    def column_info(self) -> Tuple[pd.DataFrame, int, Dict[str, int], Dict[str, int]]:
+        """
+        Returns:
+            (sample of the rows, row count, {column: non-null count}, {column: distinct count})
+        """
+        sample = pd.DataFrame(self._execute(f"SELECT * FROM {SOURCE} LIMIT {SAMPLE_ROWS};"), columns=self.columns)
+        counts = ", ".join(f"COUNT({_q(c)}), COUNT(DISTINCT {_q(c)})" for c in self.columns)
+        row = self._execute(f"SELECT COUNT(*), {counts} FROM {SOURCE};")[0]
+        non_null = {c: row[1 + 2 * i] for i, c in enumerate(self.columns)}
+        distinct = {c: row[2 + 2 * i] for i, c in enumerate(self.columns)}
+        return sample, row[0], non_null, distinct
+
+    def aggregate(self, spec: PlotSpec, top_categories: int, scatter_points: int, density_bins: int,
+                  histogram_bins: int, violin_categories: int, violin_points: int):
+        """
+        Runs the aggregation of one plot:
+          -> single_cat: GROUP BY counts of the top values, the rest counted as 'Other'
+          -> two_cat: GROUP BY counts of the pairs of the top 10 values of each column, as a crosstab
+          -> single_num: bucketed histogram, (counts, edges) like np.histogram
+          -> two_num: the points up to `scatter_points` rows, else bucketed 2D counts like np.histogram2d
+          -> cat_num: at most `violin_points` random rows per category, rare categories as 'Other'
+        """
+        if spec.kind == "single_cat":
+            (col,) = spec.columns
+            rows = self._execute(
+                f"SELECT {_q(col)}, COUNT(*) FROM {SOURCE} WHERE {_q(col)} IS NOT NULL GROUP BY 1 ORDER BY 2 DESC LIMIT ?;",
+                (top_categories,))
+            total = self._execute(f"SELECT COUNT({_q(col)}) FROM {SOURCE};")[0][0]
+            counts = pd.Series({value: count for value, count in rows}, dtype="int64")
+            other = total - counts.sum()
+            if other > 0:
+                counts = pd.concat([counts, pd.Series({"Other": other})]).sort_values(ascending=False)
+            return counts
+
+        if spec.kind == "two_cat":
+            col1, col2 = spec.columns
+            rows = self._execute(f"""
+                WITH t1 AS (SELECT {_q(col1)} AS v FROM {SOURCE} WHERE {_q(col1)} IS NOT NULL GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 10),
+                     t2 AS (SELECT {_q(col2)} AS v FROM {SOURCE} WHERE {_q(col2)} IS NOT NULL GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 10)
+                SELECT {_q(col1)}, {_q(col2)}, COUNT(*) FROM {SOURCE}
+                WHERE {_q(col1)} IN (SELECT v FROM t1) AND {_q(col2)} IN (SELECT v FROM t2)
+                GROUP BY 1, 2;""")
+            ct = pd.DataFrame(rows, columns=[col1, col2, "count"]).pivot_table(
+                index=col1, columns=col2, values="count", aggfunc="sum", fill_value=0)
+            return ct.astype("int64")
+
+        if spec.kind == "two_num":
+            col1, col2 = spec.columns
+            x, y = _q(col1), _q(col2)
+            where = f"WHERE {x} IS NOT NULL AND {y} IS NOT NULL"
+            n, x_min, x_max, y_min, y_max, sx, sy, sxx, syy, sxy = self._execute(
+                f"SELECT COUNT(*), MIN({x}), MAX({x}), MIN({y}), MAX({y}), "
+                f"SUM({x}), SUM({y}), SUM({x} * {x}), SUM({y} * {y}), SUM({x} * {y}) FROM {SOURCE} {where};")[0]
+            corr = float("nan")
+            if n > 1:
+                denominator = math.sqrt(max(n * sxx - sx * sx, 0) * max(n * syy - sy * sy, 0))
+                corr = (n * sxy - sx * sy) / denominator if denominator else float("nan")
+            if n <= scatter_points:
+                points = pd.DataFrame(self._execute(f"SELECT {x}, {y} FROM {SOURCE} {where};"), columns=[col1, col2])
+                return {"points": points, "density": None, "corr": corr}
+            bins = density_bins
+            x_edges, y_edges = _edges(x_min, x_max, bins), _edges(y_min, y_max, bins)
+            counts = np.zeros((bins, bins))
+            rows = self._execute(
+                f"SELECT {_bucket(x, x_edges, bins)}, {_bucket(y, y_edges, bins)}, COUNT(*) FROM {SOURCE} {where} GROUP BY 1, 2;")
+            for i, j, count in rows:
+                counts[i, j] = count
+            return {"points": None, "density": (counts, x_edges, y_edges), "corr": corr}
+
+        if spec.kind == "single_num":
+            (col,) = spec.columns
+            c, bins = _q(col), histogram_bins
+            low, high = self._execute(f"SELECT MIN({c}), MAX({c}) FROM {SOURCE};")[0]
+            edges = _edges(low, high, bins)
+            counts = np.zeros(bins)
+            for i, count in self._execute(
+                    f"SELECT {_bucket(c, edges, bins)}, COUNT(*) FROM {SOURCE} WHERE {c} IS NOT NULL GROUP BY 1;"):
+                counts[i] = count
+            return counts, edges
+
+        if spec.kind == "cat_num":
+            cat_col, num_col = spec.columns
+            cat, num = _q(cat_col), _q(num_col)
+            rows = self._execute(f"""
+                WITH src AS (SELECT {cat} AS cat, {num} AS num FROM {SOURCE} WHERE {cat} IS NOT NULL AND {num} IS NOT NULL),
+                     top AS (SELECT cat FROM src GROUP BY cat ORDER BY COUNT(*) DESC LIMIT ?),
+                     grouped AS (SELECT CASE WHEN cat IN (SELECT cat FROM top) THEN cat ELSE 'Other' END AS cat, num FROM src)
+                SELECT cat, num FROM (
+                    SELECT cat, num, ROW_NUMBER() OVER (PARTITION BY cat ORDER BY random()) AS rn FROM grouped
+                ) WHERE rn <= ?;""", (violin_categories, violin_points))
+            return pd.DataFrame(rows, columns=[cat_col, num_col])
+
+        raise ValueError(f"Unknown plot kind {spec.kind}")
+
+    def close(self):
+        self.conn.close()
+
+
+def _edges(low, high, bins) -> np.ndarray:
+    low, high = float(low), float(high)
+    if high <= low:
+        high = low + 1.0
+    return np.linspace(low, high, bins + 1)
+
+
+def _bucket(column: str, edges: np.ndarray, bins: int) -> str:
+    """SQL expression of the histogram bin of `column`, the maximum falls in the last bin."""
+    low, width = float(edges[0]), float(edges[-1] - edges[0]) / bins
+    return f"MAX(MIN(CAST(({column} - {low!r}) / {width!r} AS INTEGER), {bins - 1}), 0)"
@@ -0,0 +1,117 @@
+# Fast comparison of predicted and ground-truth result sets for evaluation.
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+SAMPLE_ROWS = 50        # rows kept from each result for mismatch reports
+FETCH_BATCH = 10_000    # rows fetched from a cursor at a time
+_MASK = (1 << 64) - 1
+
+
+class ResultDigest(NamedTuple):
+    row_count: int
+    multiset_digest: int    # order-insensitive digest of all rows, also ignoring the order of columns
+    row_hashes: frozenset   # hashes of the distinct rows, for precision / recall
+    sample: List[tuple]     # first rows, only used to report mismatches
+    columns: List[str]
+
+
+class Comparison(NamedTuple):
+    correct: bool
+    precision: float
+    recall: float
+    f1: float
+    tp: int
+
+
+def _canonical(value) -> str:
+    # 1 and 1.0 are equal in SQL results, give them the same representation
+    if isinstance(value, float) and value.is_integer():
+        return repr(int(value))
+    return repr(value)
+
+
+def _hash(text: str) -> int:
+    # Stable across processes, unlike hash(), so digests can be stored on disk
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+
+def row_hash(row) -> int:
+    """Hash of a row as a tuple (column order matters)."""
+    return _hash("\x1f".join(_canonical(v) for v in row))
+
+
+def unordered_row_hash(row) -> int:
+    """Hash of a row as a set of values, so results with reordered columns compare equal."""
+    return _hash("\x1f".join(sorted({_canonical(v) for v in row})))
+
+
+def digest_rows(rows: Iterable, columns: Optional[List[str]] = None, sample_size: int = SAMPLE_ROWS) -> ResultDigest:
+    """
+    Summarises a result set in one pass, without keeping the rows in memory.
+    """
+    count, digest, hashes, sample = 0, 0, set(), []
+    for row in rows:
+        count += 1
+        digest = (digest + unordered_row_hash(row)) & _MASK
+        hashes.add(row_hash(row))
+        if len(sample) < sample_size:
+            sample.append(tuple(row))
+    return ResultDigest(count, digest, frozenset(hashes), sample, list(columns or []))
+
+
+def iter_cursor(cursor: sqlite3.Cursor, batch_size: int = FETCH_BATCH) -> Iterator[tuple]:
+    """Streams the rows of an executed cursor in batches."""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield from batch
+
+
+def digest_query(db_path: str, sql: str, sample_size: int = SAMPLE_ROWS,
+                 timeout_sec: Optional[float] = None) -> Tuple[Optional[ResultDigest], Optional[str]]:
+    """
+    Executes `sql` and digests its rows while they are fetched.
+    With `timeout_sec` the query is interrupted once it runs longer and the error is "timeout".
+
+    Returns:
+        (digest, error): error is None on success
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if timeout_sec is not None:
+            deadline = time.monotonic() + timeout_sec
+            conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10_000)
+        cursor = conn.execute(sql)
+        columns = [d[0] for d in cursor.description or []]
+        return digest_rows(iter_cursor(cursor), columns, sample_size), None
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e).lower():
+            return None, "timeout"
+        return None, str(e)
+    except Exception as e:
+        return None, str(e)
+    finally:
+        conn.close()
+
+
+def compare(pred: ResultDigest, gt: ResultDigest) -> Comparison:
+    """
+    Compares two digests: correct when both hold the same multiset of rows (row and column order ignored),
+    precision / recall / F1 over the distinct rows.
+    """
+    correct = pred.row_count == gt.row_count and pred.multiset_digest == gt.multiset_digest
+    tp = len(pred.row_hashes & gt.row_hashes)
+    prec = tp / len(pred.row_hashes) if pred.row_hashes else 0.0
+    rec = tp / len(gt.row_hashes) if gt.row_hashes else 0.0
+    f1 = 2 * prec * rec / (prec + rec) if prec + rec else 0.0
+    return Comparison(correct, prec, rec, f1, tp)
+
+
+def sample_to_json(digest: ResultDigest) -> str:
+    """Capped mismatch payload: the sampled rows as JSON records, with the total row count."""
+    records = [dict(zip(digest.columns, row)) if digest.columns else list(row) for row in digest.sample]
+    return json.dumps({"row_count": digest.row_count, "rows": records}, ensure_ascii=False, default=str)
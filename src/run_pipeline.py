@@ -2,44 +2,94 @@ from pipeline.query_generator.CandidateGenerator import *
 from plotter.Plotter import *
 from plotter.schema_explorer import *
 from pipeline.query_generator.ValidateQueries import UnitTester 
+from pipeline.query_generator.SQLParser import normalize_sql
+from pipeline.query_generator.QueryPlanner import rank_candidates
 from pipeline.question_processing.schema_selector import *
 from models import get_spacy_model, get_embedding_model
 from database_manager import DBManager
 from pipeline.translator.Translator import translate
+from tracer import StageTracer
+from column_profiler import format_value_hints
+from pipeline.cancellation import CancellationToken
 
-def run_pipeline(question : str, db_manager : DBManager, fuzz_threshold=80, similarity_threshold=0):
+def run_pipeline(question : str, db_manager : DBManager, fuzz_threshold=80, similarity_threshold=0, on_provisional=None, tracer=None, cancel_token=None):
+    """
+    Runs the whole pipeline on a question and returns (best_query, rows, columns).
+
+    Speculative mode: if `on_provisional` is given, it is called with (query, rows, columns) for the
+    first safe candidate that returns rows, while the remaining candidates and the unit tester keep running.
+    The returned result is the final winner, which may or may not be the provisional one.
+
+    If `tracer` is given, the time of every stage and the LLM token usage are recorded in it.
+    If `cancel_token` is cancelled, the running stage is interrupted and PipelineCancelled is raised.
+    """
+    tracer = tracer or StageTracer()
+    cancel_token = cancel_token or CancellationToken()
 
     # Translate the question if in arabic
-    question = translate(question)
+    with tracer.stage("translation"):
+        question = cancel_token.run(translate, question)
 
     # Load pre-trained language models
-    spacy_model = get_spacy_model()
-    bert_model = get_embedding_model()
+    with tracer.stage("model_loading"):
+        spacy_model = get_spacy_model()
+        bert_model = get_embedding_model()
 
     schema = db_manager.schema
     embeddings = db_manager.embeddings
 
-    # Select the schema related to the question
-    selected_schema = select_schema(question, schema, embeddings, spacy_model, bert_model, fuzz_threshold=fuzz_threshold, similarity_threshold=similarity_threshold)
+    # Select the schema related to the question, with the columns whose values the question mentions
+    cancel_token.check()
+    with tracer.stage("schema_selection"):
+        value_matches = db_manager.profiler.value_matches(question, schema)
+        selected_schema = select_schema(question, schema, embeddings, spacy_model, bert_model, fuzz_threshold=fuzz_threshold, similarity_threshold=similarity_threshold, value_matches=value_matches)
+
+    # Show the first working candidate right away, without waiting for the others.
+    # The candidate already ran (with a timeout) to be checked, its rows and columns are shown as they are.
+    provisional = {}
+    def on_candidate(query, rows_, columns_, err):
+        if on_provisional is None or provisional:
+            return
+        if err is not None or not rows_ or not is_safe_select(query):
+            return
+        provisional["query"] = query
+        on_provisional(query, rows_, columns_)
 
     # Genrate SQL queries
-    res = run_candidate_generator(question, db_manager.db_path, selected_schema, 3)
+    res = run_candidate_generator(question, db_manager.db_path, selected_schema, 3, on_candidate=on_candidate, full_schema=schema, tracer=tracer, value_hints=format_value_hints(value_matches), cancel_token=cancel_token)
 
-    candidates = [
-        query for query, rows_, err in res
-        if err is None and rows_ and len(rows_) > 0
-    ]
+    # Keep working candidates, dropping the ones that only differ in formatting
+    candidates = []
+    results = {}    # query -> (rows, columns) of its checking execution
+    seen = set()
+    for query, rows_, columns_, err in res:
+        if err is None and rows_ and len(rows_) > 0 and normalize_sql(query) not in seen:
+            seen.add(normalize_sql(query))
+            candidates.append(query)
+            results[query] = (rows_, columns_)
 
     if not candidates:
         raise Exception
 
+    # Cheapest plans first, so ties in the unit tests go to the faster query
+    cancel_token.check()
+    with tracer.stage("ranking"):
+        candidates = rank_candidates(db_manager.db_path, candidates)
+
     # Select the best SQL query
     if len(candidates) == 1:
         best_query = candidates[0]
     else:
-        tester = UnitTester(k_unit_tests=4)
+        tester = UnitTester(k_unit_tests=4, tracer=tracer, cancel_token=cancel_token)
         best_query = tester.choose_best(question, candidates)
 
-    rows, columns, _ = execute_query_rows_columns(db_manager.db_path, best_query)
+    # Every candidate already ran, the winner is not executed again
+    if best_query in results:
+        rows, columns = results[best_query]
+        return best_query, rows, columns
+
+    with tracer.stage("final_execution"):
+        rows, columns, _ = execute_query_rows_columns(db_manager.db_path, best_query, cancel_token, db_manager.read_pool)
+    cancel_token.check()
 
     return best_query, rows, columns
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+
+class StageTracer:
+    """
+    Collects the time spent in each pipeline stage and the LLM token usage while answering one question.
+
+    Usage:
+        tracer = StageTracer()
+        with tracer.stage("translation"):
+            ...
+        tracer.record_llm(response)
+    """
+    def __init__(self):
+        self.spans: List[Tuple[str, float, float]] = []   # (stage, start offset, seconds)
+        self.tokens: Dict[str, int] = defaultdict(int)     # input_tokens, output_tokens, total_tokens
+        self.llm_calls = 0
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times the enclosed block as one span of stage `name`, stages can repeat."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append((name, start - self._start, end - start))
+
+    def record_llm(self, response):
+        """
+        Adds the token usage reported by the provider in an LLM response (a langchain AIMessage).
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+            usage = {
+                "input_tokens": token_usage.get("prompt_tokens", 0),
+                "output_tokens": token_usage.get("completion_tokens", 0),
+                "total_tokens": token_usage.get("total_tokens", 0),
+            }
+        with self._lock:
+            self.llm_calls += 1
+            for key in ("input_tokens", "output_tokens", "total_tokens"):
+                self.tokens[key] += usage.get(key, 0) or 0
+
+    def totals(self) -> Dict[str, float]:
+        """Total seconds per stage."""
+        totals = defaultdict(float)
+        for name, _, seconds in self.spans:
+            totals[name] += seconds
+        return dict(totals)
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": self.totals(),
+            "spans": [{"stage": name, "start": round(start, 4), "sec": round(sec, 4)} for name, start, sec in self.spans],
+            "tokens": dict(self.tokens),
+            "llm_calls": self.llm_calls,
+        }
+
+
+def percentiles(values: Iterable[float], qs=(50, 95, 99)) -> Dict[int, float]:
+    """Nearest-rank percentiles of `values`, 0.0 for an empty list."""
+    values = sorted(values)
+    if not values:
+        return {q: 0.0 for q in qs}
+    return {q: values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))] for q in qs}
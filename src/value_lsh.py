@@ -0,0 +1,183 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+SHINGLE = 3             # characters per shingle
+BANDS = 8               # LSH bands, with ROWS the collision threshold is about (1/BANDS)^(1/ROWS) ~ 0.6
+ROWS = 4                # minhashes per band
+NUM_PERM = BANDS * ROWS
+MIN_SIMILARITY = 0.6    # estimated Jaccard similarity for a match
+MIN_PHRASE_LEN = 4      # shorter phrases match too many values
+MAX_COLUMN_VALUES = 1_000_000
+INSERT_BATCH = 10_000
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, (1 << 31) - 1, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, (1 << 31) - 1, NUM_PERM).astype(np.uint64)
+
+
+def shingles(value: str) -> np.ndarray:
+    """Stable hashes of the character shingles of a normalized value."""
+    text = f" {' '.join(value.lower().split())} "
+    grams = {text[i:i + SHINGLE] for i in range(max(1, len(text) - SHINGLE + 1))}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash(value: str) -> np.ndarray:
+    """MinHash signature of `value`, NUM_PERM values."""
+    x = shingles(value) % _PRIME
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """One bucket key per band, signed 64-bit so it fits an SQLite INTEGER."""
+    buckets = []
+    for band in range(BANDS):
+        chunk = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(bytes([band]) + chunk.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+class ValueLSH:
+    """
+    Approximate index from text values to the columns holding them, for columns with too many distinct
+    values to index exactly. Values are MinHash signatures of their character shingles, banded for LSH
+    and stored in `{history_dir}/values_lsh.sqlite`, so a question phrase is matched with a few indexed lookups.
+
+    Args:
+        history_dir (str): history directory of the database
+    """
+    def __init__(self, history_dir: str):
+        self.path = os.path.join(history_dir, "values_lsh.sqlite")
+        self._local = threading.local()
+        self._connections = []      # every thread's connection, for close
+        self._connections_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL;")   # questions can be matched while a column is being indexed
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS lsh_columns (
+                table_name TEXT, column_name TEXT, table_hash TEXT, values_count INTEGER,
+                PRIMARY KEY (table_name, column_name)
+            );
+            CREATE TABLE IF NOT EXISTS lsh_values (
+                id INTEGER PRIMARY KEY, table_name TEXT, column_name TEXT, value TEXT, signature BLOB
+            );
+            CREATE TABLE IF NOT EXISTS lsh_buckets (bucket INTEGER, value_id INTEGER);
+            CREATE INDEX IF NOT EXISTS lsh_buckets_bucket ON lsh_buckets (bucket);
+            CREATE INDEX IF NOT EXISTS lsh_buckets_value ON lsh_buckets (value_id);
+            CREATE INDEX IF NOT EXISTS lsh_values_column ON lsh_values (table_name, column_name);
+        """)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread: the profiler builds while the pipeline queries
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def is_indexed(self, table: str, column: str, table_hash: str) -> bool:
+        row = self._conn().execute(
+            "SELECT table_hash FROM lsh_columns WHERE table_name = ? AND column_name = ?", (table, column)).fetchone()
+        return row is not None and row[0] == table_hash
+
+    def index_column(self, db_conn: sqlite3.Connection, table: str, column: str, table_hash: str) -> int:
+        """
+        (Re)builds the index of the distinct text values of one column, streaming them from `db_conn`.
+        Returns the number of values indexed.
+        """
+        conn = self._conn()
+        self.drop_column(table, column)
+        quoted_table = '"' + table.replace('"', '""') + '"'
+        quoted_column = '"' + column.replace('"', '""') + '"'
+        cursor = db_conn.execute(
+            f"SELECT DISTINCT {quoted_column} FROM {quoted_table} "
+            f"WHERE typeof({quoted_column}) = 'text' AND length({quoted_column}) BETWEEN 2 AND 64 LIMIT {MAX_COLUMN_VALUES};")
+
+        count = 0
+        while True:
+            batch = cursor.fetchmany(INSERT_BATCH)
+            if not batch:
+                break
+            next_id = (conn.execute("SELECT max(id) FROM lsh_values").fetchone()[0] or 0) + 1
+            values, buckets = [], []
+            for offset, (value,) in enumerate(batch):
+                signature = minhash(value)
+                values.append((next_id + offset, table, column, value, signature.astype(np.uint32).tobytes()))
+                buckets.extend((bucket, next_id + offset) for bucket in band_buckets(signature))
+            conn.executemany("INSERT INTO lsh_values VALUES (?, ?, ?, ?, ?)", values)
+            conn.executemany("INSERT INTO lsh_buckets VALUES (?, ?)", buckets)
+            count += len(batch)
+        conn.execute("INSERT OR REPLACE INTO lsh_columns VALUES (?, ?, ?, ?)", (table, column, table_hash, count))
+        conn.commit()
+        return count
+
+    def drop_column(self, table: str, column: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM lsh_buckets WHERE value_id IN (SELECT id FROM lsh_values WHERE table_name = ? AND column_name = ?)", (table, column))
+        conn.execute("DELETE FROM lsh_values WHERE table_name = ? AND column_name = ?", (table, column))
+        conn.execute("DELETE FROM lsh_columns WHERE table_name = ? AND column_name = ?", (table, column))
+        conn.commit()
+
+    def match(self, phrases: Iterable[str], schema: Optional[Dict[str, Dict[str, str]]] = None,
+              min_similarity: float = MIN_SIMILARITY) -> Dict[Tuple[str, str], List[str]]:
+        """
+        Finds the stored values that are similar to the question phrases.
+
+        Returns:
+            {(table, column): [stored values, most similar first]}
+        """
+        signatures, bucket_phrases = {}, defaultdict(set)
+        for phrase in phrases:
+            if len(phrase) < MIN_PHRASE_LEN:
+                continue
+            signatures[phrase] = minhash(phrase)
+            for bucket in band_buckets(signatures[phrase]):
+                bucket_phrases[bucket].add(phrase)
+        if not bucket_phrases:
+            return {}
+
+        conn = self._conn()
+        candidates = defaultdict(set)   # value id -> phrases sharing a bucket
+        buckets = list(bucket_phrases)
+        for start in range(0, len(buckets), 500):
+            chunk = buckets[start:start + 500]
+            for bucket, value_id in conn.execute(
+                    f"SELECT bucket, value_id FROM lsh_buckets WHERE bucket IN ({','.join('?' * len(chunk))})", chunk):
+                candidates[value_id] |= bucket_phrases[bucket]
+        if not candidates:
+            return {}
+
+        scored = defaultdict(list)
+        ids = list(candidates)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id, table_name, column_name, value, signature FROM lsh_values WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            for value_id, table, column, value, signature in rows:
+                if schema is not None and column not in schema.get(table, {}):
+                    continue
+                stored = np.frombuffer(signature, dtype=np.uint32)
+                similarity = max(float(np.mean(stored == signatures[p].astype(np.uint32))) for p in candidates[value_id])
+                if similarity >= min_similarity:
+                    scored[(table, column)].append((similarity, value))
+        return {key: [value for _, value in sorted(values, reverse=True)] for key, values in scored.items()}
+
+    def close(self):
+        """Closes the connections of every thread, not only the calling one."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
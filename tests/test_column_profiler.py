@@ -0,0 +1,162 @@
+import sqlite3
+import threading
+
+import pytest
+
+import column_profiler
+from column_profiler import (
+    INDEX_VALUES, ColumnProfiler, format_value_hints, normalize_value, profile_table, sample_table,
+)
+
+CITIES = ["New York", "Santa Fe", "London", "Cairo"]
+
+
+def make_db(path, people=100, streets=INDEX_VALUES + 50):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE people (id INTEGER PRIMARY KEY, name TEXT, city TEXT, age INTEGER)")
+    conn.executemany("INSERT INTO people VALUES (?, ?, ?, ?)",
+                     [(i, f"person {i}", CITIES[i % 4], None if i % 10 == 0 else 20 + i % 50) for i in range(1, people + 1)])
+    conn.execute("CREATE TABLE streets (name TEXT)")
+    conn.executemany("INSERT INTO streets VALUES (?)", [(f"Street Number {i:05}",) for i in range(streets)])
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.sqlite")
+    make_db(path)
+    return path
+
+
+@pytest.fixture
+def phrases(monkeypatch):
+    """Question phrases without spaCy: every run of up to 4 words."""
+    def question_phrases(question):
+        words = [w.strip("?,.'\"") for w in question.lower().split()]
+        return {" ".join(words[i:i + n]) for n in range(1, 5) for i in range(len(words) - n + 1)}
+    monkeypatch.setattr(column_profiler, "question_phrases", question_phrases)
+
+
+def profiled(db_path, tmp_path, hashes=None):
+    profiler = ColumnProfiler(db_path, str(tmp_path / "history"), hashes or {"people": "h1", "streets": "h1"})
+    profiler.start()
+    assert profiler.ready.wait(10) and profiler.lsh_ready.wait(10)
+    profiler.stop()
+    return profiler
+
+
+def test_normalize_value():
+    assert normalize_value("  New   York ") == "new york"
+
+
+def test_sample_small_table_reads_every_row(db_path):
+    conn = sqlite3.connect(db_path)
+    columns, rows, count = sample_table(conn, "people", sample_rows=500)
+    assert columns == ["id", "name", "city", "age"]
+    assert len(rows) == count == 100
+    conn.close()
+
+
+def test_sample_large_table_by_rowid(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM people WHERE id % 2 = 0")     # rowid gaps
+    columns, rows, count = sample_table(conn, "people", sample_rows=40)
+    assert len(rows) <= 40
+    assert all(row[0] % 2 == 1 for row in rows)
+    assert len({row[0] for row in rows}) == len(rows)
+    assert 0 < count <= 100                                 # estimated from the share of rowids that exist
+    conn.close()
+
+
+def test_sample_without_rowid_table(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "w.sqlite"))
+    conn.execute('CREATE TABLE "odd ""name""" (k TEXT PRIMARY KEY, v INTEGER) WITHOUT ROWID')
+    conn.executemany('INSERT INTO "odd ""name""" VALUES (?, ?)', [(f"k{i}", i) for i in range(30)])
+    columns, rows, count = sample_table(conn, 'odd "name"', sample_rows=10)
+    assert columns == ["k", "v"] and len(rows) == count == 10
+    conn.close()
+
+
+def test_profile_table(db_path):
+    conn = sqlite3.connect(db_path)
+    profile = profile_table(conn, "people")
+    conn.close()
+    city, age = profile["columns"]["city"], profile["columns"]["age"]
+    assert profile["rows"] == profile["sampled"] == 100
+    assert city["distinct"] == 4 and city["text_ratio"] == 1.0
+    assert sorted(value for value, _ in city["top"]) == sorted(CITIES)
+    assert age["null_ratio"] == 0.1 and age["min"] == 21 and age["max"] == 69
+    assert profile["values"]["new york"] == [["city", "New York"]]
+    assert "21" not in profile["values"]
+
+
+def test_profiles_are_saved_and_reused(db_path, tmp_path):
+    profiler = profiled(db_path, tmp_path)
+    assert profiler.pending_tables() == []
+    assert profiler.value_index["santa fe"] == {("people", "city"): "Santa Fe"}
+
+    reloaded = ColumnProfiler(db_path, str(tmp_path / "history"), {"people": "h1", "streets": "h1"})
+    assert reloaded.pending_tables() == [] and reloaded.pending_lsh_columns() == []
+    reloaded.start()
+    assert reloaded._thread is None and reloaded.ready.is_set()
+
+    changed = ColumnProfiler(db_path, str(tmp_path / "history"), {"people": "h2", "streets": "h1"})
+    assert changed.pending_tables() == ["people"]
+
+
+def test_high_cardinality_text_columns_are_lsh_indexed(db_path, tmp_path):
+    profiler = profiled(db_path, tmp_path)
+    assert profiler.lsh.is_indexed("streets", "name", "h1")
+    assert not profiler.lsh.is_indexed("people", "city", "h1")
+    assert profiler.pending_lsh_columns() == []
+
+
+def test_value_matches(db_path, tmp_path, phrases):
+    profiler = profiled(db_path, tmp_path)
+    matches = profiler.value_matches("How many people live in new york?")
+    assert matches[("people", "city")] == ["New York"]
+    assert profiler.value_matches("How many people live in new york?", {"streets": {"name": "TEXT"}}) == {}
+    # not one of the frequent values, found through the LSH index
+    assert profiler.value_matches("Who lives on street number 00123?")[("streets", "name")][0] == "Street Number 00123"
+
+
+def test_contained_values_are_not_repeated(db_path, tmp_path, phrases):
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO people (name, city) VALUES (?, ?)", [("x", "York")] * 5)
+    conn.commit()
+    conn.close()
+    profiler = profiled(db_path, tmp_path)
+    assert profiler.value_matches("people in new york")[("people", "city")] == ["New York"]
+
+
+def test_stop_interrupts_profiling(db_path, tmp_path, monkeypatch):
+    started = threading.Event()
+
+    def endless_profile(conn, table, sample_rows=None):
+        conn.set_progress_handler(lambda: started.set(), 1000)     # set once the query runs
+        conn.execute("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c").fetchone()
+
+    monkeypatch.setattr(column_profiler, "profile_table", endless_profile)
+    profiler = ColumnProfiler(db_path, str(tmp_path / "history"), {"people": "h1", "streets": "h1"})
+    profiler.start()
+    assert started.wait(10)
+    stopper = threading.Thread(target=profiler.stop)
+    stopper.start()
+    stopper.join(10)
+    assert not stopper.is_alive() and not profiler._thread.is_alive()
+    assert profiler.pending_tables() == ["people", "streets"]      # stopped before the next table
+    assert profiler.ready.is_set()
+
+
+def test_format_value_hints():
+    assert format_value_hints({}) == ""
+    assert format_value_hints({("people", "city"): ["New York", "Cairo"]}) == \
+        "Values mentioned in the question: people.city contains 'New York', 'Cairo'."
+
+
+def test_question_phrases():
+    pytest.importorskip("spacy")
+    phrases = column_profiler.question_phrases('Which movies did "Wes Anderson" direct in New York?')
+    assert {"wes anderson", "new york", "movies"} <= phrases
+    assert "in" not in phrases and "which" not in phrases
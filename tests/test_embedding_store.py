@@ -0,0 +1,182 @@
+import glob
+import os
+import pickle
+import threading
+
+import numpy as np
+import pytest
+
+from embedding_store import VECTORS_FILE, EmbeddingStore
+
+DIM = 8
+
+
+def vector(seed):
+    return np.random.RandomState(seed).rand(DIM).astype(np.float32)
+
+
+def vector_files(directory):
+    return sorted(os.path.basename(p) for p in glob.glob(os.path.join(directory, "vectors*.bin")))
+
+
+def test_put_get_and_reload(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    assert store.get("t", "a") is None and len(store) == 0
+    store.put_many({("t", "a"): vector(1), ("t", "b"): vector(2)})
+    assert ("t", "a") in store and ("t", "c") not in store
+    np.testing.assert_array_equal(store.get("t", "b"), vector(2))
+    store.save()
+
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert len(reloaded) == 2
+    np.testing.assert_array_equal(reloaded.get("t", "a"), vector(1))
+    assert vector_files(tmp_path) == [VECTORS_FILE]
+
+
+def test_update_appends_and_repoints(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("t", "a", vector(1))
+    store.put("t", "a", vector(3))
+    assert store.stored == 2 and len(store) == 1
+    np.testing.assert_array_equal(store.get("t", "a"), vector(3))
+
+
+def test_float16_store(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dtype=np.float16)
+    store.put("t", "a", vector(1))
+    store.save()
+    assert os.path.getsize(tmp_path / VECTORS_FILE) == DIM * 2
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert reloaded.dtype == np.float16
+    np.testing.assert_allclose(reloaded.get("t", "a"), vector(1), atol=1e-3)
+
+
+def test_wrong_dimension_is_refused(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("t", "a", vector(1))
+    with pytest.raises(ValueError):
+        store.put("t", "b", np.zeros(DIM + 1))
+
+
+def test_remove_retain_and_remove_table(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many({("t", "a"): vector(1), ("t", "b"): vector(2), ("t", "c"): vector(3),
+                    ("u", "a"): vector(4), ("tt", "a"): vector(5)})
+    store.remove("t", "a")
+    store.retain("t", ["b"])
+    assert {key for key in [("t", "a"), ("t", "b"), ("t", "c")] if key in store} == {("t", "b")}
+    store.remove_table("t")
+    assert ("t", "b") not in store
+    assert ("tt", "a") in store and ("u", "a") in store     # only the exact table prefix is removed
+
+
+def test_compaction_drops_unreferenced_rows(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many({("t", "a"): vector(1), ("t", "b"): vector(2)})
+    for i in range(18):
+        store.put("t", "a", vector(100 + i))
+    store.save()
+    assert store.stored == 20           # at the threshold (2 * 2 rows + 16), not compacted
+    assert vector_files(tmp_path) == [VECTORS_FILE]
+    store.put("t", "a", vector(200))
+    store.remove("t", "b")
+    store.put("t", "c", vector(300))
+    store.save()
+
+    assert store.stored == 2
+    files = vector_files(tmp_path)
+    assert len(files) == 1 and files[0] != VECTORS_FILE     # the old file is removed once the index points at the new one
+    assert os.path.getsize(tmp_path / files[0]) == 2 * DIM * 4
+
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert reloaded.stored == 2 and len(reloaded) == 2
+    np.testing.assert_array_equal(reloaded.get("t", "a"), vector(200))
+    np.testing.assert_array_equal(reloaded.get("t", "c"), vector(300))
+    assert reloaded.get("t", "b") is None
+
+    # appending after a compaction writes to the compacted file
+    reloaded.put("t", "d", vector(400))
+    reloaded.save()
+    np.testing.assert_array_equal(EmbeddingStore(str(tmp_path)).get("t", "d"), vector(400))
+
+
+def test_compaction_of_everything(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    for i in range(20):
+        store.put("t", "a", vector(i))
+    store.remove_table("t")
+    store.save()
+    assert store.stored == 0 and store.get("t", "a") is None
+    assert len(EmbeddingStore(str(tmp_path))) == 0
+
+
+def test_interrupted_compaction_is_cleaned_up(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("t", "a", vector(1))
+    store.save()
+    # a compaction that crashed before writing its index leaves an unreferenced vectors file
+    (tmp_path / "vectors.deadbeef.bin").write_bytes(b"\0" * DIM * 4)
+    reloaded = EmbeddingStore(str(tmp_path))
+    np.testing.assert_array_equal(reloaded.get("t", "a"), vector(1))
+
+    for i in range(20):
+        reloaded.put("t", "b", vector(i))
+    reloaded.save()
+    assert "vectors.deadbeef.bin" not in vector_files(tmp_path)
+    assert len(vector_files(tmp_path)) == 1
+
+
+def test_unsaved_rows_are_overwritten(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("t", "a", vector(1))
+    store.save()
+    store.put("t", "b", vector(2))      # the run stops before save()
+
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert ("t", "b") not in reloaded
+    reloaded.put("t", "c", vector(3))
+    reloaded.save()
+    assert os.path.getsize(tmp_path / VECTORS_FILE) == 2 * DIM * 4
+    np.testing.assert_array_equal(EmbeddingStore(str(tmp_path)).get("t", "c"), vector(3))
+
+
+def test_migrate_pickle(tmp_path):
+    legacy = tmp_path / "embeddings.pkl"
+    with open(legacy, "wb") as f:
+        pickle.dump({"t": {"a": vector(1), "b": "no embedding yet"}, "u": {"c": vector(2)}}, f)
+    store = EmbeddingStore(str(tmp_path))
+    assert store.migrate_pickle(str(legacy)) == 2
+    assert not legacy.exists()
+    reloaded = EmbeddingStore(str(tmp_path))
+    np.testing.assert_array_equal(reloaded.get("u", "c"), vector(2))
+    assert ("t", "b") not in reloaded
+
+
+def test_concurrent_reads_while_saving(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many({("t", c): vector(i) for i, c in enumerate("abcd")})
+    errors, stop = [], threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                for i, c in enumerate("abcd"):
+                    got = store.get("t", c)
+                    if got is None or not (np.array_equal(got, vector(i)) or np.array_equal(got, vector(i + 100))):
+                        errors.append((c, got))
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for round_ in range(30):
+            store.put_many({("t", c): vector(i + 100 * (round_ % 2)) for i, c in enumerate("abcd")})
+            store.save()    # compacts every few rounds
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    assert errors == []
+    assert len(vector_files(tmp_path)) == 1
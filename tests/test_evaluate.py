@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+evaluate = pytest.importorskip("evaluate")   # imports the pipeline, needs its dependencies (spacy, langchain_groq, ...)
+
+
+class FakeGTCache:
+    def __init__(self, path):
+        pass
+
+    def precompute(self, items, db_root, workers, timeout):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def bird(tmp_path, monkeypatch):
+    """A dataset where the same question appears twice, with different gold queries."""
+    dataset = [
+        {"db_id": "movies", "question": "How many movies?", "SQL": "SELECT count(*) FROM movies"},
+        {"db_id": "movies", "question": "How many movies?", "SQL": "SELECT count(DISTINCT title) FROM movies"},
+        {"db_id": "books", "question": "How many books?", "SQL": "SELECT count(*) FROM books"},
+    ]
+    train_json = tmp_path / "train.json"
+    train_json.write_text(json.dumps(dataset), encoding="utf-8")
+    evaluated = []
+
+    def fake_evaluate_sample(idx, item, gt_cache=None, gt_timeout=None):
+        evaluated.append(item["SQL"])
+        return {"key": evaluate.sample_key(item), "idx": idx, "db_id": item["db_id"],
+                "question": item["question"], "gt_sql": item["SQL"], "status": "no-db"}
+
+    monkeypatch.setattr(evaluate, "TRAIN_JSON", train_json)
+    monkeypatch.setattr(evaluate, "REPORT_ROOT", tmp_path / "reports")
+    monkeypatch.setattr(evaluate, "CSV_OUT", tmp_path / "reports" / "mismatches.csv")
+    monkeypatch.setattr(evaluate, "GTCache", FakeGTCache)
+    monkeypatch.setattr(evaluate, "evaluate_sample", fake_evaluate_sample)
+    return tmp_path / "reports" / "checkpoint.jsonl", evaluated
+
+
+def run(checkpoint, resume):
+    evaluate.evaluate(max_samples=3, workers=1, checkpoint=checkpoint, resume=resume, gt_workers=1)
+
+
+def checkpoint_records(checkpoint):
+    return [json.loads(line) for line in checkpoint.read_text(encoding="utf-8").splitlines()]
+
+
+def test_duplicate_questions_have_distinct_keys(bird):
+    checkpoint, evaluated = bird
+    run(checkpoint, resume=False)
+    assert len(evaluated) == 3
+    assert len({record["key"] for record in checkpoint_records(checkpoint)}) == 3
+
+
+def test_resume_skips_only_the_finished_duplicate(bird):
+    checkpoint, evaluated = bird
+    run(checkpoint, resume=False)
+    records = checkpoint_records(checkpoint)
+    # the run stopped before the second "How many movies?"
+    unfinished = next(r for r in records if r["gt_sql"] == "SELECT count(DISTINCT title) FROM movies")
+    checkpoint.write_text("".join(json.dumps(r) + "\n" for r in records if r is not unfinished), encoding="utf-8")
+
+    evaluated.clear()
+    run(checkpoint, resume=True)
+    assert evaluated == ["SELECT count(DISTINCT title) FROM movies"]
+    assert len(checkpoint_records(checkpoint)) == 3
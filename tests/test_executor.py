@@ -0,0 +1,168 @@
+import sqlite3
+import sys
+import threading
+import types
+
+import pytest
+
+from pipeline.cancellation import CancellationToken, PipelineCancelled
+from pipeline.executor import PipelineBusy, PipelineExecutor
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """
+    Fake run_pipeline for the executor thread: each question blocks until released or cancelled,
+    and the order in which questions start is recorded.
+    """
+    state = {"started": [], "release": threading.Event(), "running": threading.Event()}
+
+    def run_pipeline(question, db_manager, on_provisional=None, cancel_token=None):
+        state["started"].append(question)
+        state["running"].set()
+        with cancel_token.interrupting(state["release"].set):
+            state["release"].wait()
+        cancel_token.check()
+        return question, [(1,)], ["a"]
+
+    monkeypatch.setitem(sys.modules, "run_pipeline", types.SimpleNamespace(run_pipeline=run_pipeline))
+    return state
+
+
+def test_runs_in_submission_order(pipeline):
+    executor = PipelineExecutor()
+    pipeline["release"].set()
+    requests = [executor.submit(f"q{i}", None) for i in range(3)]
+    assert [r.future.result(TIMEOUT)[0] for r in requests] == ["q0", "q1", "q2"]
+    assert pipeline["started"] == ["q0", "q1", "q2"]
+
+
+def test_queue_is_bounded(pipeline):
+    executor = PipelineExecutor(max_pending=2)
+    running = executor.submit("running", None)
+    assert pipeline["running"].wait(TIMEOUT)        # taken off the queue by the executor thread
+    queued = [executor.submit(f"q{i}", None) for i in range(2)]
+    assert executor.pending() == 2
+    with pytest.raises(PipelineBusy):
+        executor.submit("one too many", None)
+
+    pipeline["release"].set()
+    assert running.future.result(TIMEOUT)[0] == "running"
+    assert [r.future.result(TIMEOUT)[0] for r in queued] == ["q0", "q1"]
+
+
+def test_cancel_running_request(pipeline):
+    executor = PipelineExecutor()
+    running = executor.submit("running", None)
+    assert pipeline["running"].wait(TIMEOUT)
+    running.cancel()
+    with pytest.raises(PipelineCancelled):
+        running.future.result(TIMEOUT)
+
+
+def test_cancel_queued_request_never_runs(pipeline):
+    executor = PipelineExecutor()
+    running = executor.submit("running", None)
+    assert pipeline["running"].wait(TIMEOUT)
+    queued = executor.submit("queued", None)
+    after = executor.submit("after", None)
+    queued.cancel()
+
+    pipeline["release"].set()
+    with pytest.raises(PipelineCancelled):
+        queued.future.result(TIMEOUT)
+    assert after.future.result(TIMEOUT)[0] == "after"
+    assert running.future.result(TIMEOUT)[0] == "running"
+    assert pipeline["started"] == ["running", "after"]
+
+
+def test_cancel_all(pipeline):
+    executor = PipelineExecutor()
+    running = executor.submit("running", None)
+    assert pipeline["running"].wait(TIMEOUT)
+    queued = [executor.submit(f"q{i}", None) for i in range(3)]
+    executor.cancel_all()
+
+    for request in [running] + queued:
+        with pytest.raises(PipelineCancelled):
+            request.future.result(TIMEOUT)
+    assert executor.pending() == 0
+    assert pipeline["started"] == ["running"]
+
+
+def test_failure_is_reported_and_the_next_request_runs(monkeypatch):
+    def run_pipeline(question, db_manager, on_provisional=None, cancel_token=None):
+        if question == "bad":
+            raise ValueError("no candidate")
+        return question, [], []
+
+    monkeypatch.setitem(sys.modules, "run_pipeline", types.SimpleNamespace(run_pipeline=run_pipeline))
+    executor = PipelineExecutor()
+    bad, good = executor.submit("bad", None), executor.submit("good", None)
+    with pytest.raises(ValueError):
+        bad.future.result(TIMEOUT)
+    assert good.future.result(TIMEOUT)[0] == "good"
+
+
+def test_run_returns_the_result():
+    assert CancellationToken().run(lambda a, b=0: a + b, 1, b=2) == 3
+    with pytest.raises(ZeroDivisionError):
+        CancellationToken().run(lambda: 1 / 0)
+
+
+def test_run_abandons_a_blocking_call():
+    token = CancellationToken()
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(TIMEOUT)
+        return "late"
+
+    threading.Timer(0, lambda: started.wait(TIMEOUT) and token.cancel()).start()
+    try:
+        with pytest.raises(PipelineCancelled):
+            token.run(blocking)
+        assert not release.is_set()     # returned while the call was still blocked
+    finally:
+        release.set()
+
+
+def test_run_after_cancel_does_not_call():
+    token = CancellationToken()
+    token.cancel()
+    calls = []
+    with pytest.raises(PipelineCancelled):
+        token.run(calls.append, 1)
+    assert calls == []
+
+
+def test_interrupting_interrupts_a_running_query():
+    conn = sqlite3.connect(":memory:")
+    token = CancellationToken()
+    interrupt_calls = []
+
+    def interrupt():
+        interrupt_calls.append(True)
+        conn.interrupt()
+
+    conn.set_progress_handler(lambda: token.cancel() if not token.cancelled else None, 100_000)
+    with token.interrupting(interrupt):
+        with pytest.raises(sqlite3.OperationalError, match="interrupted"):
+            conn.execute("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c").fetchone()
+    assert interrupt_calls == [True]
+    conn.close()
+
+
+def test_interrupting_after_cancel_calls_immediately_and_unregisters():
+    token = CancellationToken()
+    calls = []
+    with token.interrupting(lambda: calls.append("outer")):
+        pass
+    token.cancel()
+    with token.interrupting(lambda: calls.append("inner")):
+        assert calls == ["inner"]
+    token.cancel()
+    assert calls == ["inner"]
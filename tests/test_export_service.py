@@ -0,0 +1,133 @@
+import csv
+import gzip
+import sqlite3
+import threading
+import tracemalloc
+
+import pytest
+
+import export_service
+from database_manager import ConnectionPool
+from export_service import ExportCancelled, export_query
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = tmp_path / "data.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (a NUMERIC, b TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"row {i}") for i in range(6000)] + [(1.5, None)])
+    conn.commit()
+    conn.close()
+    pool = ConnectionPool(str(path))
+    yield pool
+    pool.close()
+
+
+def read_csv(path, opener=open):
+    with opener(path, "rt", newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_with_trailing_semicolon(pool, tmp_path):
+    out = tmp_path / "out.csv"
+    assert export_query(pool, "SELECT a, b FROM t;", str(out)) == 6001
+    rows = read_csv(out)
+    assert rows[0] == ["a", "b"]
+    assert rows[1] == ["0", "row 0"]
+    assert rows[-1] == ["1.5", ""]
+
+
+def test_csv_gz(pool, tmp_path):
+    out = tmp_path / "out.csv.gz"
+    assert export_query(pool, "SELECT a, b FROM t;", str(out)) == 6001
+    assert len(read_csv(out, gzip.open)) == 6002
+
+
+def test_parquet_widens_mixed_numeric_column(pool, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out = tmp_path / "out.parquet"
+    # the float only comes after the first batch of integers
+    assert export_query(pool, "SELECT a, a, b FROM t ORDER BY rowid;", str(out)) == 6001
+    table = pq.read_table(out)
+    assert table.column_names == ["a_0", "a_1", "b"]
+    assert str(table.schema.field("a_0").type) == "double"
+    assert table.column("a_0")[-1].as_py() == 1.5
+    assert table.column("a_0")[10].as_py() == 10.0
+    assert table.column("b")[-1].as_py() is None
+
+
+def test_parquet_text_after_numbers(pool, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out = tmp_path / "out.parquet"
+    sql = "SELECT CASE WHEN rowid > 5500 THEN 'x' || rowid ELSE rowid END AS v FROM t"
+    export_query(pool, sql, str(out))
+    values = pq.read_table(out).column("v").to_pylist()
+    assert values[0] == "1" and values[-1] == "x6001"
+
+
+def test_parquet_empty_result(pool, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out = tmp_path / "out.parquet"
+    assert export_query(pool, "SELECT a, a FROM t WHERE 0;", str(out)) == 0
+    assert pq.read_table(out).column_names == ["a_0", "a_1"]
+
+
+def test_parquet_refuses_lossy_cast(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "big.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (a)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(2 ** 60 + 1,)] * 10 + [(0.5,)])
+    conn.commit()
+    conn.close()
+    pool = ConnectionPool(str(path))
+    with pytest.raises(ValueError):
+        export_query(pool, "SELECT a FROM t", str(tmp_path / "out.parquet"))
+    assert not list(tmp_path.glob("out.parquet*"))
+    pool.close()
+
+
+def test_cancel_before_start_leaves_no_file(pool, tmp_path):
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(ExportCancelled):
+        export_query(pool, "SELECT a, b FROM t", str(tmp_path / "out.csv"), cancel=cancel)
+    assert list(tmp_path.glob("out.csv*")) == []
+
+
+def test_cancel_while_writing(pool, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_service, "FETCH_BATCH", 100)
+    monkeypatch.setattr(export_service, "PROGRESS_INTERVAL", 0)
+    cancel = threading.Event()
+    reported = []
+
+    def progress(written):
+        reported.append(written)
+        if written >= 1000:
+            cancel.set()
+
+    with pytest.raises(ExportCancelled):
+        export_query(pool, "SELECT a, b FROM t", str(tmp_path / "out.csv"), progress=progress, cancel=cancel)
+    assert reported[-1] < 6001
+    assert list(tmp_path.glob("out.csv*")) == []
+
+
+def test_memory_stays_flat(tmp_path):
+    path = tmp_path / "large.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", ((i, "x" * 50) for i in range(200_000)))
+    conn.commit()
+    conn.close()
+    pool = ConnectionPool(str(path))
+
+    tracemalloc.start()
+    try:
+        assert export_query(pool, "SELECT a, b FROM t", str(tmp_path / "out.csv")) == 200_000
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pool.close()
+    # the whole result as Python rows takes well over 30 MB
+    assert peak < 10 * 1024 * 1024
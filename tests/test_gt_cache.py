@@ -0,0 +1,104 @@
+import os
+import sqlite3
+
+import pytest
+
+from gt_cache import GTCache
+from result_compare import compare, digest_rows
+
+SQL = "SELECT a, b FROM t ORDER BY a"
+ROWS = [(1, "x"), (2, "y"), (2, "y"), (3, None)]
+
+
+def make_db(db_root, db_id, rows=ROWS):
+    db_dir = db_root / db_id
+    db_dir.mkdir(parents=True, exist_ok=True)
+    path = db_dir / f"{db_id}.sqlite"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE IF NOT EXISTS t (a INTEGER, b TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = GTCache(tmp_path / "cache" / "gt.sqlite")
+    yield cache
+    cache.close()
+
+
+def test_put_get_round_trip(tmp_path, cache):
+    db_path = make_db(tmp_path, "shop")
+    digest = digest_rows(ROWS, ["a", "b"])
+    assert cache.get("shop", db_path, SQL) is None
+    cache.put("shop", db_path, SQL, digest, None)
+
+    cached, error = cache.get("shop", db_path, SQL)
+    assert error is None
+    assert cached == digest
+    assert compare(cached, digest).correct
+
+
+def test_keyed_on_db_and_sql(tmp_path, cache):
+    db_path = make_db(tmp_path, "shop")
+    cache.put("shop", db_path, SQL, digest_rows(ROWS), None)
+    assert cache.get("shop", db_path, SQL + " LIMIT 1") is None
+    assert cache.get("other", db_path, SQL) is None
+
+
+def test_modified_database_invalidates(tmp_path, cache):
+    db_path = make_db(tmp_path, "shop")
+    cache.put("shop", db_path, SQL, digest_rows(ROWS), None)
+    make_db(tmp_path, "shop", [(4, "z")])
+    stat = os.stat(db_path)
+    os.utime(db_path, (stat.st_atime, stat.st_mtime + 10))    # coarse file systems may keep the same mtime
+    assert cache.get("shop", db_path, SQL) is None
+
+
+def test_errors_and_timeouts(tmp_path, cache):
+    db_path = make_db(tmp_path, "shop")
+    cache.put("shop", db_path, "SELECT nope FROM t", None, "no such column: nope")
+    assert cache.get("shop", db_path, "SELECT nope FROM t") == (None, "no such column: nope")
+
+    # a timeout is only final for limits up to the one it was recorded with
+    cache.put("shop", db_path, SQL, None, "timeout", timeout_sec=5)
+    assert cache.get("shop", db_path, SQL, timeout_sec=5) == (None, "timeout")
+    assert cache.get("shop", db_path, SQL, timeout_sec=1) == (None, "timeout")
+    assert cache.get("shop", db_path, SQL, timeout_sec=60) is None
+
+
+def test_persists_across_instances(tmp_path):
+    db_path = make_db(tmp_path, "shop")
+    path = tmp_path / "gt.sqlite"
+    cache = GTCache(path)
+    cache.put("shop", db_path, SQL, digest_rows(ROWS), None)
+    cache.close()
+    cache = GTCache(path)
+    assert cache.get("shop", db_path, SQL)[0].row_count == 4
+    cache.close()
+
+
+def test_precompute_runs_each_missing_query_once(tmp_path, cache):
+    db_root = tmp_path / "dbs"
+    shop = make_db(db_root, "shop")
+    make_db(db_root, "zoo", [(7, "lion")])
+    samples = [
+        {"db_id": "shop", "SQL": SQL},
+        {"db_id": "shop", "SQL": SQL},                       # same gold query twice
+        {"db_id": "zoo", "SQL": "SELECT b FROM t"},
+        {"db_id": "zoo", "SQL": "SELECT nope FROM t"},
+        {"db_id": "missing", "SQL": "SELECT 1"},             # no database file, skipped
+    ]
+    assert cache.precompute(samples, db_root, workers=1, timeout_sec=10) == 3
+    assert compare(cache.get("shop", shop, SQL, 10)[0], digest_rows(ROWS)).correct
+    assert cache.get("zoo", str(db_root / "zoo" / "zoo.sqlite"), "SELECT nope FROM t", 10) == (None, "no such column: nope")
+    assert cache.precompute(samples, db_root, workers=1, timeout_sec=10) == 0
+
+    make_db(db_root, "zoo", [(8, "tiger")])
+    zoo = str(db_root / "zoo" / "zoo.sqlite")
+    stat = os.stat(zoo)
+    os.utime(zoo, (stat.st_atime, stat.st_mtime + 10))
+    assert cache.precompute(samples, db_root, workers=1, timeout_sec=10) == 2
+    assert cache.get("zoo", zoo, "SELECT b FROM t", 10)[0].row_count == 2
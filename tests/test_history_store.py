@@ -0,0 +1,179 @@
+import json
+import os
+
+import pytest
+
+from history_store import (
+    CATALOG_FILE, HistoryCatalog, ResultStore, legacy_entry_file, migrate_legacy_entry, read_meta,
+)
+
+META = {"query_id": 1, "query_text": "how many movies", "timestamp": "10:00:00", "query_sql": "SELECT 1"}
+
+
+def legacy_entry(results_dir, entry_id, question, rows, columns=("a", "b")):
+    entry_dir = os.path.join(results_dir, str(entry_id))
+    os.makedirs(entry_dir)
+    with open(os.path.join(entry_dir, f"{entry_id}.json"), "w", encoding="utf-8") as f:
+        json.dump({"query_id": entry_id, "query_text": question, "timestamp": "09:00:00",
+                   "query_sql": "SELECT a, b FROM t", "columns": list(columns), "rows": rows}, f)
+    return entry_dir
+
+
+@pytest.fixture
+def store(tmp_path):
+    rows = [(i, f"name {i}", i * 0.5) for i in range(1, 251)]
+    rows += [(251, "100% sure", None), (252, "snake_case", None), (253, "back\\slash", None)]
+    store = ResultStore.write(str(tmp_path / "1"), META, ["id", "name", "score"], rows)
+    yield store
+    store.close()
+
+
+def test_write_keeps_meta_and_types(store):
+    meta = read_meta(store.entry_dir)
+    assert meta["columns"] == ["id", "name", "score"]
+    assert meta["row_count"] == store.row_count == 253
+    assert meta["query_text"] == "how many movies"
+    assert store.read_rows(0, 2) == [(1, "name 1", 0.5), (2, "name 2", 1.0)]
+
+
+def test_read_rows_pages(store):
+    pages = [store.read_rows(offset, 100) for offset in range(0, 300, 100)]
+    assert [len(p) for p in pages] == [100, 100, 53]
+    assert [row[0] for page in pages for row in page] == list(range(1, 254))
+    assert store.read_rows(253, 100) == []
+
+
+def test_iter_rows_batches(store):
+    batches = list(store.iter_rows(batch_size=100))
+    assert [len(b) for b in batches] == [100, 100, 53]
+
+
+def test_write_replaces_previous_result(store):
+    replaced = ResultStore.write(store.entry_dir, META, ["x"], [(1,), (2,)])
+    assert replaced.columns == ["x"]
+    assert replaced.read_rows(0, 10) == [(1,), (2,)]
+    replaced.close()
+
+
+def test_set_view_sorts(store):
+    assert store.set_view(sort_column=0, descending=True) == 253
+    assert [row[0] for row in store.read_rows(0, 3)] == [253, 252, 251]
+    assert store.read_rows(250, 10)[-1][0] == 1
+    # back to query order
+    assert store.set_view() == 253
+    assert store.read_rows(0, 1)[0][0] == 1
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("%", [251]),               # literal percent, not a wildcard
+    ("_", [252]),               # literal underscore
+    ("\\", [253]),              # literal backslash
+    ("name 25", [25, 250]),
+    ("12.5", [25, 225]),        # numbers are matched on their text
+])
+def test_set_view_filter_escapes_like_wildcards(store, text, expected):
+    count = store.set_view(filter_text=text)
+    ids = [row[0] for row in store.read_rows(0, 1000)]
+    assert count == len(ids)
+    assert ids == expected
+
+
+def test_set_view_filter_and_sort(store):
+    assert store.set_view(sort_column=0, descending=True, filter_text="name 1") == 111
+    ids = [row[0] for row in store.read_rows(0, 1000)]
+    assert ids == sorted(ids, reverse=True) and ids[0] == 199
+
+
+def test_legacy_entry_is_migrated_then_removed(tmp_path):
+    entry_dir = legacy_entry(str(tmp_path), 7, "old question", [[1, "x"], [2, None]])
+    store = ResultStore(entry_dir)
+    assert store.meta["query_text"] == "old question"
+    assert store.columns == ["a", "b"]
+    assert store.read_rows(0, 10) == [(1, "x"), (2, None)]
+    store.close()
+    assert legacy_entry_file(entry_dir) is None
+    assert migrate_legacy_entry(entry_dir) is False
+
+
+def test_failed_migration_keeps_legacy_file(tmp_path, monkeypatch):
+    entry_dir = legacy_entry(str(tmp_path), 3, "old question", [[1, "x"]])
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(ResultStore, "write", fail)
+    with pytest.raises(OSError):
+        migrate_legacy_entry(entry_dir)
+    assert legacy_entry_file(entry_dir) is not None
+
+
+@pytest.fixture(params=[True, False], ids=["fts", "like"])
+def catalog(request, tmp_path, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(HistoryCatalog, "_create_fts", lambda self: False)
+    catalog = HistoryCatalog(str(tmp_path / "query_results"))
+    if request.param and not catalog.has_fts:
+        pytest.skip("SQLite built without FTS5")
+    yield catalog
+    catalog.close()
+
+
+def test_catalog_pages_newest_first(catalog):
+    for i in range(1, 8):
+        catalog.add(i, f"question {i}", "10:00", f"SELECT {i}", i)
+    assert catalog.count() == 7
+    assert catalog.max_id() == 7
+    assert [e["id"] for e in catalog.page(0, 3)] == [7, 6, 5]
+    assert [e["id"] for e in catalog.page(6, 3)] == [1]
+    assert catalog.entry_dir(catalog.page(0, 1)[0]).endswith(os.path.join("query_results", "7"))
+
+
+def test_catalog_search(catalog):
+    catalog.add(1, "How many movies were released", "10:00", "SELECT 1", 1)
+    catalog.add(2, "list the actors", "10:01", "SELECT 2", 2)
+    catalog.add(3, "movies by actor", "10:02", "SELECT 3", 3)
+    assert [e["id"] for e in catalog.page(search="movie")] == [3, 1]
+    assert [e["id"] for e in catalog.page(search="movies actor")] == [3]
+    assert catalog.count(search="actors") == 1
+    # user input is never parsed as search syntax
+    assert catalog.page(search='"OR* (') == []
+    assert catalog.page(search="%") == []
+
+
+def test_catalog_add_replaces_on_conflict(catalog):
+    catalog.add(1, "provisional question", "10:00", "SELECT 1", 1)
+    catalog.add(1, "better question", "10:01", "SELECT 2", 5)
+    assert catalog.count() == 1
+    entry = catalog.page()[0]
+    assert (entry["question"], entry["sql"], entry["row_count"]) == ("better question", "SELECT 2", 5)
+    assert catalog.page(search="provisional") == []
+    assert [e["id"] for e in catalog.page(search="better")] == [1]
+
+
+def test_catalog_remove_and_clear(catalog):
+    for i in range(1, 4):
+        catalog.add(i, f"question {i}", "10:00", "SELECT 1", 1)
+    catalog.remove(2)
+    assert [e["id"] for e in catalog.page()] == [3, 1]
+    assert catalog.page(search="question") == catalog.page()
+    catalog.clear()
+    assert catalog.count() == 0 and catalog.count(search="question") == 0
+
+
+def test_catalog_imports_existing_entries_once(tmp_path):
+    results = str(tmp_path / "query_results")
+    legacy_entry(results, 1, "legacy question", [[1, "x"]])
+    ResultStore.write(os.path.join(results, "2"), dict(META, query_text="new question"), ["a"], [(1,)]).close()
+    os.makedirs(os.path.join(results, "notes"))
+
+    catalog = HistoryCatalog(results)
+    assert sorted(e["question"] for e in catalog.page()) == ["legacy question", "new question"]
+    assert legacy_entry_file(os.path.join(results, "1")) is None
+    assert read_meta(os.path.join(results, "1"))["row_count"] == 1
+    catalog.remove(1)
+    catalog.close()
+
+    # not imported again on the next open
+    catalog = HistoryCatalog(results)
+    assert [e["id"] for e in catalog.page()] == [2]
+    assert os.path.exists(os.path.join(results, CATALOG_FILE))
+    catalog.close()
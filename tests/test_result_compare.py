@@ -0,0 +1,95 @@
+import json
+import sqlite3
+
+import pytest
+
+from result_compare import compare, digest_query, digest_rows, iter_cursor, row_hash, sample_to_json
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"v{i % 3}") for i in range(25)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_same_rows_in_any_order_are_correct():
+    rows = [(1, "a"), (2, "b"), (2, "b")]
+    result = compare(digest_rows(rows), digest_rows(list(reversed(rows))))
+    assert result.correct
+    assert (result.precision, result.recall, result.f1, result.tp) == (1.0, 1.0, 1.0, 2)
+
+
+def test_reordered_columns_are_correct():
+    assert compare(digest_rows([(1, "a"), (2, "b")]), digest_rows([("a", 1), ("b", 2)])).correct
+
+
+def test_integer_floats_equal_integers():
+    assert compare(digest_rows([(1.0, 2)]), digest_rows([(1, 2.0)])).correct
+    assert not compare(digest_rows([(1.5,)]), digest_rows([(1,)])).correct
+
+
+def test_duplicates_count():
+    # same distinct rows, different multiplicity
+    result = compare(digest_rows([(1,), (1,)]), digest_rows([(1,)]))
+    assert not result.correct
+    assert result.f1 == 1.0
+
+
+def test_partial_overlap_scores():
+    result = compare(digest_rows([(1,), (2,), (3,), (4,)]), digest_rows([(1,), (2,)]))
+    assert not result.correct
+    assert (result.precision, result.recall, result.tp) == (0.5, 1.0, 2)
+    assert result.f1 == pytest.approx(2 / 3)
+
+
+def test_empty_results():
+    result = compare(digest_rows([]), digest_rows([]))
+    assert result.correct
+    assert result.f1 == 0.0
+    assert not compare(digest_rows([]), digest_rows([(None,)])).correct
+
+
+def test_digest_is_stable_and_ordered_hash_sees_column_order():
+    assert row_hash((1, "a")) == row_hash((1.0, "a"))
+    assert row_hash((1, "a")) != row_hash(("a", 1))
+    assert digest_rows([(1, "x")]).multiset_digest == digest_rows([(1, "x")]).multiset_digest
+
+
+def test_digest_keeps_a_capped_sample():
+    digest = digest_rows(((i,) for i in range(100)), ["n"], sample_size=5)
+    assert digest.row_count == 100
+    assert digest.sample == [(i,) for i in range(5)]
+    assert len(digest.row_hashes) == 100
+
+
+def test_iter_cursor_streams_every_row(db_path):
+    conn = sqlite3.connect(db_path)
+    assert list(iter_cursor(conn.execute("SELECT a FROM t ORDER BY a"), batch_size=7)) == [(i,) for i in range(25)]
+    conn.close()
+
+
+def test_digest_query_matches_digest_rows(db_path):
+    digest, error = digest_query(db_path, "SELECT a, b FROM t", sample_size=3)
+    assert error is None
+    assert digest.columns == ["a", "b"]
+    assert digest.row_count == 25
+    rows = [(i, f"v{i % 3}") for i in range(25)]
+    assert compare(digest, digest_rows(rows)).correct
+
+
+def test_digest_query_errors(db_path):
+    assert digest_query(db_path, "SELECT missing FROM t") == (None, "no such column: missing")
+    digest, error = digest_query(
+        db_path, "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c", timeout_sec=0.1)
+    assert (digest, error) == (None, "timeout")
+
+
+def test_sample_to_json():
+    payload = json.loads(sample_to_json(digest_rows([(1, "a"), (2, b"\x00")], ["n", "s"], sample_size=1)))
+    assert payload == {"row_count": 2, "rows": [{"n": 1, "s": "a"}]}
+    assert json.loads(sample_to_json(digest_rows([(1, 2)])))["rows"] == [[1, 2]]
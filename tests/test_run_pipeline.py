@@ -0,0 +1,104 @@
+import pytest
+
+run_pipeline = pytest.importorskip("run_pipeline")   # needs the pipeline dependencies (spacy, langchain_groq, ...)
+
+
+class FakeProfiler:
+    def value_matches(self, question, schema):
+        return {}
+
+
+class FakeDBManager:
+    db_path = "unused.sqlite"
+    read_pool = None
+    schema = {"t": {"a": "INTEGER"}}
+    embeddings = {}
+    profiler = FakeProfiler()
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Runs run_pipeline with `candidates` as the output of the candidate generator and `winner` picked by the tester."""
+    state = {"executed": []}
+
+    def fake_generator(question, db_path, schema, num_candidates, on_candidate=None, **kwargs):
+        for candidate in state["candidates"]:
+            if on_candidate is not None:
+                on_candidate(*candidate)
+        return state["candidates"]
+
+    class FakeTester:
+        def __init__(self, **kwargs):
+            pass
+
+        def choose_best(self, question, candidates):
+            return state["winner"]
+
+    def fake_execute(*args, **kwargs):
+        state["executed"].append(args[1])
+        return [("executed",)], ["x"], None
+
+    monkeypatch.setattr(run_pipeline, "translate", lambda question: question)
+    monkeypatch.setattr(run_pipeline, "get_spacy_model", lambda: None)
+    monkeypatch.setattr(run_pipeline, "get_embedding_model", lambda: None)
+    monkeypatch.setattr(run_pipeline, "select_schema", lambda *args, **kwargs: FakeDBManager.schema)
+    monkeypatch.setattr(run_pipeline, "run_candidate_generator", fake_generator)
+    monkeypatch.setattr(run_pipeline, "rank_candidates", lambda db_path, candidates: candidates)
+    monkeypatch.setattr(run_pipeline, "UnitTester", FakeTester)
+    monkeypatch.setattr(run_pipeline, "execute_query_rows_columns", fake_execute)
+    return state
+
+
+def run(on_provisional=None):
+    return run_pipeline.run_pipeline("question", FakeDBManager(), on_provisional=on_provisional)
+
+
+def test_provisional_reuses_the_candidate_rows(pipeline):
+    pipeline["candidates"] = [
+        ("SELECT a FROM t WHERE a > 9", [], ["a"], None),
+        ("SELECT a FROM t", [(1,), (2,)], ["a"], None),
+        ("SELECT count(*) FROM t", [(2,)], ["count(*)"], None),
+    ]
+    pipeline["winner"] = "SELECT a FROM t"
+    provisional = []
+    result = run(lambda *args: provisional.append(args))
+
+    assert provisional == [("SELECT a FROM t", [(1,), (2,)], ["a"])]
+    assert result == ("SELECT a FROM t", [(1,), (2,)], ["a"])
+    assert pipeline["executed"] == []
+
+
+def test_better_query_replaces_the_provisional_one(pipeline):
+    pipeline["candidates"] = [
+        ("SELECT a FROM t", [(1,), (2,)], ["a"], None),
+        ("SELECT count(*) AS n FROM t", [(2,)], ["n"], None),
+    ]
+    pipeline["winner"] = "SELECT count(*) AS n FROM t"
+    provisional = []
+    result = run(lambda *args: provisional.append(args))
+
+    assert [args[0] for args in provisional] == ["SELECT a FROM t"]
+    assert result == ("SELECT count(*) AS n FROM t", [(2,)], ["n"])
+    assert pipeline["executed"] == []
+
+
+def test_failed_and_unsafe_candidates_are_not_provisional(pipeline):
+    pipeline["candidates"] = [
+        ("SELECT b FROM t", None, None, "no such column: b"),
+        ("DELETE FROM t", [(1,)], ["a"], None),
+        ("SELECT a FROM t", [(1,)], ["a"], None),
+    ]
+    pipeline["winner"] = "SELECT a FROM t"
+    provisional = []
+    run(lambda *args: provisional.append(args))
+    assert [args[0] for args in provisional] == ["SELECT a FROM t"]
+
+
+def test_unknown_winner_is_executed(pipeline):
+    pipeline["candidates"] = [
+        ("SELECT a FROM t", [(1,)], ["a"], None),
+        ("SELECT a FROM t ORDER BY a", [(1,)], ["a"], None),
+    ]
+    pipeline["winner"] = "SELECT a FROM t LIMIT 1"
+    assert run() == ("SELECT a FROM t LIMIT 1", [("executed",)], ["x"])
+    assert pipeline["executed"] == ["SELECT a FROM t LIMIT 1"]
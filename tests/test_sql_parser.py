@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from pipeline.query_generator.SQLParser import (
+    escape_apostrophes, normalize_sql, parse_sql, quote_identifier, tokenize_sql,
+)
+
+
+def kinds(sql):
+    return [(t.kind, t.value) for t in tokenize_sql(sql)]
+
+
+def test_tokenize_keeps_literals_and_identifiers_whole():
+    tokens = kinds("SELECT \"a b\", [c], 'x; DROP t' -- comment ;\nFROM t /* ; */;")
+    assert tokens == [
+        ("word", "SELECT"), ("identifier", '"a b"'), ("op", ","), ("identifier", "[c]"), ("op", ","),
+        ("string", "'x; DROP t'"), ("word", "FROM"), ("word", "t"), ("semicolon", ";"),
+    ]
+
+
+def test_tokenize_doubled_quotes():
+    assert kinds("SELECT 'it''s', \"a\"\"b\"") == [
+        ("word", "SELECT"), ("string", "'it''s'"), ("op", ","), ("identifier", '"a""b"'),
+    ]
+
+
+def test_normalize_ignores_formatting():
+    assert normalize_sql("select  a\nfrom t -- x\n;") == normalize_sql("SELECT a FROM t")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT replace(name, 'a', 'b') FROM t",
+    "SELECT call FROM t",
+    "SELECT \"delete\" FROM t",
+    "SELECT 'x; DROP TABLE t' FROM t",
+    "SELECT 'O''Brien' FROM t;",
+    "WITH r AS (SELECT 1 AS a) SELECT a FROM r",
+    "WITH r(a) AS (VALUES (1)), s AS (SELECT a FROM r) SELECT * FROM s",
+])
+def test_read_only_selects(sql):
+    parsed = parse_sql(sql)
+    assert parsed.statement_type == "SELECT"
+    assert parsed.statement_count == 1
+    assert parsed.is_read_only
+
+
+@pytest.mark.parametrize("sql, statement_type", [
+    ("SELECT a FROM t; DROP TABLE t", "SELECT"),
+    ("DROP TABLE t", "DROP"),
+    ("REPLACE INTO t VALUES (1)", "REPLACE"),
+    ("WITH r AS (SELECT 1) DELETE FROM t", "DELETE"),
+    ("SELECT load_extension('x')", "SELECT"),
+])
+def test_unsafe_statements(sql, statement_type):
+    parsed = parse_sql(sql)
+    assert parsed.statement_type == statement_type
+    assert not parsed.is_read_only
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t WHERE a='McDonald's'", "SELECT * FROM t WHERE a='McDonald''s'"),
+    ("SELECT * FROM t WHERE a='O'Brien' AND b='x'", "SELECT * FROM t WHERE a='O''Brien' AND b='x'"),
+    ("SELECT * FROM t WHERE a IN ('Bob's', 'Ann's')", "SELECT * FROM t WHERE a IN ('Bob''s', 'Ann''s')"),
+    ("SELECT * FROM t WHERE a='it''s'", "SELECT * FROM t WHERE a='it''s'"),
+    # a valid literal directly followed by a keyword is left alone
+    ("SELECT * FROM t WHERE a='x'AND b='y'", "SELECT * FROM t WHERE a='x'AND b='y'"),
+    ("SELECT \"it's\" FROM t -- don't\n", "SELECT \"it's\" FROM t -- don't\n"),
+])
+def test_escape_apostrophes(sql, expected):
+    assert escape_apostrophes(sql) == expected
+
+
+def test_escaped_queries_run():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (a, b)")
+    conn.execute("INSERT INTO t VALUES ('McDonald''s', 'y')")
+    assert conn.execute(escape_apostrophes("SELECT count(*) FROM t WHERE a='McDonald's'")).fetchone() == (1,)
+    assert conn.execute(escape_apostrophes("SELECT count(*) FROM t WHERE a='x'OR b='y'")).fetchone() == (1,)
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("name", "name"), ("order", '"order"'), ("Group", '"Group"'), ("a b", '"a b"'), ('a"b', '"a""b"'), ("1st", '"1st"'),
+])
+def test_quote_identifier(name, expected):
+    assert quote_identifier(name) == expected
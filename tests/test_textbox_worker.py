@@ -0,0 +1,84 @@
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("PyQt6.QtWidgets")
+
+from pipeline.cancellation import PipelineCancelled
+from UI.home.widgets import textbox
+
+
+class FakeRequest:
+    def __init__(self):
+        self.future = Future()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.requests = []
+
+    def submit(self, question, db_manager, on_provisional=None):
+        request = FakeRequest()
+        request.on_provisional = on_provisional
+        self.requests.append(request)
+        return request
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    executor = FakeExecutor()
+    monkeypatch.setattr(textbox, "get_pipeline_executor", lambda: executor)
+    worker = textbox.Worker(db_manager=None, query_text="how many movies")
+    emitted = []
+    for name in ("result", "provisional", "replaced", "error", "finished"):
+        getattr(worker, name).connect(lambda *args, name=name: emitted.append((name, *args)))
+    worker.start()
+    return worker, executor.requests[0], emitted
+
+
+def test_final_result_without_provisional(worker):
+    worker, request, emitted = worker
+    assert worker.running
+    request.future.set_result(("SELECT 1", [(1,)], ["1"]))
+    assert emitted == [("result", "how many movies", "SELECT 1", [(1,)], ["1"]), ("finished",)]
+    assert not worker.running
+
+
+def test_provisional_then_same_winner(worker):
+    worker, request, emitted = worker
+    request.on_provisional("SELECT a FROM t", [(1,)], ["a"])
+    request.future.set_result(("SELECT a FROM t", [(1,)], ["a"]))
+    assert emitted == [("provisional", "how many movies", "SELECT a FROM t", [(1,)], ["a"]), ("finished",)]
+
+
+def test_provisional_replaced_by_better_query(worker):
+    worker, request, emitted = worker
+    request.on_provisional("SELECT a FROM t", [(1,)], ["a"])
+    request.future.set_result(("SELECT count(*) FROM t", [(1,)], ["count(*)"]))
+    assert [e[0] for e in emitted] == ["provisional", "replaced", "finished"]
+    assert emitted[1] == ("replaced", "how many movies", "SELECT count(*) FROM t", [(1,)], ["count(*)"])
+
+
+def test_failure_keeps_provisional_result(worker):
+    worker, request, emitted = worker
+    request.on_provisional("SELECT a FROM t", [(1,)], ["a"])
+    request.future.set_exception(RuntimeError("unit tester failed"))
+    assert [e[0] for e in emitted] == ["provisional", "finished"]
+
+
+def test_failure_without_provisional_is_an_error(worker):
+    worker, request, emitted = worker
+    request.future.set_exception(RuntimeError("no candidate"))
+    assert [e[0] for e in emitted] == ["error", "finished"]
+
+
+def test_cancel(worker):
+    worker, request, emitted = worker
+    worker.cancel()
+    assert request.cancelled
+    request.future.set_exception(PipelineCancelled())
+    assert [e[0] for e in emitted] == ["finished"]
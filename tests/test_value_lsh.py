@@ -0,0 +1,77 @@
+import sqlite3
+import threading
+
+import pytest
+
+from value_lsh import ValueLSH
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE people (name TEXT, city TEXT)")
+    conn.executemany("INSERT INTO people VALUES (?, ?)", [
+        ("Alexander Hamilton", "New York"), ("Georgia O'Keeffe", "Santa Fe"),
+        ("Ada Lovelace", "London"), ("Alan Turing", "Manchester"), ("x", "London"), (None, 7),
+    ])
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def lsh(tmp_path):
+    lsh = ValueLSH(str(tmp_path))
+    yield lsh
+    lsh.close()
+
+
+def test_index_and_match(db, lsh):
+    assert lsh.index_column(db, "people", "name", "h1") == 4     # text values of 2 to 64 characters
+    assert lsh.is_indexed("people", "name", "h1")
+    assert not lsh.is_indexed("people", "name", "h2")
+
+    matches = lsh.match(["alexander hamilton", "lovelace ada"])
+    assert matches[("people", "name")][0] == "Alexander Hamilton"
+    assert lsh.match(["zzzz qqqq"]) == {}
+    assert lsh.match(["abc"]) == {}                                 # too short to match
+    assert lsh.match(["alexander hamilton"], schema={"people": {"city": "TEXT"}}) == {}
+
+
+def test_reindex_and_drop(db, lsh):
+    lsh.index_column(db, "people", "name", "h1")
+    lsh.index_column(db, "people", "city", "h1")
+    lsh.index_column(db, "people", "name", "h1")
+    conn = lsh._conn()
+    assert conn.execute("SELECT count(*) FROM lsh_values WHERE column_name = 'name'").fetchone()[0] == 4
+
+    lsh.drop_column("people", "name")
+    assert not lsh.is_indexed("people", "name", "h1")
+    assert conn.execute("SELECT count(*) FROM lsh_values WHERE column_name = 'name'").fetchone()[0] == 0
+    assert conn.execute("SELECT count(*) FROM lsh_buckets WHERE value_id NOT IN (SELECT id FROM lsh_values)").fetchone()[0] == 0
+    assert ("people", "city") in lsh.match(["manchester"])
+
+
+def test_drop_uses_indexes(lsh):
+    conn = lsh._conn()
+    plans = [" ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, ("t", "c")))
+             for sql in ("DELETE FROM lsh_buckets WHERE value_id IN (SELECT id FROM lsh_values WHERE table_name = ? AND column_name = ?)",
+                         "DELETE FROM lsh_values WHERE table_name = ? AND column_name = ?")]
+    assert "lsh_buckets_value" in plans[0] and "lsh_values_column" in plans[0]
+    assert "lsh_values_column" in plans[1]
+
+
+def test_close_closes_every_thread_connection(tmp_path):
+    lsh = ValueLSH(str(tmp_path))
+    opened = []
+    thread = threading.Thread(target=lambda: opened.append(lsh._conn()))
+    thread.start()
+    thread.join()
+    main = lsh._conn()
+
+    lsh.close()
+    for conn in (main, opened[0]):
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # a later use opens a new connection
+    assert lsh._conn().execute("SELECT count(*) FROM lsh_columns").fetchone() == (0,)
+    lsh.close()